@@ -475,14 +475,18 @@ class RainbowDQN:
         :type swap_channels: bool, optional
         :param max_steps: Maximum number of testing steps, defaults to 500
         :type max_steps: int, optional
-        :param loop: Number of testing loops/episodes to complete. The returned score is the mean over these tests. Defaults to 3
+        :param loop: Number of testing loops/episodes to complete. With vectorized environments, episodes are played in all sub-environments at once. The returned score is the mean over these tests. Defaults to 3
         :type loop: int, optional
         """
         with torch.no_grad():
             rewards = []
-            for i in range(loop):
+            num_envs = env.num_envs if hasattr(env, "num_envs") else 1
+            while len(rewards) < loop:
+                # Score one episode in each sub-environment needed
+                num_episodes = min(num_envs, loop - len(rewards))
                 state = env.reset()[0]
-                score = 0
+                scores = np.zeros(num_envs)
+                completed = np.zeros(num_envs, dtype=bool)
                 for idx_step in range(max_steps):
                     if swap_channels:
                         # Handle unvectorised image environment
@@ -491,10 +495,11 @@ class RainbowDQN:
                         state = np.moveaxis(state, [-1], [-3])
                     action = self.getAction(state)
                     state, reward, done, trunc, _ = env.step(action)
-                    score += reward[0]
-                    if done[0] or trunc[0]:
+                    scores += np.where(completed, 0, reward)
+                    completed |= np.logical_or(done, trunc)
+                    if np.all(completed[:num_episodes]):
                         break
-                rewards.append(score)
+                rewards.extend(scores[:num_episodes])
         mean_fit = np.mean(rewards)
         self.fitness.append(mean_fit)
         return mean_fit
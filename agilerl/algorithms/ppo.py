@@ -527,14 +527,18 @@ class PPO:
         :type swap_channels: bool, optional
         :param max_steps: Maximum number of testing steps, defaults to 500
         :type max_steps: int, optional
-        :param loop: Number of testing loops/episodes to complete. The returned score is the mean. Defaults to 3
+        :param loop: Number of testing loops/episodes to complete. With vectorized environments, episodes are played in all sub-environments at once. The returned score is the mean. Defaults to 3
         :type loop: int, optional
         """
         with torch.no_grad():
             rewards = []
-            for i in range(loop):
+            num_envs = env.num_envs if hasattr(env, "num_envs") else 1
+            while len(rewards) < loop:
+                # Score one episode in each sub-environment needed
+                num_episodes = min(num_envs, loop - len(rewards))
                 state = env.reset()[0]
-                score = 0
+                scores = np.zeros(num_envs)
+                completed = np.zeros(num_envs, dtype=bool)
                 for idx_step in range(max_steps):
                     if swap_channels:
                         if not hasattr(env, "num_envs"):
@@ -543,15 +547,12 @@ class PPO:
                     action, _, _, _ = self.getAction(state)
                     if not hasattr(env, "num_envs"):
                         action = action[0]
-                    state, reward, done, trunc, info = env.step(action)
-                    if hasattr(env, "num_envs"):
-                        done = done[0]
-                        trunc = trunc[0]
-                        reward = reward[0]
-                    score += reward
-                    if done or trunc:
+                    state, reward, done, trunc, _ = env.step(action)
+                    scores += np.where(completed, 0, reward)
+                    completed |= np.logical_or(done, trunc)
+                    if np.all(completed[:num_episodes]):
                         break
-                rewards.append(score)
+                rewards.extend(scores[:num_episodes])
         mean_fit = np.mean(rewards)
         self.fitness.append(mean_fit)
         return mean_fit
@@ -4,6 +4,12 @@ from collections import deque, namedtuple
 import numpy as np
 import torch
 
+from agilerl.components.storage import (
+    MultiAgentArrayStorage,
+    load_arrays,
+    save_arrays,
+)
+
 
 class MultiAgentReplayBuffer:
     """The Multi-Agent Experience Replay Buffer class. Used to store multiple agents'
@@ -17,16 +23,30 @@ class MultiAgentReplayBuffer:
     :type agent_ids: list[str]
     :param device: Device for accelerated computing, 'cpu' or 'cuda', defaults to None
     :type device: str, optional
+    :param storage: Storage backend, 'deque' to keep experiences as named tuples of dictionaries,
+        or 'array' to keep each field of each agent in a preallocated NumPy ring buffer,
+        defaults to 'deque'
+    :type storage: str, optional
 
     """
 
-    def __init__(self, memory_size, field_names, agent_ids, device=None):
+    def __init__(
+        self, memory_size, field_names, agent_ids, device=None, storage="deque"
+    ):
         assert memory_size > 0, "Mmeory size must be greater than zero."
         assert len(field_names) > 0, "Field names must contain at least one field name."
         assert len(agent_ids) > 0, "Agent ids must contain at least one agent id."
+        assert storage in [
+            "deque",
+            "array",
+        ], "Storage must be one of 'deque' or 'array'."
 
-        self.memory = memory_size
-        self.memory = deque(maxlen=memory_size)
+        self.memory_size = memory_size
+        self.storage = storage
+        if storage == "array":
+            self.memory = MultiAgentArrayStorage(memory_size, field_names, agent_ids)
+        else:
+            self.memory = deque(maxlen=memory_size)
         self.field_names = field_names
         self.experience = namedtuple("Experience", field_names=self.field_names)
         self.counter = 0
@@ -38,8 +58,35 @@ class MultiAgentReplayBuffer:
 
     def _add(self, *args):
         """Adds experience to memory."""
-        e = self.experience(*args)
-        self.memory.append(e)
+        if self.storage != "deque":
+            self.memory.append(*args)
+        else:
+            e = self.experience(*args)
+            self.memory.append(e)
+
+    def _process_field(self, field, ts, np_array=False):
+        """Returns stacked field array of one agent, cast and converted to torch tensor if
+        required."""
+        if field in [
+            "done",
+            "termination",
+            "terminated",
+            "truncation",
+            "truncated",
+        ]:
+            ts = ts.astype(np.uint8)
+
+        if not np_array:
+            # Handle torch tensor creation
+            ts = torch.from_numpy(ts)
+
+            # Place on device before casting, so fields cross to the device in their stored dtype
+            if self.device is not None:
+                ts = ts.to(self.device)
+
+            ts = ts.float()
+
+        return ts
 
     def _process_transition(self, experiences, np_array=False):
         """Returns transition dictionary from experiences."""
@@ -56,35 +103,36 @@ class MultiAgentReplayBuffer:
                 # Handle numpy stacking
                 ts = np.vstack(ts)
 
-                if field in [
-                    "done",
-                    "termination",
-                    "terminated",
-                    "truncation",
-                    "truncated",
-                ]:
-                    ts = ts.astype(np.uint8)
-
-                if not np_array:
-                    # Handle torch tensor creation
-                    ts = torch.from_numpy(ts).float()
-
-                    # Place on device
-                    if self.device is not None:
-                        ts = ts.to(self.device)
-
-                field_dict[agent_id] = ts
+                field_dict[agent_id] = self._process_field(field, ts, np_array)
             transition[field] = field_dict
         return transition
 
+    def _process_indices(self, idxs, np_array=False):
+        """Returns transition dictionary from experiences stored at indices."""
+        if self.storage != "deque":
+            batch = self.memory.gather(idxs)
+            return {
+                field: {
+                    agent_id: self._process_field(field, ts, np_array)
+                    for agent_id, ts in batch[field].items()
+                }
+                for field in self.field_names
+            }
+        experiences = [self.memory[i] for i in idxs]
+        return self._process_transition(experiences, np_array)
+
     def sample(self, batch_size):
         """Returns sample of experiences from memory.
 
         :param batch_size: Number of samples to return
         :type batch_size: int
         """
-        experiences = random.sample(self.memory, k=batch_size)
-        transition = self._process_transition(experiences)
+        if self.storage != "deque":
+            idxs = random.sample(range(len(self)), k=batch_size)
+            transition = self._process_indices(idxs)
+        else:
+            experiences = random.sample(self.memory, k=batch_size)
+            transition = self._process_transition(experiences)
         return tuple(transition.values())
 
     def save2memorySingleEnv(self, *args):
@@ -120,6 +168,10 @@ class MultiAgentReplayBuffer:
         :param *args: Variable length argument list. Contains batched transition elements in consistent order,
             e.g. states, actions, rewards, next_states, dones
         """
+        if self.storage != "deque":
+            self.memory.extend(*args)
+            self.counter += len(next(iter(args[0].values())))
+            return
         args = self._reorganize_dicts(*args)
         for transition in zip(*args):
             self._add(*transition)
@@ -138,3 +190,76 @@ class MultiAgentReplayBuffer:
             self.save2memoryVectEnvs(*args)
         else:
             self.save2memorySingleEnv(*args)
+
+    def save(self, path):
+        """Saves replay buffer contents and counters to a directory of raw .npy files, with
+        one array per field and agent, which can be restored with load.
+
+        :param path: Directory to save replay buffer in
+        :type path: str
+        """
+        if self.storage != "deque":
+            arrays, storage_attrs = self.memory.get_state()
+        else:
+            arrays, storage_attrs = {}, {}
+            if len(self.memory) > 0:
+                for field in self.field_names:
+                    for agent_id in self.agent_ids:
+                        arrays[f"memory.{field}.{agent_id}"] = np.stack(
+                            [
+                                np.asarray(getattr(e, field)[agent_id])
+                                for e in self.memory
+                            ]
+                        )
+        meta = {
+            "class": type(self).__name__,
+            "memory_size": self.memory_size,
+            "field_names": list(self.field_names),
+            "agent_ids": list(self.agent_ids),
+            "storage": self.storage,
+            "counter": int(self.counter),
+            "storage_attrs": storage_attrs,
+        }
+        save_arrays(path, arrays, meta)
+
+    def load(self, path, mmap=True):
+        """Loads replay buffer contents and counters saved with save. The buffer must have
+        been created with the same memory size, field names, agent ids and storage.
+
+        :param path: Directory replay buffer was saved in
+        :type path: str
+        :param mmap: Memory-map saved arrays copy-on-write instead of reading them into
+            memory, defaults to True
+        :type mmap: bool, optional
+        """
+        arrays, meta = load_arrays(path, mmap)
+        assert (
+            meta["memory_size"] == self.memory_size
+        ), f"Saved buffer has memory size {meta['memory_size']}, expected {self.memory_size}."
+        assert meta["field_names"] == list(
+            self.field_names
+        ), f"Saved buffer has field names {meta['field_names']}, expected {self.field_names}."
+        assert meta["agent_ids"] == list(
+            self.agent_ids
+        ), f"Saved buffer has agent ids {meta['agent_ids']}, expected {self.agent_ids}."
+        assert (
+            meta["storage"] == self.storage
+        ), f"Saved buffer uses '{meta['storage']}' storage, expected '{self.storage}'."
+
+        if self.storage != "deque":
+            self.memory.set_state(arrays, meta["storage_attrs"])
+        else:
+            self.memory.clear()
+            if f"memory.{self.field_names[0]}.{self.agent_ids[0]}" in arrays:
+                n = len(arrays[f"memory.{self.field_names[0]}.{self.agent_ids[0]}"])
+                for i in range(n):
+                    self._add(
+                        *(
+                            {
+                                agent_id: arrays[f"memory.{field}.{agent_id}"][i]
+                                for agent_id in self.agent_ids
+                            }
+                            for field in self.field_names
+                        )
+                    )
+        self.counter = meta["counter"]
@@ -3,8 +3,49 @@ from collections import deque, namedtuple
 
 import numpy as np
 import torch
+from accelerate.utils import broadcast, gather
 
 from agilerl.components.segment_tree import MinSegmentTree, SumSegmentTree
+from agilerl.components.storage import (
+    ArrayStorage,
+    DedupStorage,
+    HDF5Storage,
+    MemmapStorage,
+    SharedArrayStorage,
+    load_arrays,
+    save_arrays,
+)
+
+
+# Fields marking the end of an episode, through termination or truncation
+_EPISODE_END_FIELDS = [
+    "done",
+    "termination",
+    "terminated",
+    "truncation",
+    "truncated",
+]
+
+
+def _stack_experiences(experiences, field_names, prefix):
+    """Returns dictionary of arrays stacking each field of experiences, keyed by
+    '<prefix>.<field>'."""
+    if len(experiences) == 0:
+        return {}
+    return {
+        f"{prefix}.{field}": np.stack(
+            [np.asarray(getattr(e, field)) for e in experiences]
+        )
+        for field in field_names
+    }
+
+
+def _unstack_experiences(arrays, field_names, prefix, experience):
+    """Returns list of experiences from arrays created by _stack_experiences."""
+    if f"{prefix}.{field_names[0]}" not in arrays:
+        return []
+    fields = [arrays[f"{prefix}.{field}"] for field in field_names]
+    return [experience(*values) for values in zip(*fields)]
 
 
 class ReplayBuffer:
@@ -19,29 +60,284 @@ class ReplayBuffer:
     :type field_names: list[str]
     :param device: Device for accelerated computing, 'cpu' or 'cuda', defaults to None
     :type device: str, optional
+    :param storage: Storage backend, 'deque' to keep experiences as named tuples, 'array' to keep
+        each field in a preallocated NumPy ring buffer, 'memmap' to keep each field in a
+        memory-mapped file in storage_dir, 'dedup' to keep arrays with each observation stored
+        once per environment and next states reconstructed at sample time, or 'shared' to keep
+        arrays in shared memory that forked processes can write to, defaults to 'deque'
+    :type storage: str, optional
+    :param storage_dir: Directory for memory-mapped storage, an existing buffer in this directory is
+        reopened, defaults to None
+    :type storage_dir: str, optional
+    :param frame_stack: Number of stacked frames along the first axis of observations, used by 'dedup'
+        storage to store each frame only once, defaults to None
+    :type frame_stack: int, optional
+    :param dataset: HDF5 dataset, or path to an HDF5 file, sampled from by 'hdf5' storage. If None,
+        train_offline() opens its own dataset, defaults to None
+    :type dataset: h5py.File or str, optional
+    :param swap_channels: Swap image channels dimension of observations read by 'hdf5' storage
+        from last to first [H, W, C] -> [C, H, W], defaults to False
+    :type swap_channels: bool, optional
     """
 
-    def __init__(self, action_dim, memory_size, field_names, device=None):
+    def __init__(
+        self,
+        action_dim,
+        memory_size,
+        field_names,
+        device=None,
+        storage="deque",
+        storage_dir=None,
+        frame_stack=None,
+        dataset=None,
+        swap_channels=False,
+    ):
         assert action_dim > 0, "Action dimension must be greater than zero."
         assert memory_size > 0, "Mmeory size must be greater than zero."
         assert len(field_names) > 0, "Field names must contain at least one field name."
+        assert storage in [
+            "deque",
+            "array",
+            "memmap",
+            "dedup",
+            "shared",
+            "hdf5",
+        ], "Storage must be one of 'deque', 'array', 'memmap', 'dedup', 'shared' or 'hdf5'."
+        assert (
+            storage != "memmap" or storage_dir is not None
+        ), "Memory-mapped storage requires a storage directory."
 
         self.action_dim = action_dim
         self.memory_size = memory_size
-        self.memory = deque(maxlen=memory_size)
         self.field_names = field_names
+        self.storage = storage
+        self.storage_dir = storage_dir
+        if storage == "array":
+            self.memory = ArrayStorage(memory_size, field_names)
+        elif storage == "memmap":
+            self.memory = MemmapStorage(memory_size, field_names, storage_dir)
+        elif storage == "dedup":
+            self.memory = DedupStorage(memory_size, field_names, frame_stack)
+        elif storage == "shared":
+            self.memory = SharedArrayStorage(memory_size, field_names)
+        elif storage == "hdf5":
+            self.memory = HDF5Storage(memory_size, field_names, dataset, swap_channels)
+        else:
+            self.memory = deque(maxlen=memory_size)
         self.experience = namedtuple("Experience", field_names=self.field_names)
         self.counter = 0  # update cycle counter
         self.device = device
+        # Environment stream, episode and position of each stored transition, recorded at
+        # write time for segment sampling
+        self.segments = None
+        self._end_fields = [
+            i for i, field in enumerate(field_names) if field in _EPISODE_END_FIELDS
+        ]
 
     def __len__(self):
         return len(self.memory)
 
     def _add(self, *args):
         """Adds experience to memory."""
+        if self.storage != "deque":
+            idx = self.memory.append(*args)
+            end = any(np.asarray(args[i]).any() for i in self._end_fields)
+            self._index_transition(idx, end)
+            return idx
         e = self.experience(*args)
         self.memory.append(e)
 
+    def _add_batch(self, *args, stream=False):
+        """Adds batch of experiences to memory. Rows are transitions of separate
+        environments, or consecutive transitions of a single environment if stream is True.
+        """
+        if self.storage != "deque":
+            idxs = self.memory.extend(*args)
+            ends = self._episode_ends(args, len(args[0]))
+            if stream:
+                self._index_stream(idxs, ends)
+            else:
+                self._index_envs(idxs, ends)
+            return idxs
+        for transition in zip(*args):
+            self._add(*transition)
+
+    def _episode_ends(self, args, n):
+        """Returns whether each of n transitions ends its episode, through termination or
+        truncation."""
+        ends = [
+            np.asarray(args[i]).reshape(n, -1).any(axis=1) for i in self._end_fields
+        ]
+        if not ends:
+            return np.zeros(n, dtype=bool)
+        return np.logical_or.reduce(ends) if len(ends) > 1 else ends[0]
+
+    def _segment_index(self, num_envs):
+        """Returns segment index, allocated on first use, tracking the current episode and
+        position of at least num_envs environments."""
+        if self.segments is None:
+            self.segments = {
+                "env_ids": np.zeros(self.memory_size, dtype=np.int32),
+                "episode_ids": np.full(self.memory_size, -1, dtype=np.int64),
+                "positions": np.zeros(self.memory_size, dtype=np.int32),
+                "strides": np.ones(self.memory_size, dtype=np.int32),
+                # Current episode and position of each environment
+                "env_episodes": np.zeros(0, dtype=np.int64),
+                "env_positions": np.zeros(0, dtype=np.int64),
+            }
+            self.next_episode = 0
+        new = num_envs - len(self.segments["env_episodes"])
+        if new > 0:
+            self.segments["env_episodes"] = np.append(
+                self.segments["env_episodes"], self.next_episode + np.arange(new)
+            )
+            self.segments["env_positions"] = np.append(
+                self.segments["env_positions"], np.zeros(new, dtype=np.int64)
+            )
+            self.next_episode += new
+        return self.segments
+
+    def _index_transition(self, idx, end):
+        """Records a single transition of environment 0 written to slot idx in the segment
+        index."""
+        segments = self._segment_index(1)
+        segments["env_ids"][idx] = 0
+        segments["episode_ids"][idx] = segments["env_episodes"][0]
+        segments["positions"][idx] = segments["env_positions"][0]
+        segments["strides"][idx] = 1
+        if end:
+            segments["env_episodes"][0] = self.next_episode
+            segments["env_positions"][0] = 0
+            self.next_episode += 1
+        else:
+            segments["env_positions"][0] += 1
+
+    def _index_envs(self, idxs, ends):
+        """Records one transition per environment written to slots idxs in the segment
+        index. Consecutive transitions of an environment are then len(ends) slots apart.
+        """
+        n, kept = len(ends), len(idxs)
+        segments = self._segment_index(n)
+        episodes = segments["env_episodes"][:n]
+        positions = segments["env_positions"][:n]
+        # Storage only keeps the most recent transitions of a batch larger than memory
+        segments["env_ids"][idxs] = np.arange(n - kept, n)
+        segments["episode_ids"][idxs] = episodes[n - kept :]
+        segments["positions"][idxs] = positions[n - kept :]
+        segments["strides"][idxs] = n
+
+        # Environments continue their episode, or start a new one after an episode end
+        positions += 1
+        if ends.any():
+            num_ends = int(ends.sum())
+            episodes[ends] = self.next_episode + np.arange(num_ends)
+            positions[ends] = 0
+            self.next_episode += num_ends
+
+    def _index_stream(self, idxs, ends):
+        """Records consecutive transitions of environment 0 written to slots idxs in the
+        segment index."""
+        n, kept = len(ends), len(idxs)
+        segments = self._segment_index(1)
+        steps = np.arange(n)
+        # Rows after an episode end start a new episode
+        starts = np.concatenate([[False], ends[:-1]])
+        resets = np.cumsum(starts)
+        episodes = np.where(
+            resets == 0, segments["env_episodes"][0], self.next_episode + resets - 1
+        )
+        last_start = np.maximum.accumulate(np.where(starts, steps, 0))
+        positions = np.where(
+            resets == 0, segments["env_positions"][0] + steps, steps - last_start
+        )
+        self.next_episode += int(resets[-1])
+
+        segments["env_ids"][idxs] = 0
+        segments["episode_ids"][idxs] = episodes[n - kept :]
+        segments["positions"][idxs] = positions[n - kept :]
+        segments["strides"][idxs] = 1
+
+        if ends[-1]:
+            segments["env_episodes"][0] = self.next_episode
+            segments["env_positions"][0] = 0
+            self.next_episode += 1
+        else:
+            segments["env_episodes"][0] = episodes[-1]
+            segments["env_positions"][0] = positions[-1] + 1
+
+    def sample_segments(self, batch_size, length):
+        """Returns sample of segments of consecutive transitions from the same environment
+        and episode. Each segment starts at a uniformly sampled transition and holds up to
+        length transitions, ending early at the end of its episode or of stored transitions,
+        with the remaining steps zero-padded. Slots of each segment are found from the
+        segment index recorded at write time, and gathered in a single pass.
+
+        Returns each field with shape (batch_size, length, ...), followed by a boolean mask
+        of shape (batch_size, length) marking valid steps.
+
+        :param batch_size: Number of segments to return
+        :type batch_size: int
+        :param length: Maximum number of transitions in each segment
+        :type length: int
+        """
+        assert self.storage in [
+            "array",
+            "memmap",
+            "dedup",
+        ], "Segment sampling requires 'array', 'memmap' or 'dedup' storage."
+        assert length > 0, "Segment length must be greater than zero."
+        assert self.segments is not None, "No transitions have been indexed."
+
+        starts = np.random.randint(len(self), size=batch_size)
+        steps = np.arange(length)
+        # Consecutive transitions of an environment are a fixed stride apart in storage
+        idxs = (
+            starts[:, None] + self.segments["strides"][starts, None] * steps
+        ) % self.memory_size
+        episode_ids = self.segments["episode_ids"]
+        positions = self.segments["positions"]
+        mask = (episode_ids[idxs] == episode_ids[starts, None]) & (
+            positions[idxs] == positions[starts, None] + steps
+        )
+        mask = np.logical_and.accumulate(mask, axis=1)
+
+        # Padded steps read the first transition of their segment and are zeroed
+        idxs = np.where(mask, idxs, starts[:, None])
+        batch = self.memory.gather(idxs.reshape(-1))
+        transition = {}
+        for field in self.field_names:
+            ts = batch[field].reshape(batch_size, length, *batch[field].shape[1:])
+            ts[~mask] = 0
+            transition[field] = self._process_field(field, ts)
+
+        mask = torch.from_numpy(mask)
+        if self.device is not None:
+            mask = mask.to(self.device)
+        return (*transition.values(), mask)
+
+    def _process_field(self, field, ts, np_array=False):
+        """Returns stacked field array, cast and converted to torch tensor if required."""
+        if field in [
+            "done",
+            "termination",
+            "terminated",
+            "truncation",
+            "truncated",
+        ]:
+            ts = ts.astype(np.uint8)
+
+        if not np_array:
+            # Handle torch tensor creation
+            ts = torch.from_numpy(ts)
+
+            # Place on device before casting, so fields cross to the device in their stored dtype
+            if self.device is not None:
+                ts = ts.to(self.device)
+
+            ts = ts.float()
+
+        return ts
+
     def _process_transition(self, experiences, np_array=False):
         """Returns transition dictionary from experiences."""
         transition = {}
@@ -51,39 +347,85 @@ class ReplayBuffer:
                 for e in experiences
                 if e is not None
             ]
-            ts = np.vstack(ts)
-
             # Handle numpy stacking
-            if field in [
-                "done",
-                "termination",
-                "terminated",
-                "truncation",
-                "truncated",
-            ]:
-                ts = ts.astype(np.uint8)
-
-            if not np_array:
-                # Handle torch tensor creation
-                ts = torch.from_numpy(ts).float()
-
-                # Place on device
-                if self.device is not None:
-                    ts = ts.to(self.device)
-
-            transition[field] = ts
+            ts = np.vstack(ts)
+            transition[field] = self._process_field(field, ts, np_array)
         return transition
 
+    def _process_indices(self, idxs, np_array=False):
+        """Returns transition dictionary from experiences stored at indices."""
+        if self.storage != "deque":
+            batch = self.memory.gather(idxs)
+            return {
+                field: self._process_field(field, batch[field], np_array)
+                for field in self.field_names
+            }
+        experiences = [self.memory[i] for i in idxs]
+        return self._process_transition(experiences, np_array)
+
     def sample(self, batch_size):
         """Returns sample of experiences from memory.
 
         :param batch_size: Number of samples to return
         :type batch_size: int
         """
-        experiences = random.sample(self.memory, k=batch_size)
-        transition = self._process_transition(experiences)
+        if self.storage != "deque":
+            idxs = random.sample(range(len(self)), k=batch_size)
+            transition = self._process_indices(idxs)
+        else:
+            experiences = random.sample(self.memory, k=batch_size)
+            transition = self._process_transition(experiences)
         return tuple(transition.values())
 
+    def sample_population(self, batch_sizes):
+        """Returns one sample of experiences per population member, with the experiences of
+        all members gathered and processed in a single pass. Each member's fields are views
+        into the tensors of the combined sample.
+
+        :param batch_sizes: Number of samples to return for each member
+        :type batch_sizes: list[int]
+        """
+        idxs = self._sample_population_indices(batch_sizes)
+        transition = self._process_indices(idxs)
+        return self._split_population(transition, batch_sizes)
+
+    def _sample_population_indices(self, batch_sizes):
+        """Returns concatenated indices sampled without replacement for each member, drawn
+        for all members at once."""
+        n = len(self)
+        if max(batch_sizes) > n:
+            raise ValueError("Sample larger than population or is negative")
+        sizes = np.asarray(batch_sizes)
+        members = np.repeat(np.arange(len(sizes)), sizes)
+        idxs = np.random.randint(n, size=len(members))
+
+        # Members sampling most of memory take a prefix of a permutation instead of redrawing
+        dense = np.flatnonzero(2 * sizes > n)
+        for member in dense:
+            idxs[members == member] = np.random.permutation(n)[: sizes[member]]
+
+        # Redraw duplicates within each member until all indices are unique
+        while True:
+            keys = members * n + idxs
+            _, first = np.unique(keys, return_index=True)
+            if len(first) == len(keys):
+                return idxs
+            duplicate = np.ones(len(keys), dtype=bool)
+            duplicate[first] = False
+            idxs[duplicate] = np.random.randint(n, size=duplicate.sum())
+
+    @staticmethod
+    def _split_population(transition, batch_sizes):
+        """Splits a combined transition dictionary into one tuple of fields per member."""
+        sections = np.cumsum(batch_sizes)[:-1]
+        fields = [
+            torch.split(ts, list(batch_sizes))
+            if isinstance(ts, torch.Tensor)
+            else np.split(ts, sections)
+            for ts in transition.values()
+        ]
+        return [tuple(member_fields) for member_fields in zip(*fields)]
+
     def save2memorySingleEnv(self, *args):
         """Saves experience to memory.
 
@@ -99,6 +441,11 @@ class ReplayBuffer:
         :param *args: Variable length argument list. Contains batched transition elements in consistent order,
             e.g. states, actions, rewards, next_states, dones
         """
+        if self.storage != "deque":
+            self._add_batch(*args)
+            self.counter += len(args[0])
+            return
+
         for transition in zip(*args):
             self._add(*transition)
             self.counter += 1
@@ -117,6 +464,110 @@ class ReplayBuffer:
         else:
             self.save2memorySingleEnv(*args)
 
+    def add_batch(self, **arrays):
+        """Adds a batch of complete transitions to memory, such as a chunk of an offline
+        dataset. With array-based storage, each field is copied with a single slice
+        assignment. Transitions are stored as given, without n-step accumulation, and with
+        'dedup' storage they are treated as consecutive steps of a single environment.
+
+        :param **arrays: Batched transition elements keyed by field name, e.g. state=states,
+            action=actions, reward=rewards, next_state=next_states, done=dones
+        """
+        assert set(arrays) == set(
+            self.field_names
+        ), f"Batch fields {sorted(arrays)} do not match field names {self.field_names}."
+        args = [arrays[field] for field in self.field_names]
+        n = len(args[0])
+        assert all(
+            len(arg) == n for arg in args
+        ), "All fields must contain the same number of transitions."
+        if self.storage == "dedup":
+            # Deduplicated storage treats rows of an extend call as separate environment
+            # streams, so rows are added one at a time as consecutive steps of stream 0,
+            # each state shared with the next state of the previous row
+            for transition in zip(*args):
+                self._add(*transition)
+        else:
+            self._add_batch(*args, stream=True)
+        self.counter += n
+
+    def save(self, path):
+        """Saves replay buffer contents, counters and sampling state to a directory of raw
+        .npy files, which can be restored with load.
+
+        :param path: Directory to save replay buffer in
+        :type path: str
+        """
+        arrays, attrs = self._get_state()
+        meta = {
+            "class": type(self).__name__,
+            "memory_size": self.memory_size,
+            "field_names": list(self.field_names),
+            "storage": self.storage,
+            **attrs,
+        }
+        save_arrays(path, arrays, meta)
+
+    def load(self, path, mmap=True):
+        """Loads replay buffer contents, counters and sampling state saved with save. The
+        buffer must have been created with the same memory size, field names and storage.
+
+        :param path: Directory replay buffer was saved in
+        :type path: str
+        :param mmap: Memory-map saved arrays copy-on-write instead of reading them into
+            memory, defaults to True
+        :type mmap: bool, optional
+        """
+        arrays, meta = load_arrays(path, mmap)
+        assert (
+            meta["class"] == type(self).__name__
+        ), f"Saved buffer is a {meta['class']}, expected {type(self).__name__}."
+        assert (
+            meta["memory_size"] == self.memory_size
+        ), f"Saved buffer has memory size {meta['memory_size']}, expected {self.memory_size}."
+        assert meta["field_names"] == list(
+            self.field_names
+        ), f"Saved buffer has field names {meta['field_names']}, expected {self.field_names}."
+        assert (
+            meta["storage"] == self.storage
+        ), f"Saved buffer uses '{meta['storage']}' storage, expected '{self.storage}'."
+        self._set_state(arrays, meta)
+
+    def _get_state(self):
+        """Returns arrays and JSON-serialisable attributes holding the buffer state."""
+        attrs = {"counter": int(self.counter)}
+        if self.storage != "deque":
+            arrays, attrs["storage_attrs"] = self.memory.get_state()
+        else:
+            arrays = _stack_experiences(self.memory, self.field_names, "memory")
+            attrs["storage_attrs"] = {}
+        if self.segments is not None:
+            for name, array in self.segments.items():
+                arrays[f"segments.{name}"] = array
+            attrs["next_episode"] = int(self.next_episode)
+        return arrays, attrs
+
+    def _set_state(self, arrays, attrs):
+        """Restores buffer state from arrays and attributes returned by _get_state."""
+        if self.storage != "deque":
+            self.memory.set_state(arrays, attrs["storage_attrs"])
+        else:
+            self.memory.clear()
+            self.memory.extend(
+                _unstack_experiences(
+                    arrays, self.field_names, "memory", self.experience
+                )
+            )
+        self.counter = attrs["counter"]
+        self.segments = None
+        if "next_episode" in attrs:
+            self.segments = {
+                name.split(".", 1)[1]: np.array(array)
+                for name, array in arrays.items()
+                if name.startswith("segments.")
+            }
+            self.next_episode = attrs["next_episode"]
+
 
 class MultiStepReplayBuffer(ReplayBuffer):
     """The Multi-step Experience Replay Buffer class. Used to store experiences and allow
@@ -136,6 +587,13 @@ class MultiStepReplayBuffer(ReplayBuffer):
     :type gamma: float, optional
     :param device: Device for accelerated computing, 'cpu' or 'cuda', defaults to None
     :type device: str, optional
+    :param storage: Storage backend, 'deque', 'array', 'memmap' or 'dedup', defaults to 'deque'.
+        'dedup' storage requires n_step=1
+    :type storage: str, optional
+    :param storage_dir: Directory for memory-mapped storage, defaults to None
+    :type storage_dir: str, optional
+    :param frame_stack: Number of stacked frames in observations for 'dedup' storage, defaults to None
+    :type frame_stack: int, optional
     """
 
     def __init__(
@@ -147,8 +605,19 @@ class MultiStepReplayBuffer(ReplayBuffer):
         n_step=3,
         gamma=0.99,
         device=None,
+        storage="deque",
+        storage_dir=None,
+        frame_stack=None,
     ):
-        super().__init__(action_dim, memory_size, field_names, device)
+        super().__init__(
+            action_dim,
+            memory_size,
+            field_names,
+            device,
+            storage,
+            storage_dir,
+            frame_stack,
+        )
         assert (
             "reward" in field_names
         ), "Reward must be saved in replay buffer under the field name 'reward'."
@@ -160,11 +629,22 @@ class MultiStepReplayBuffer(ReplayBuffer):
             or "termination" in field_names
             or "terminated" in field_names
         ), "Done/termination must be saved in replay buffer under the field name 'done', 'termination', or 'terminated'."
+        # The next state of an n-step transition is n steps ahead, so it is never the state
+        # of the following transition that deduplicated storage reconstructs it from
+        assert (
+            storage != "dedup" or n_step == 1
+        ), "Deduplicated storage requires n_step=1, n-step transitions cannot share states."
         self.num_envs = num_envs
         self.n_step_buffers = [deque(maxlen=n_step) for i in range(num_envs)]
         self.n_step = n_step
         self.gamma = gamma
 
+        # Vectorised transitions are kept in an (n_step, num_envs, ...) window per
+        # field, so that n-step returns of all environments are computed at once
+        self.n_step_window = None
+        self.n_step_ptr = 0
+        self.n_step_count = 0
+
     def save2memorySingleEnv(self, *args):
         """Saves experience to memory.
 
@@ -191,21 +671,7 @@ class MultiStepReplayBuffer(ReplayBuffer):
         :param *args: Variable length argument list. Contains transition elements in consistent order,
             e.g. state, action, reward, next_state, done
         """
-        for buffer, *transition in zip(self.n_step_buffers, *args):
-            transition = self.experience(*transition)
-            buffer.append(transition)
-
-        # single step transition is not ready
-        if len(self.n_step_buffers[0]) < self.n_step:
-            return ()
-        else:
-            for buffer in self.n_step_buffers:
-                # make a n-step transition
-                single_step_args = self._get_n_step_info(buffer, self.gamma)
-                self._add(*single_step_args)
-                self.counter += 1
-
-            return args
+        return self._save2n_step_window(*args)
 
     def sample_from_indices(self, idxs):
         """Returns sample of experiences from memory using provided indices.
@@ -213,8 +679,91 @@ class MultiStepReplayBuffer(ReplayBuffer):
         :param idxs: Indices to sample
         :type idxs: list[int]
         """
-        experiences = [self.memory[i] for i in idxs]
-        transition = self._process_transition(experiences)
+        transition = self._process_indices(idxs)
+        return tuple(transition.values())
+
+    def _done_field(self):
+        """Returns name of the field used to store episode termination."""
+        for field in ["done", "termination", "terminated"]:
+            if field in self.field_names:
+                return field
+
+    def _save2n_step_window(self, *args):
+        """Saves multiple experiences to the n-step window and, once it is full, writes one
+        n-step transition per environment to memory as a single batch.
+
+        :param *args: Variable length argument list. Contains batched transition elements in consistent order,
+            e.g. states, actions, rewards, next_states, dones
+        """
+        if self.n_step_window is None:
+            self.n_step_window = {}
+            for field, value in zip(self.field_names, args):
+                value = np.asarray(value)
+                self.n_step_window[field] = np.zeros(
+                    (
+                        self.n_step,
+                        self.num_envs,
+                        *ArrayStorage._field_shape(value[0]),
+                    ),
+                    dtype=(
+                        np.promote_types(value.dtype, np.float32)
+                        if field == "reward"
+                        else value.dtype
+                    ),
+                )
+
+        for field, value in zip(self.field_names, args):
+            window = self.n_step_window[field]
+            window[self.n_step_ptr] = np.reshape(value, window.shape[1:])
+        self.n_step_ptr = (self.n_step_ptr + 1) % self.n_step
+        self.n_step_count = min(self.n_step_count + 1, self.n_step)
+
+        # single step transition is not ready
+        if self.n_step_count < self.n_step:
+            return ()
+
+        transition = self._get_n_step_window_info(self.gamma)
+        if self.storage == "deque":
+            # Deque storage keeps the rows it is given, which would otherwise be views
+            # of the window overwritten by later transitions
+            transition = tuple(np.array(value) for value in transition)
+        self._add_batch(*transition)
+        self.counter += self.num_envs
+
+        return args
+
+    def _get_n_step_window_info(self, gamma):
+        """Returns n step reward, next_state, and done for every environment in the n-step
+        window, as well as other saved transition elements, in order. Matches the output of
+        _get_n_step_info applied to each environment's transitions."""
+        # window positions from oldest to newest transition
+        order = [(self.n_step_ptr + i) % self.n_step for i in range(self.n_step)]
+        done_field = self._done_field()
+
+        # info of the last transition
+        transition = {
+            field: self.n_step_window[field][order[-1]] for field in self.field_names
+        }
+        reward = transition["reward"]
+        next_state = transition["next_state"]
+        done = transition[done_field]
+
+        for i in reversed(order[:-1]):
+            r = self.n_step_window["reward"][i]
+            n_s = self.n_step_window["next_state"][i]
+            d = self.n_step_window[done_field][i]
+
+            reward = r + gamma * reward * (1 - d)
+            is_done = d.reshape(self.num_envs).astype(bool)
+            next_state = np.where(
+                is_done.reshape(-1, *[1] * (n_s.ndim - 1)), n_s, next_state
+            )
+            done = np.where(is_done.reshape(-1, *[1] * (d.ndim - 1)), d, done)
+
+        transition["reward"] = reward
+        transition["next_state"] = next_state
+        transition[done_field] = done
+
         return tuple(transition.values())
 
     def _get_n_step_info(self, n_step_buffer, gamma):
@@ -262,6 +811,43 @@ class MultiStepReplayBuffer(ReplayBuffer):
 
         return tuple(transition.values())
 
+    def _get_state(self):
+        """Returns arrays and JSON-serialisable attributes holding the buffer state,
+        including transitions waiting in the n-step buffers and window."""
+        arrays, attrs = super()._get_state()
+        for i, n_step_buffer in enumerate(self.n_step_buffers):
+            arrays.update(
+                _stack_experiences(
+                    n_step_buffer, self.field_names, f"n_step_buffers.{i}"
+                )
+            )
+        if self.n_step_window is not None:
+            for field, window in self.n_step_window.items():
+                arrays[f"n_step_window.{field}"] = window
+        attrs["n_step_ptr"] = int(self.n_step_ptr)
+        attrs["n_step_count"] = int(self.n_step_count)
+        return arrays, attrs
+
+    def _set_state(self, arrays, attrs):
+        """Restores buffer state from arrays and attributes returned by _get_state."""
+        super()._set_state(arrays, attrs)
+        for i, n_step_buffer in enumerate(self.n_step_buffers):
+            n_step_buffer.clear()
+            n_step_buffer.extend(
+                _unstack_experiences(
+                    arrays, self.field_names, f"n_step_buffers.{i}", self.experience
+                )
+            )
+        self.n_step_window = None
+        if f"n_step_window.{self.field_names[0]}" in arrays:
+            # The window is small and rewritten on every save, so it is read into memory
+            self.n_step_window = {
+                field: np.array(arrays[f"n_step_window.{field}"])
+                for field in self.field_names
+            }
+        self.n_step_ptr = attrs["n_step_ptr"]
+        self.n_step_count = attrs["n_step_count"]
+
 
 class PrioritizedReplayBuffer(MultiStepReplayBuffer):
     """The Prioritized Experience Replay Buffer class. Used to store experiences and allow
@@ -283,6 +869,12 @@ class PrioritizedReplayBuffer(MultiStepReplayBuffer):
     :type gamma: float, optional
     :param device: Device for accelerated computing, 'cpu' or 'cuda', defaults to None
     :type device: str, optional
+    :param storage: Storage backend, 'deque', 'array', 'memmap' or 'dedup', defaults to 'deque'
+    :type storage: str, optional
+    :param storage_dir: Directory for memory-mapped storage, defaults to None
+    :type storage_dir: str, optional
+    :param frame_stack: Number of stacked frames in observations for 'dedup' storage, defaults to None
+    :type frame_stack: int, optional
     """
 
     def __init__(
@@ -295,9 +887,21 @@ class PrioritizedReplayBuffer(MultiStepReplayBuffer):
         n_step=1,
         gamma=0.99,
         device=None,
+        storage="deque",
+        storage_dir=None,
+        frame_stack=None,
     ):
         super().__init__(
-            action_dim, memory_size, field_names, num_envs, n_step, gamma, device
+            action_dim,
+            memory_size,
+            field_names,
+            num_envs,
+            n_step,
+            gamma,
+            device,
+            storage,
+            storage_dir,
+            frame_stack,
         )
         self.max_priority, self.tree_ptr = 1.0, 0
         self.alpha = alpha
@@ -310,11 +914,29 @@ class PrioritizedReplayBuffer(MultiStepReplayBuffer):
         self.sum_tree = SumSegmentTree(tree_capacity)
         self.min_tree = MinSegmentTree(tree_capacity)
 
+        # Reopened memory-mapped buffers start with max priority for stored experiences
+        if len(self.memory) > 0:
+            idxs = np.arange(len(self.memory))
+            self.sum_tree.update(idxs, self.max_priority**self.alpha)
+            self.min_tree.update(idxs, self.max_priority**self.alpha)
+            self.tree_ptr = self.memory.ptr
+
     def _add(self, *args):
-        super()._add(*args)
+        idx = super()._add(*args)
         self.sum_tree[self.tree_ptr] = self.max_priority**self.alpha
         self.min_tree[self.tree_ptr] = self.max_priority**self.alpha
         self.tree_ptr = (self.tree_ptr + 1) % self.memory_size
+        return idx
+
+    def _add_batch(self, *args, stream=False):
+        if self.storage == "deque":
+            return super()._add_batch(*args, stream=stream)
+
+        idxs = super()._add_batch(*args, stream=stream)
+        self.sum_tree.update(idxs, self.max_priority**self.alpha)
+        self.min_tree.update(idxs, self.max_priority**self.alpha)
+        self.tree_ptr = (self.tree_ptr + len(args[0])) % self.memory_size
+        return idxs
 
     def sample(self, batch_size, beta=0.4):
         """Returns sample of experiences from memory.
@@ -323,12 +945,9 @@ class PrioritizedReplayBuffer(MultiStepReplayBuffer):
         :type batch_size: int
         """
         idxs = self._sample_proprtional(batch_size)
-        experiences = [self.memory[i] for i in idxs]
-        transition = self._process_transition(experiences)
+        transition = self._process_indices(idxs)
 
-        weights = torch.from_numpy(
-            np.array([self._calculate_weight(i, beta) for i in idxs])
-        ).float()
+        weights = torch.from_numpy(self._calculate_weights(idxs, beta)).float()
 
         if self.device is not None:
             weights = weights.to(self.device)
@@ -338,12 +957,51 @@ class PrioritizedReplayBuffer(MultiStepReplayBuffer):
 
         return tuple(transition.values())
 
+    def sample_population(self, batch_sizes, beta=0.4):
+        """Returns one sample of experiences per population member, with the experiences of
+        all members gathered and processed in a single pass. Each member's fields are views
+        into the tensors of the combined sample.
+
+        :param batch_sizes: Number of samples to return for each member
+        :type batch_sizes: list[int]
+        :param beta: Importance sampling exponent, shared by all members or one per member,
+            defaults to 0.4
+        :type beta: float or list[float], optional
+        """
+        member_idxs = [self._sample_proprtional(size) for size in batch_sizes]
+        idxs = np.concatenate(member_idxs)
+        transition = self._process_indices(idxs)
+
+        betas = (
+            beta
+            if isinstance(beta, (list, tuple, np.ndarray))
+            else [beta] * len(batch_sizes)
+        )
+        weights = np.concatenate(
+            [
+                self._calculate_weights(member_idx, member_beta)
+                for member_idx, member_beta in zip(member_idxs, betas)
+            ]
+        )
+        weights = torch.from_numpy(weights).float()
+
+        if self.device is not None:
+            weights = weights.to(self.device)
+
+        transition["weights"] = weights
+        transition["idxs"] = idxs
+
+        return self._split_population(transition, batch_sizes)
+
     def update_priorities(self, idxs, priorities):
         """Update priorities of sampled transitions."""
-        for idx, priority in zip(idxs, priorities):
-            self.sum_tree[idx] = priority**self.alpha
-            self.min_tree[idx] = priority**self.alpha
-            self.max_priority = max(self.max_priority, priority)
+        priorities = np.asarray(priorities).reshape(-1)
+        if len(priorities) == 0:
+            return
+        priorities_alpha = np.power(priorities.astype(np.float64), self.alpha)
+        self.sum_tree.update(idxs, priorities_alpha)
+        self.min_tree.update(idxs, priorities_alpha)
+        self.max_priority = max(self.max_priority, priorities.max())
 
     def _sample_proprtional(self, batch_size):
         """Sample indices based on proportions.
@@ -351,16 +1009,16 @@ class PrioritizedReplayBuffer(MultiStepReplayBuffer):
         :param batch_size: Sample size
         :type batch_size: int
         """
-        idxs = []
         p_total = self.sum_tree.sum(0, len(self) - 1)
         segment = p_total / batch_size
-        for i in range(batch_size):
-            a = segment * i
-            b = segment * (i + 1)
-            upperbound = random.uniform(a, b)
-            idx = self.sum_tree.retrieve(upperbound)
-            idxs.append(idx)
-        return idxs
+        a = segment * np.arange(batch_size)
+        b = segment * np.arange(1, batch_size + 1)
+        # Equivalent to random.uniform(a, b) for each segment
+        upperbounds = a + (b - a) * np.array(
+            [random.random() for _ in range(batch_size)]
+        )
+        idxs = self.sum_tree.retrieve(upperbounds)
+        return idxs.tolist()
 
     def _calculate_weight(self, idx, beta):
         """Calculate the weight of the experience at idx."""
@@ -374,3 +1032,226 @@ class PrioritizedReplayBuffer(MultiStepReplayBuffer):
         weight = weight / max_weight
 
         return weight
+
+    def _calculate_weights(self, idxs, beta):
+        """Calculate the weights of the experiences at idxs."""
+        # get max weight
+        p_total = self.sum_tree.sum()
+        p_min = self.min_tree.min() / p_total
+        max_weight = (p_min * len(self)) ** (-beta)
+
+        # calculate weights
+        p_samples = self.sum_tree[np.asarray(idxs, dtype=np.int64)] / p_total
+        weights = np.power(p_samples * len(self), -beta)
+        weights = weights / max_weight
+
+        return weights
+
+    def _get_state(self):
+        """Returns arrays and JSON-serialisable attributes holding the buffer state,
+        including the segment trees."""
+        arrays, attrs = super()._get_state()
+        arrays["sum_tree"] = self.sum_tree.tree
+        arrays["min_tree"] = self.min_tree.tree
+        attrs["max_priority"] = float(self.max_priority)
+        attrs["tree_ptr"] = int(self.tree_ptr)
+        return arrays, attrs
+
+    def _set_state(self, arrays, attrs):
+        """Restores buffer state from arrays and attributes returned by _get_state."""
+        super()._set_state(arrays, attrs)
+        # Segment trees are small and updated on every learning step, so they are read into memory
+        self.sum_tree.tree = np.array(arrays["sum_tree"])
+        self.min_tree.tree = np.array(arrays["min_tree"])
+        self.max_priority = attrs["max_priority"]
+        self.tree_ptr = attrs["tree_ptr"]
+
+
+class ShardedPrioritizedReplayBuffer(PrioritizedReplayBuffer):
+    """The Sharded Prioritized Experience Replay Buffer class. Used for prioritized
+    off-policy learning with distributed training, where each process stores the
+    experiences it collects in its own shard, so that buffer capacity grows with the
+    number of processes.
+
+    Each batch is drawn from all shards in proportion to the global priority total, built
+    by exchanging per-shard priority sums, and sampled experiences are then exchanged so
+    that every process learns from batch_size of them. Importance-sampling weights use the
+    global priority total, minimum priority and buffer size. Sampled indices identify the
+    owning shard, so priority updates are routed back to it. All processes must call sample
+    and update_priorities together.
+
+    :param action_dim: Action dimension
+    :type action_dim: int
+    :param memory_size: Maximum length of each process's shard of the replay buffer
+    :type memory_size: int
+    :param field_names: Field names for experience named tuple, e.g. ['state', 'action', 'reward']
+    :type field_names: list[str]
+    :param num_envs: Number of parallel environments for training
+    :type num_envs: int
+    :param accelerator: Accelerator for distributed computing
+    :type accelerator: accelerate.Accelerator()
+    :param alpha: Alpha parameter for prioritized replay buffer, defaults to 0.6
+    :type alpha: float, optional
+    :param n_step: Step number to calculate n-step td error, defaults to 1
+    :type n_step: int, optional
+    :param gamma: Discount factor, defaults to 0.99
+    :type gamma: float, optional
+    :param device: Device for accelerated computing, 'cpu' or 'cuda', defaults to None
+    :type device: str, optional
+    :param storage: Storage backend, 'deque', 'array', 'memmap' or 'dedup', defaults to 'deque'
+    :type storage: str, optional
+    :param storage_dir: Directory for memory-mapped storage, defaults to None
+    :type storage_dir: str, optional
+    :param frame_stack: Number of stacked frames in observations for 'dedup' storage, defaults to None
+    :type frame_stack: int, optional
+    """
+
+    def __init__(
+        self,
+        action_dim,
+        memory_size,
+        field_names,
+        num_envs,
+        accelerator,
+        alpha=0.6,
+        n_step=1,
+        gamma=0.99,
+        device=None,
+        storage="deque",
+        storage_dir=None,
+        frame_stack=None,
+    ):
+        super().__init__(
+            action_dim,
+            memory_size,
+            field_names,
+            num_envs,
+            alpha,
+            n_step,
+            gamma,
+            device,
+            storage,
+            storage_dir,
+            frame_stack,
+        )
+        assert accelerator is not None, "Sharded buffer requires an accelerator."
+        self.accelerator = accelerator
+        self.rank = accelerator.process_index
+        self.world_size = accelerator.num_processes
+
+    def _shard_stats(self):
+        """Returns priority sum, minimum priority and size of every shard, exchanged
+        between processes."""
+        local = torch.tensor(
+            [
+                [
+                    self.sum_tree.sum() if len(self) > 0 else 0.0,
+                    self.min_tree.min(),
+                    len(self),
+                ]
+            ],
+            dtype=torch.float64,
+            device=self.accelerator.device,
+        )
+        return gather(local).cpu().numpy()
+
+    def _sample_plan(self, sums, batch_size):
+        """Returns number of experiences to draw from each shard and the order of the
+        combined batch, drawn by the main process and shared with the others."""
+        total = self.world_size * batch_size
+        plan = torch.zeros(self.world_size + total, dtype=torch.int64)
+        if self.accelerator.is_main_process:
+            counts = np.random.multinomial(total, sums / sums.sum())
+            plan = torch.from_numpy(
+                np.concatenate([counts, np.random.permutation(total)])
+            )
+        plan = broadcast(plan.to(self.accelerator.device)).cpu().numpy()
+        return plan[: self.world_size], plan[self.world_size :]
+
+    def sample(self, batch_size, beta=0.4):
+        """Returns sample of experiences drawn from all shards in proportion to the global
+        priority total. Returned indices identify the owning shard of each experience.
+
+        :param batch_size: Number of samples to return
+        :type batch_size: int
+        :param beta: Importance sampling exponent, defaults to 0.4
+        :type beta: float, optional
+        """
+        stats = self._shard_stats()
+        sums, mins, sizes = stats[:, 0], stats[:, 1], stats[:, 2]
+        assert np.all(sizes > 0), "Every shard must contain experiences to sample."
+        counts, order = self._sample_plan(sums, batch_size)
+
+        # Every shard contributes the same number of rows, padded with slot 0, so that the
+        # rows of all shards can be gathered together
+        rows = int(counts.max())
+        count = int(counts[self.rank])
+        idxs = np.zeros(rows, dtype=np.int64)
+        if count > 0:
+            idxs[:count] = self._sample_proprtional(count)
+        transition = self._process_indices(idxs)
+
+        # Importance-sampling weights relative to the global priority distribution
+        p_total, n = sums.sum(), sizes.sum()
+        max_weight = (mins.min() / p_total * n) ** (-beta)
+        weights = np.power(self.sum_tree[idxs] / p_total * n, -beta) / max_weight
+        transition["weights"] = torch.from_numpy(weights).float()
+        transition["idxs"] = torch.from_numpy(self.rank * self.memory_size + idxs)
+
+        # Keep the sampled rows of each shard, in the shared order, then take this
+        # process's share of the combined batch
+        valid = np.concatenate(
+            [shard * rows + np.arange(c) for shard, c in enumerate(counts)]
+        )
+        keep = torch.from_numpy(
+            valid[order[self.rank * batch_size : (self.rank + 1) * batch_size]]
+        ).to(self.accelerator.device)
+        transition = {
+            field: gather(torch.as_tensor(ts).to(self.accelerator.device))[keep]
+            for field, ts in transition.items()
+        }
+        transition["idxs"] = transition["idxs"].cpu().numpy()
+        return tuple(transition.values())
+
+    def sample_population(self, batch_sizes, beta=0.4):
+        """Returns one sample of experiences per population member, each drawn from all
+        shards in proportion to the global priority total.
+
+        :param batch_sizes: Number of samples to return for each member
+        :type batch_sizes: list[int]
+        :param beta: Importance sampling exponent, shared by all members or one per member,
+            defaults to 0.4
+        :type beta: float or list[float], optional
+        """
+        betas = (
+            beta
+            if isinstance(beta, (list, tuple, np.ndarray))
+            else [beta] * len(batch_sizes)
+        )
+        return [
+            self.sample(size, member_beta)
+            for size, member_beta in zip(batch_sizes, betas)
+        ]
+
+    def update_priorities(self, idxs, priorities):
+        """Update priorities of sampled transitions, routing each update to the shard that
+        owns the transition.
+
+        :param idxs: Indices of sampled transitions, as returned by sample
+        :type idxs: numpy.ndarray[int] or list[int]
+        :param priorities: New priorities
+        :type priorities: numpy.ndarray[float] or list[float]
+        """
+        idxs = torch.as_tensor(np.asarray(idxs, dtype=np.int64).reshape(-1))
+        priorities = torch.as_tensor(
+            np.asarray(priorities, dtype=np.float64).reshape(-1)
+        )
+        idxs = gather(idxs.to(self.accelerator.device)).cpu().numpy()
+        priorities = gather(priorities.to(self.accelerator.device)).cpu().numpy()
+        if len(priorities) == 0:
+            return
+
+        owned = idxs // self.memory_size == self.rank
+        super().update_priorities(idxs[owned] % self.memory_size, priorities[owned])
+        # Every shard tracks the global maximum priority given to new experiences
+        self.max_priority = max(self.max_priority, priorities.max())
@@ -1,5 +1,6 @@
 import warnings
 
+import torch
 from torch.utils.data import IterableDataset
 
 from agilerl.components.replay_buffer import ReplayBuffer
@@ -8,7 +9,13 @@ from agilerl.components.replay_buffer import ReplayBuffer
 class ReplayDataset(IterableDataset):
     """
     Iterable Dataset containing the ReplayBuffer which will be updated with new
-    experiences during training
+    experiences during training. Iterating over the dataset yields an endless stream of
+    sampled batches, so a single iterator can be kept for the whole training run.
+
+    The batch size is kept in shared memory, so changes, e.g. from mutation, also apply to
+    DataLoader worker processes. Workers sample from a copy of the buffer made when they
+    start, so they should only be used when the buffer no longer changes, e.g. for offline
+    training.
 
     :param buffer: Experience replay buffer
     :type buffer: agilerl.components.replay_buffer.ReplayBuffer()
@@ -21,7 +28,17 @@ class ReplayDataset(IterableDataset):
             warnings.warn("Buffer is not an agilerl ReplayBuffer.")
         assert batch_size > 0, "Batch size must be greater than zero."
         self.buffer = buffer
-        self.batch_size = batch_size
+        self._batch_size = torch.tensor(batch_size, dtype=torch.int64).share_memory_()
+
+    @property
+    def batch_size(self):
+        return int(self._batch_size)
+
+    @batch_size.setter
+    def batch_size(self, batch_size):
+        assert batch_size > 0, "Batch size must be greater than zero."
+        self._batch_size.fill_(batch_size)
 
     def __iter__(self):
-        yield self.buffer.sample(self.batch_size)
+        while True:
+            yield self.buffer.sample(self.batch_size)
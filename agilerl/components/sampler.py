@@ -1,17 +1,41 @@
+import queue
+import threading
 import warnings
 
+import torch
 from torch.utils.data import DataLoader
 
 from agilerl.components.replay_buffer import (
     MultiStepReplayBuffer,
     PrioritizedReplayBuffer,
     ReplayBuffer,
+    ShardedPrioritizedReplayBuffer,
 )
 from agilerl.components.replay_data import ReplayDataset
 
 
 class Sampler:
-    """Sampler class to handle both standard and distributed training."""
+    """Sampler class to handle both standard and distributed training.
+
+    :param distributed: Sample from a distributed dataloader, defaults to False
+    :type distributed: bool, optional
+    :param per: Sample from a prioritized experience replay buffer, defaults to False
+    :type per: bool, optional
+    :param n_step: Sample from a multi-step replay buffer using indices, defaults to False
+    :type n_step: bool, optional
+    :param memory: Experience replay buffer, defaults to None
+    :type memory: object, optional
+    :param dataset: Replay dataset used for distributed sampling, defaults to None
+    :type dataset: agilerl.components.replay_data.ReplayDataset(), optional
+    :param dataloader: Dataloader used for distributed sampling, defaults to None
+    :type dataloader: torch.utils.data.DataLoader(), optional
+    :param prefetch: Number of batches to assemble ahead of time in a background thread,
+        defaults to 0 (no prefetching)
+    :type prefetch: int, optional
+    :param device: Device to move prefetched batches to, through pinned memory for CUDA
+        devices, defaults to None
+    :type device: str, optional
+    """
 
     def __init__(
         self,
@@ -21,10 +45,13 @@ class Sampler:
         memory=None,
         dataset=None,
         dataloader=None,
+        prefetch=0,
+        device=None,
     ):
         assert (memory is not None) or (
             (dataset is not None) and (dataloader is not None)
         ), "Sampler needs to be initialized with either 'memory' or ('dataset' AND 'dataloader')."
+        assert prefetch >= 0, "Number of prefetched batches must be non-negative."
 
         self.distributed = distributed
         self.per = per
@@ -32,6 +59,21 @@ class Sampler:
         self.memory = memory
         self.dataset = dataset
         self.dataloader = dataloader
+        self.prefetch = prefetch
+        self.device = device
+
+        # Held while reading from or writing to memory when batches are prefetched
+        self.lock = threading.RLock()
+        self.requests = 0  # Batches requested by the learner
+        self.waits = 0  # Requests that found no prefetched batch ready
+        self.discarded = 0  # Prefetched batches dropped as stale
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._batch_size = None
+        self._args = ()
+        self._generation = 0
+        self._iterator = None
 
         if self.distributed:
             if not isinstance(self.dataset, ReplayDataset):
@@ -55,15 +97,160 @@ class Sampler:
                 warnings.warn("Memory is not an agilerl ReplayBuffer.")
             self.sample = self.sample_standard
 
+        if self.prefetch > 0:
+            if self.distributed or self.n_step:
+                warnings.warn(
+                    "Prefetching is only supported for standard and PER sampling, disabling."
+                )
+                self.prefetch = 0
+            elif isinstance(self.memory, ShardedPrioritizedReplayBuffer):
+                # Sampling from shards exchanges data between processes, which must happen
+                # in the same order on every process
+                warnings.warn(
+                    "Prefetching is not supported for sharded replay buffers, disabling."
+                )
+                self.prefetch = 0
+            else:
+                self._sample_fn = self.sample
+                self.sample = self.sample_prefetched
+
     def sample_standard(self, batch_size):
         return self.memory.sample(batch_size)
 
     def sample_distributed(self, batch_size):
         self.dataset.batch_size = batch_size
-        return next(iter(self.dataloader))
+        # One iterator is kept over the endless replay stream, so that the dataloader and its
+        # workers are not rebuilt on every call. Batches prefetched before a batch size change
+        # keep their original size.
+        if self._iterator is None:
+            self._iterator = iter(self.dataloader)
+        return next(self._iterator)
 
     def sample_per(self, batch_size, beta):
         return self.memory.sample(batch_size, beta)
 
     def sample_n_step(self, idxs):
         return self.memory.sample_from_indices(idxs)
+
+    def sample_population(self, batch_sizes, *args):
+        """Returns one batch per population member, with the experiences of all members
+        gathered from memory in a single pass.
+
+        :param batch_sizes: Number of samples to return for each member
+        :type batch_sizes: list[int]
+        :param *args: Further sampling arguments, e.g. beta for PER
+        """
+        assert not (
+            self.distributed or self.n_step
+        ), "Population sampling is only supported for standard and PER sampling."
+        with self.lock:
+            return self.memory.sample_population(batch_sizes, *args)
+
+    def sample_prefetched(self, batch_size, *args):
+        """Returns a batch assembled in the background thread, or samples one directly if
+        none is ready for this batch size.
+
+        :param batch_size: Number of samples to return
+        :type batch_size: int
+        :param *args: Further sampling arguments, e.g. beta for PER
+        """
+        self.requests += 1
+        self._batch_size, self._args = batch_size, args
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+
+        while True:
+            try:
+                size, generation, batch_args, batch = self._queue.get_nowait()
+            except queue.Empty:
+                self.waits += 1
+                with self.lock:
+                    return self._sample_fn(batch_size, *args)
+            if size == batch_size and generation == self._generation:
+                break
+            self.discarded += 1
+
+        if self.per and batch_args != args:
+            # Importance-sampling weights are recomputed with the current beta
+            batch = self._reweight(batch, *args)
+        return batch
+
+    def update_priorities(self, idxs, priorities):
+        """Updates priorities of sampled transitions and discards prefetched batches that
+        were drawn with the old priorities.
+
+        :param idxs: Indices of sampled transitions
+        :type idxs: numpy.ndarray[int] or list[int]
+        :param priorities: New priorities
+        :type priorities: numpy.ndarray[float] or list[float]
+        """
+        with self.lock:
+            self.memory.update_priorities(idxs, priorities)
+            self._generation += 1
+        if self._queue is not None:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.discarded += 1
+
+    def close(self):
+        """Stops the background prefetching thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stop.clear()
+
+    def _start(self):
+        """Starts the background prefetching thread."""
+        self._queue = queue.Queue(maxsize=self.prefetch)
+        self._thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._thread.start()
+
+    def _prefetch_loop(self):
+        """Keeps the queue filled with batches for the most recently requested batch size."""
+        while not self._stop.is_set():
+            with self.lock:
+                batch_size, args, generation = (
+                    self._batch_size,
+                    self._args,
+                    self._generation,
+                )
+                if len(self.memory) >= batch_size:
+                    batch = self._sample_fn(batch_size, *args)
+                else:
+                    batch = None
+            if batch is None:
+                self._stop.wait(1e-3)
+                continue
+            item = (batch_size, generation, args, self._to_device(batch))
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.01)
+                    break
+                except queue.Full:
+                    continue
+
+    def _to_device(self, batch):
+        """Moves tensors in a batch to the sampler's device, through pinned memory for CUDA."""
+        if self.device is None:
+            return batch
+        if isinstance(batch, torch.Tensor):
+            if batch.device.type == "cpu" and torch.device(self.device).type == "cuda":
+                return batch.pin_memory().to(self.device, non_blocking=True)
+            return batch.to(self.device)
+        if isinstance(batch, dict):
+            return {key: self._to_device(value) for key, value in batch.items()}
+        if isinstance(batch, (tuple, list)):
+            return type(batch)(self._to_device(value) for value in batch)
+        return batch
+
+    def _reweight(self, batch, beta):
+        """Returns PER batch with importance-sampling weights for the given beta."""
+        idxs = batch[-1]
+        with self.lock:
+            weights = torch.from_numpy(self.memory._calculate_weights(idxs, beta))
+        weights = weights.float().to(batch[-2].device)
+        return batch[:-2] + (weights, idxs)
@@ -1,5 +1,10 @@
 import operator
-from typing import Callable
+from typing import Callable, Union
+
+import numpy as np
+
+# Vectorized equivalents of common tree operations, used for batch updates
+_UFUNCS = {operator.add: np.add, min: np.minimum, max: np.maximum}
 
 
 class SegmentTree:
@@ -8,9 +13,12 @@ class SegmentTree:
     Taken from OpenAI baselines github repository:
     https://github.com/openai/baselines/blob/master/baselines/common/segment_tree.py
 
+    The tree is stored in a NumPy array so that batches of leaves can be
+    updated and retrieved with vectorized operations.
+
     Attributes:
         capacity (int)
-        tree (list)
+        tree (np.ndarray)
         operation (function)
 
     """
@@ -28,8 +36,11 @@ class SegmentTree:
             capacity > 0 and capacity & (capacity - 1) == 0
         ), "capacity must be positive and a power of 2."
         self.capacity = capacity
-        self.tree = [init_value for _ in range(2 * capacity)]
+        self.tree = np.full(2 * capacity, init_value, dtype=np.float64)
         self.operation = operation
+        self.ufunc = _UFUNCS.get(operation)
+        if self.ufunc is None:
+            self.ufunc = np.frompyfunc(operation, 2, 1)
 
     def _operate_helper(
         self, start: int, end: int, node: int, node_start: int, node_end: int
@@ -67,8 +78,48 @@ class SegmentTree:
             self.tree[idx] = self.operation(self.tree[2 * idx], self.tree[2 * idx + 1])
             idx //= 2
 
-    def __getitem__(self, idx: int) -> float:
-        """Get real value in leaf node of tree."""
+    def update(self, idxs: np.ndarray, values: np.ndarray):
+        """Set values of a batch of leaves in tree.
+
+        Equivalent to setting each value in turn, so when an index is repeated
+        the last value is kept.
+
+        Args:
+            idxs (np.ndarray)
+            values (np.ndarray)
+
+        """
+        idxs = np.asarray(idxs, dtype=np.int64).reshape(-1)
+        values = np.broadcast_to(
+            np.asarray(values, dtype=np.float64).reshape(-1), idxs.shape
+        )
+        if len(idxs) == 0:
+            return
+        assert np.all((0 <= idxs) & (idxs < self.capacity))
+
+        # Keep the last occurrence of repeated indices
+        unique_idxs, last = np.unique(idxs[::-1], return_index=True)
+        nodes = unique_idxs + self.capacity
+        self.tree[nodes] = values[::-1][last]
+
+        # Recompute parents level by level, nodes stay sorted so duplicates are adjacent
+        nodes = nodes // 2
+        while nodes[0] >= 1:
+            keep = np.ones(len(nodes), dtype=bool)
+            np.not_equal(nodes[1:], nodes[:-1], out=keep[1:])
+            nodes = nodes[keep]
+            self.tree[nodes] = self.ufunc(
+                self.tree[2 * nodes], self.tree[2 * nodes + 1]
+            )
+            nodes = nodes // 2
+
+    def __getitem__(self, idx: Union[int, np.ndarray]) -> Union[float, np.ndarray]:
+        """Get real value in leaf node(s) of tree."""
+        if np.ndim(idx) > 0:
+            idx = np.asarray(idx, dtype=np.int64)
+            assert np.all((0 <= idx) & (idx < self.capacity))
+            return self.tree[self.capacity + idx]
+
         assert 0 <= idx < self.capacity
 
         return self.tree[self.capacity + idx]
@@ -95,22 +146,29 @@ class SumSegmentTree(SegmentTree):
         """Returns arr[start] + ... + arr[end]."""
         return super().operate(start, end)
 
-    def retrieve(self, upperbound: float) -> int:
-        """Find the highest index `i` about upper bound in the tree"""
-        # TODO: Check assert case and fix bug
-        assert 0 <= upperbound <= self.sum() + 1e-5, f"upperbound: {upperbound}"
-
-        idx = 1
+    def retrieve(self, upperbound: Union[float, np.ndarray]) -> Union[int, np.ndarray]:
+        """Find the highest index `i` about upper bound in the tree.
 
-        while idx < self.capacity:  # while non-leaf
-            left = 2 * idx
-            right = left + 1
-            if self.tree[left] > upperbound:
-                idx = 2 * idx
-            else:
-                upperbound -= self.tree[left]
-                idx = right
-        return idx - self.capacity
+        Accepts a single upper bound or an array of upper bounds, in which case
+        all of them are retrieved in one vectorized pass down the tree.
+        """
+        scalar = np.ndim(upperbound) == 0
+        upperbounds = np.array(upperbound, dtype=np.float64).reshape(-1)
+        # TODO: Check assert case and fix bug
+        assert np.all(
+            (0 <= upperbounds) & (upperbounds <= self.sum() + 1e-5)
+        ), f"upperbound: {upperbound}"
+
+        idxs = np.ones(len(upperbounds), dtype=np.int64)
+
+        for _ in range(self.capacity.bit_length() - 1):  # while non-leaf
+            left = 2 * idxs
+            left_values = self.tree[left]
+            go_left = left_values > upperbounds
+            upperbounds = np.where(go_left, upperbounds, upperbounds - left_values)
+            idxs = np.where(go_left, left, left + 1)
+        idxs = idxs - self.capacity
+        return int(idxs[0]) if scalar else idxs
 
 
 class MinSegmentTree(SegmentTree):
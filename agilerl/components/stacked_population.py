@@ -0,0 +1,411 @@
+import copy
+import random
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.func import functional_call, vmap
+
+
+def _group_key(agent):
+    """Returns the key of the stacking group of an agent. Members are stacked together if
+    their networks have identical init_dicts, and they learn from batches of the same
+    shape in the same way."""
+    networks = tuple(
+        (
+            type(network).__name__,
+            tuple(
+                sorted((key, repr(value)) for key, value in network.init_dict.items())
+            ),
+        )
+        for network in [agent.actor, agent.actor_target]
+    )
+    return (
+        type(agent).__name__,
+        networks,
+        tuple(agent.state_dim),
+        agent.action_dim,
+        agent.one_hot,
+        agent.double,
+        agent.batch_size,
+    )
+
+
+def _stack(modules):
+    """Returns parameters and buffers of identical modules stacked along a new first
+    dimension, and binds each module's tensors to its slice of the stacked tensors."""
+    params = {
+        name: torch.stack([module.get_parameter(name).detach() for module in modules])
+        for name, _ in modules[0].named_parameters()
+    }
+    buffers = {
+        name: torch.stack([module.get_buffer(name) for module in modules])
+        for name, _ in modules[0].named_buffers()
+    }
+    for i, module in enumerate(modules):
+        for name, param in module.named_parameters():
+            param.data = params[name][i]
+        for name, buffer in module.named_buffers():
+            buffer.data = buffers[name][i]
+    for param in params.values():
+        param.requires_grad_(True)
+    return params, buffers
+
+
+class _StackedGroup:
+    """Population members with identical networks, whose parameters are stored as slices
+    of stacked tensors."""
+
+    def __init__(self, agents):
+        self.agents = agents
+        self.key = _group_key(agents[0])
+        # Stateless copies of the network structures, called with the stacked parameters
+        self.base = copy.deepcopy(agents[0].actor).to("meta")
+        self.target_base = copy.deepcopy(agents[0].actor_target).to("meta")
+        self.params, self.buffers = _stack([agent.actor for agent in agents])
+        self.target_params, self.target_buffers = _stack(
+            [agent.actor_target for agent in agents]
+        )
+        for param in self.target_params.values():
+            param.requires_grad_(False)
+        self.optimizer_state = self._stack_optimizer_state()
+        # Members are checked against the objects they were stacked with, which are kept
+        # alive by the group, and the storage of their first parameters
+        self.members = [
+            (
+                agent.actor,
+                agent.actor_target,
+                agent.optimizer,
+                agent.batch_size,
+                self._pointers(agent),
+            )
+            for agent in agents
+        ]
+
+    @staticmethod
+    def _pointers(agent):
+        return (
+            next(agent.actor.parameters()).data_ptr(),
+            next(agent.actor_target.parameters()).data_ptr(),
+        )
+
+    def is_valid(self):
+        """Returns True if every member's networks still use the stacked tensors, which is
+        no longer the case once a network has been mutated or replaced."""
+        return all(
+            agent.actor is actor
+            and agent.actor_target is actor_target
+            and agent.optimizer is optimizer
+            and agent.batch_size == batch_size
+            and self._pointers(agent) == pointers
+            for agent, (actor, actor_target, optimizer, batch_size, pointers) in zip(
+                self.agents, self.members
+            )
+        )
+
+    def _stack_optimizer_state(self):
+        """Stacks the Adam moment estimates of the members' optimizers, and binds each
+        optimizer's state to its slice of the stacked tensors, so that the group can be
+        updated with one batched Adam step. Returns None if the optimizers do not share
+        Adam's default update rule and hyperparameters, in which case each member's
+        optimizer is stepped on its own."""
+        optimizers = [agent.optimizer for agent in self.agents]
+        hyperparameters = {
+            (tuple(group["betas"]), group["eps"])
+            for optimizer in optimizers
+            for group in optimizer.param_groups
+        }
+        if (
+            not all(
+                type(optimizer) is optim.Adam
+                and len(optimizer.param_groups) == 1
+                and optimizer.param_groups[0]["params"]
+                == list(agent.actor.parameters())
+                and optimizer.param_groups[0]["weight_decay"] == 0
+                and not optimizer.param_groups[0]["amsgrad"]
+                and not optimizer.param_groups[0]["maximize"]
+                for agent, optimizer in zip(self.agents, optimizers)
+            )
+            or len(hyperparameters) > 1
+        ):
+            return None
+
+        state = {}
+        for name, param in self.params.items():
+            member_states = [
+                optimizer.state[agent.actor.get_parameter(name)]
+                for agent, optimizer in zip(self.agents, optimizers)
+            ]
+            step = torch.tensor(
+                [float(member.get("step", 0)) for member in member_states],
+                device=param.device,
+            )
+            exp_avg, exp_avg_sq = (
+                torch.stack(
+                    [
+                        member[key] if key in member else torch.zeros_like(param[0])
+                        for member in member_states
+                    ]
+                )
+                for key in ["exp_avg", "exp_avg_sq"]
+            )
+            for i, (agent, optimizer) in enumerate(zip(self.agents, optimizers)):
+                optimizer.state[agent.actor.get_parameter(name)] = {
+                    "step": step[i],
+                    "exp_avg": exp_avg[i],
+                    "exp_avg_sq": exp_avg_sq[i],
+                }
+            state[name] = (step, exp_avg, exp_avg_sq)
+        betas, eps = hyperparameters.pop()
+        return betas, eps, state
+
+    def step(self):
+        """Updates the stacked parameters from their gradients with the members'
+        optimizers."""
+        if self.optimizer_state is None:
+            for i, agent in enumerate(self.agents):
+                for name, param in agent.actor.named_parameters():
+                    param.grad = self.params[name].grad[i]
+                agent.optimizer.step()
+            return
+
+        # Adam update of every member, with its own learning rate
+        (beta1, beta2), eps, state = self.optimizer_state
+        lr = self.per_member(
+            [agent.optimizer.param_groups[0]["lr"] for agent in self.agents]
+        )
+        with torch.no_grad():
+            for name, param in self.params.items():
+                step, exp_avg, exp_avg_sq = state[name]
+                grad = param.grad
+                shape = (-1,) + (1,) * (param.dim() - 1)
+                step += 1
+                exp_avg.lerp_(grad, 1 - beta1)
+                exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+                bias_correction1 = 1 - beta1**step
+                bias_correction2_sqrt = (1 - beta2**step).sqrt()
+                denom = (exp_avg_sq.sqrt() / bias_correction2_sqrt.view(shape)).add_(
+                    eps
+                )
+                param.sub_((lr / bias_correction1).view(shape) * exp_avg / denom)
+
+    def forward(self, x, target=False):
+        """Returns outputs of every member's network, or target network, for its own batch
+        of inputs."""
+        if target:
+            base, params, buffers = (
+                self.target_base,
+                self.target_params,
+                self.target_buffers,
+            )
+        else:
+            base, params, buffers = self.base, self.params, self.buffers
+        return vmap(
+            lambda p, b, x: functional_call(base, (p, b), (x,)),
+            randomness="different",
+        )(params, buffers, x)
+
+    def per_member(self, values):
+        """Returns values of the members as a tensor with one element per member."""
+        return torch.tensor(
+            [float(value) for value in values],
+            device=next(iter(self.params.values())).device,
+        )
+
+
+class StackedPopulation:
+    """Runs action selection and learning for population members with identical networks
+    together, as batched matrix multiplications over their stacked parameters.
+
+    Members are grouped by the init_dict of their networks, batch size and learning
+    setup, and each group's parameters are stored as stacked tensors, of which the
+    members' networks hold views, so that agents can still be used, cloned and mutated
+    on their own. Groups are rebuilt automatically once a member's network has been
+    mutated or replaced, e.g. by architecture_mutate. Optimizer steps are made with each
+    member's own optimizer, so members keep their own learning rates.
+
+    Stacked members' state dicts are views of the stacked tensors, so call release before
+    saving checkpoints, to save only each member's own parameters.
+
+    Currently supports DQN agents on a single device. This is a standalone component for
+    training loops that step every member at once, and is not used by the training
+    functions in agilerl.training, which act and learn with one member at a time.
+
+    :param pop: Population of agents
+    :type pop: list[object]
+    """
+
+    def __init__(self, pop):
+        self.groups = []
+        self.set_population(pop)
+
+    def set_population(self, pop):
+        """Sets the population, e.g. after tournament selection and mutation, and groups
+        its members.
+
+        :param pop: Population of agents
+        :type pop: list[object]
+        """
+        for agent in pop:
+            assert agent.algo == "DQN", "Stacked populations only support DQN agents."
+            assert (
+                agent.accelerator is None
+            ), "Stacked populations do not support accelerators."
+        self.pop = pop
+        self.regroup()
+
+    def regroup(self):
+        """Groups population members with identical networks and stacks their
+        parameters."""
+        self.release()
+        members = {}
+        for i, agent in enumerate(self.pop):
+            members.setdefault(_group_key(agent), []).append(i)
+        self.groups = [
+            (indices, _StackedGroup([self.pop[i] for i in indices]))
+            for indices in members.values()
+        ]
+
+    def release(self):
+        """Gives every member its own copy of its parameters and optimizer state, detached
+        from the stacked tensors."""
+        for _, group in self.groups:
+            for agent in group.agents:
+                for module in [agent.actor, agent.actor_target]:
+                    for tensor in list(module.parameters()) + list(module.buffers()):
+                        tensor.data = tensor.data.clone()
+                for state in agent.optimizer.state.values():
+                    for key, value in state.items():
+                        if torch.is_tensor(value):
+                            state[key] = value.clone()
+        self.groups = []
+
+    def _check_groups(self):
+        if not all(group.is_valid() for _, group in self.groups):
+            self.regroup()
+
+    @staticmethod
+    def _state(agent, state):
+        """Returns observation of an agent as a batched tensor, as in DQN.getAction."""
+        state = torch.from_numpy(state).float().to(agent.device)
+        if agent.one_hot:
+            state = (
+                nn.functional.one_hot(state.long(), num_classes=agent.state_dim[0])
+                .float()
+                .squeeze()
+            )
+        if len(state.size()) < 2:
+            state = state.unsqueeze(0)
+        return state
+
+    def getAction(self, states, epsilon=0, action_masks=None):
+        """Returns the next action of every member of the population, with one batched
+        forward pass per group.
+
+        :param states: State observation, or multiple observations in a batch, of each member
+        :type states: list[numpy.ndarray[float]]
+        :param epsilon: Probablilty of taking a random action for exploration, defaults to 0
+        :type epsilon: float, optional
+        :param action_masks: Mask of legal actions 1=legal 0=illegal of each member, defaults to None
+        :type action_masks: list[numpy.ndarray], optional
+        """
+        self._check_groups()
+        actions = [None] * len(self.pop)
+        for indices, group in self.groups:
+            agents = group.agents
+            x = torch.stack(
+                [self._state(agent, states[i]) for agent, i in zip(agents, indices)]
+            )
+            group.base.eval()
+            with torch.no_grad():
+                action_values = group.forward(x).cpu().data.numpy()
+            group.base.train()
+
+            for i, values in zip(indices, action_values):
+                action_mask = None if action_masks is None else action_masks[i]
+                if random.random() < epsilon:
+                    if action_mask is None:
+                        actions[i] = np.random.randint(
+                            0, agents[0].action_dim, size=len(values)
+                        )
+                    else:
+                        available_actions = np.ma.array(
+                            np.arange(0, agents[0].action_dim), mask=1 - action_mask
+                        ).compressed()
+                        actions[i] = np.random.choice(
+                            available_actions, size=len(values)
+                        )
+                elif action_mask is None:
+                    actions[i] = np.argmax(values, axis=-1)
+                else:
+                    actions[i] = np.argmax(
+                        np.ma.array(values, mask=1 - action_mask), axis=-1
+                    )
+        return actions
+
+    def learn(self, experiences):
+        """Updates the network parameters of every member of the population from its own
+        experiences, with one batched forward and backward pass per group, and returns
+        their losses.
+
+        :param experiences: Batched states, actions, rewards, next_states, dones of each member
+        :type experiences: list[list[torch.Tensor[float]]]
+        """
+        self._check_groups()
+        losses = [None] * len(self.pop)
+        for indices, group in self.groups:
+            agent = group.agents[0]
+            states, actions, rewards, next_states, dones = (
+                torch.stack(field) for field in zip(*[experiences[i] for i in indices])
+            )
+            if agent.one_hot:
+                states = nn.functional.one_hot(
+                    states.long(), num_classes=agent.state_dim[0]
+                ).float()
+                next_states = nn.functional.one_hot(
+                    next_states.long(), num_classes=agent.state_dim[0]
+                ).float()
+                # Replay buffers store discrete observations with a trailing dimension
+                states, next_states = states.squeeze(-2), next_states.squeeze(-2)
+            gammas = group.per_member([member.gamma for member in group.agents]).view(
+                -1, 1, 1
+            )
+
+            if agent.double:  # Double Q-learning
+                q_idx = (
+                    group.forward(next_states, target=True).argmax(dim=-1).unsqueeze(-1)
+                )
+                q_target = (
+                    group.forward(next_states).gather(dim=-1, index=q_idx).detach()
+                )
+            else:
+                q_target = (
+                    group.forward(next_states, target=True)
+                    .detach()
+                    .max(dim=-1)[0]
+                    .unsqueeze(-1)
+                )
+
+            # target, if terminal then y_j = rewards
+            y_j = rewards + gammas * q_target * (1 - dones)
+            q_eval = group.forward(states).gather(-1, actions.long())
+
+            # Mean squared error of each member, summed so that each member's gradients
+            # are those of its own loss
+            member_losses = ((q_eval - y_j) ** 2).mean(dim=(1, 2))
+            for param in group.params.values():
+                param.grad = None
+            member_losses.sum().backward()
+            group.step()
+
+            # soft update target networks
+            with torch.no_grad():
+                taus = group.per_member([member.tau for member in group.agents])
+                for name, target_param in group.target_params.items():
+                    tau = taus.view(-1, *([1] * (target_param.dim() - 1)))
+                    target_param.mul_(1.0 - tau).add_(tau * group.params[name])
+
+            for i, loss in zip(indices, member_losses.tolist()):
+                losses[i] = loss
+        return losses
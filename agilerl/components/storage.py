@@ -0,0 +1,1055 @@
+import json
+import mmap
+import multiprocessing
+import os
+import shutil
+from collections import OrderedDict, namedtuple
+
+import h5py
+import numpy as np
+
+
+def _rows_equal(a, b):
+    """Returns whether each row of a equals the corresponding row of b."""
+    return np.all((a == b).reshape(len(a), int(np.prod(a.shape[1:]))), axis=1)
+
+
+def _copy_rows(dest, src, chunk_size):
+    """Copies src into dest in chunks of rows, so that memory-mapped arrays are never
+    loaded into memory all at once."""
+    for start in range(0, len(src), chunk_size):
+        dest[start : start + chunk_size] = src[start : start + chunk_size]
+
+
+def save_arrays(path, arrays, meta, chunk_size=65536):
+    """Saves arrays to a directory as raw .npy files, written in chunks of rows, along with
+    JSON metadata in ``meta.json``. An existing directory at path is replaced once all files
+    have been written.
+
+    :param path: Directory to save arrays in
+    :type path: str
+    :param arrays: Arrays to save, keyed by name
+    :type arrays: dict[str, numpy.ndarray]
+    :param meta: JSON-serialisable metadata
+    :type meta: dict
+    :param chunk_size: Number of rows written at a time, defaults to 65536
+    :type chunk_size: int, optional
+    """
+    path = os.path.normpath(path)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    for name, array in arrays.items():
+        file = os.path.join(tmp_path, f"{name}.npy")
+        if array.ndim == 0 or array.size == 0:
+            np.save(file, np.asarray(array))
+            continue
+        dest = np.lib.format.open_memmap(
+            file, mode="w+", dtype=array.dtype, shape=array.shape
+        )
+        _copy_rows(dest, array, chunk_size)
+        dest.flush()
+        del dest
+
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({**meta, "arrays": list(arrays)}, f)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+
+def load_arrays(path, mmap=True):
+    """Returns arrays and metadata saved with save_arrays. When mmap is True, arrays are
+    memory-mapped copy-on-write, so they are only read from disk when accessed and changes
+    are never written back to the saved files.
+
+    :param path: Directory arrays were saved in
+    :type path: str
+    :param mmap: Memory-map arrays instead of reading them into memory, defaults to True
+    :type mmap: bool, optional
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in meta.pop("arrays"):
+        file = os.path.join(path, f"{name}.npy")
+        try:
+            arrays[name] = np.load(file, mmap_mode="c" if mmap else None)
+        except ValueError:
+            # Empty arrays cannot be memory-mapped
+            arrays[name] = np.load(file)
+    return arrays, meta
+
+
+class ArrayStorage:
+    """Preallocated ring-buffer storage for replay buffers. Each field is kept in one
+    contiguous NumPy array of shape (max_size, *field_shape), allocated lazily from the
+    first transition that is written, with a write pointer that wraps around once full.
+
+    Indices returned by and passed to this class are physical slot indices, so slot ``i``
+    always refers to the same position in the underlying arrays.
+
+    :param max_size: Maximum number of transitions to store
+    :type max_size: int
+    :param field_names: Field names for stored transitions, e.g. ['state', 'action', 'reward']
+    :type field_names: list[str]
+    """
+
+    def __init__(self, max_size, field_names):
+        assert max_size > 0, "Max size must be greater than zero."
+        assert len(field_names) > 0, "Field names must contain at least one field name."
+
+        self.max_size = max_size
+        self.field_names = field_names
+        self.experience = namedtuple("Experience", field_names=self.field_names)
+        self.fields = None
+        self.ptr = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        """Returns experience stored at slot idx, with each field as a view into storage."""
+        if not -self.size <= idx < self.size:
+            raise IndexError("Storage index out of range.")
+        idx %= self.size
+        return self.experience(*(self.fields[field][idx] for field in self.field_names))
+
+    @staticmethod
+    def _field_shape(value):
+        """Returns storage shape of a single field value, matching the shapes produced by
+        stacking unbatched experiences."""
+        value = np.asarray(value)
+        return value.shape if value.ndim > 0 else (1,)
+
+    @staticmethod
+    def _field_dtype(field, value):
+        """Returns storage dtype of a field. Boolean and integer fields, such as dones, discrete
+        actions and uint8 frames, keep their dtype, while rewards and floating point fields are
+        stored as float32."""
+        dtype = np.asarray(value).dtype
+        if field != "reward" and (
+            dtype == np.bool_ or np.issubdtype(dtype, np.integer)
+        ):
+            return dtype
+        return np.dtype(np.float32)
+
+    def _empty(self, field, shape, dtype):
+        """Returns zero-initialised array used to store a field."""
+        return np.zeros(shape, dtype=dtype)
+
+    def _allocate(self, *args):
+        """Allocates field arrays from a single (unbatched) transition."""
+        self.fields = {
+            field: self._empty(
+                field,
+                (self.max_size, *self._field_shape(value)),
+                self._field_dtype(field, value),
+            )
+            for field, value in zip(self.field_names, args)
+        }
+
+    def _advance(self, n):
+        self.ptr = (self.ptr + n) % self.max_size
+        self.size = min(self.size + n, self.max_size)
+
+    def append(self, *args):
+        """Writes a single transition to storage and returns the slot it was written to.
+
+        :param *args: Variable length argument list. Contains transition elements in consistent order,
+            e.g. state, action, reward, next_state, done
+        """
+        if self.fields is None:
+            self._allocate(*args)
+
+        idx = self.ptr
+        for field, value in zip(self.field_names, args):
+            array = self.fields[field]
+            array[idx] = np.reshape(value, array.shape[1:])
+        self._advance(1)
+        return idx
+
+    def extend(self, *args):
+        """Writes a batch of transitions to storage with one slice assignment per field and
+        returns the slots written to.
+
+        :param *args: Variable length argument list. Contains batched transition elements in consistent order,
+            e.g. states, actions, rewards, next_states, dones
+        """
+        args = [np.asarray(arg) for arg in args]
+        n = len(args[0])
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        if self.fields is None:
+            self._allocate(*(arg[0] for arg in args))
+
+        # Only the most recent max_size transitions can survive a write larger than storage
+        if n > self.max_size:
+            self._advance(n - self.max_size)
+            args = [arg[-self.max_size :] for arg in args]
+            n = self.max_size
+
+        start = self.ptr
+        if start + n <= self.max_size:
+            idxs = slice(start, start + n)
+        else:
+            idxs = (start + np.arange(n)) % self.max_size
+        for field, value in zip(self.field_names, args):
+            array = self.fields[field]
+            array[idxs] = np.reshape(value, (n, *array.shape[1:]))
+        self._advance(n)
+        return np.arange(start, start + n) % self.max_size
+
+    def gather(self, idxs):
+        """Returns dictionary of field arrays gathered at the given slots.
+
+        :param idxs: Slot indices to gather
+        :type idxs: list[int] or numpy.ndarray
+        """
+        idxs = np.asarray(idxs, dtype=np.int64)
+        return {field: self.fields[field][idxs] for field in self.field_names}
+
+    def get_state(self):
+        """Returns arrays and JSON-serialisable attributes holding the storage state."""
+        arrays = {}
+        if self.fields is not None:
+            for field, array in self.fields.items():
+                arrays[f"fields.{field}"] = array
+        return arrays, {"ptr": int(self.ptr), "size": int(self.size)}
+
+    def set_state(self, arrays, attrs):
+        """Restores storage state from arrays and attributes returned by get_state.
+
+        :param arrays: Arrays holding the storage state, keyed by name
+        :type arrays: dict[str, numpy.ndarray]
+        :param attrs: Attributes holding the storage state
+        :type attrs: dict
+        """
+        fields = {
+            field: arrays[f"fields.{field}"]
+            for field in self.field_names
+            if f"fields.{field}" in arrays
+        }
+        self.fields = fields if fields else None
+        self.ptr, self.size = attrs["ptr"], attrs["size"]
+
+
+class MemmapStorage(ArrayStorage):
+    """Ring-buffer storage backed by memory-mapped files, so that buffers larger than RAM
+    can be kept on disk with the OS page cache serving recently used pages. Each field is
+    saved as ``<field>.npy`` in the storage directory, alongside the write pointer and
+    size in ``pointers.npy``. If the directory already contains a buffer, it is reopened.
+
+    :param max_size: Maximum number of transitions to store
+    :type max_size: int
+    :param field_names: Field names for stored transitions, e.g. ['state', 'action', 'reward']
+    :type field_names: list[str]
+    :param path: Directory to store memory-mapped files in
+    :type path: str
+    """
+
+    def __init__(self, max_size, field_names, path):
+        super().__init__(max_size, field_names)
+        assert path is not None, "Memory-mapped storage requires a storage directory."
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        pointers_path = os.path.join(path, "pointers.npy")
+        if os.path.exists(pointers_path):
+            self._pointers = np.load(pointers_path, mmap_mode="r+")
+            self.ptr, self.size = (int(p) for p in self._pointers)
+            if self.size > 0:
+                self._open()
+        else:
+            self._pointers = np.lib.format.open_memmap(
+                pointers_path, mode="w+", dtype=np.int64, shape=(2,)
+            )
+
+    def _field_path(self, field):
+        return os.path.join(self.path, f"{field}.npy")
+
+    def _open(self):
+        """Opens field arrays of an existing buffer directory."""
+        self.fields = {}
+        for field in self.field_names:
+            assert os.path.exists(
+                self._field_path(field)
+            ), f"Field '{field}' not found in storage directory {self.path}."
+            self.fields[field] = np.load(self._field_path(field), mmap_mode="r+")
+            assert (
+                len(self.fields[field]) == self.max_size
+            ), f"Stored field '{field}' has size {len(self.fields[field])}, expected {self.max_size}."
+
+    def _empty(self, field, shape, dtype):
+        return np.lib.format.open_memmap(
+            self._field_path(field), mode="w+", dtype=dtype, shape=shape
+        )
+
+    def _advance(self, n):
+        super()._advance(n)
+        self._pointers[:] = (self.ptr, self.size)
+
+    def gather(self, idxs):
+        """Returns dictionary of field arrays gathered at the given slots. Slots are read
+        in sorted order to keep disk access sequential.
+
+        :param idxs: Slot indices to gather
+        :type idxs: list[int] or numpy.ndarray
+        """
+        idxs = np.asarray(idxs, dtype=np.int64)
+        order = np.argsort(idxs)
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        sorted_idxs = idxs[order]
+        return {
+            field: np.asarray(self.fields[field][sorted_idxs])[inverse]
+            for field in self.field_names
+        }
+
+    def set_state(self, arrays, attrs):
+        """Restores storage state by copying arrays returned by get_state into the
+        memory-mapped files of this storage.
+
+        :param arrays: Arrays holding the storage state, keyed by name
+        :type arrays: dict[str, numpy.ndarray]
+        :param attrs: Attributes holding the storage state
+        :type attrs: dict
+        """
+        self.fields = None
+        if f"fields.{self.field_names[0]}" in arrays:
+            self.fields = {}
+            for field in self.field_names:
+                array = arrays[f"fields.{field}"]
+                self.fields[field] = self._empty(field, array.shape, array.dtype)
+                _copy_rows(self.fields[field], array, 65536)
+        self.ptr, self.size = attrs["ptr"], attrs["size"]
+        self._pointers[:] = (self.ptr, self.size)
+
+    def flush(self):
+        """Flushes memory-mapped files to disk."""
+        if self.fields is not None:
+            for array in self.fields.values():
+                array.flush()
+        self._pointers.flush()
+
+
+class SharedArrayStorage(ArrayStorage):
+    """Ring-buffer storage kept in anonymous shared memory, so that processes forked after
+    allocation write to and read from the same arrays. The write pointer and size are
+    shared too, and writes are serialised with a process lock so that concurrent writers
+    never claim the same slots. Field arrays must be allocated, by writing the first
+    transition, before forking.
+
+    :param max_size: Maximum number of transitions to store
+    :type max_size: int
+    :param field_names: Field names for stored transitions, e.g. ['state', 'action', 'reward']
+    :type field_names: list[str]
+    """
+
+    def __init__(self, max_size, field_names):
+        self._pointers = self._shared((2,), np.int64)
+        self._lock = multiprocessing.get_context("fork").Lock()
+        self._owner = os.getpid()
+        super().__init__(max_size, field_names)
+
+    @staticmethod
+    def _shared(shape, dtype):
+        """Returns zero-initialised array in anonymous shared memory."""
+        dtype = np.dtype(dtype)
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        return np.frombuffer(
+            mmap.mmap(-1, nbytes), dtype=dtype, count=int(np.prod(shape))
+        ).reshape(shape)
+
+    @property
+    def ptr(self):
+        return int(self._pointers[0])
+
+    @ptr.setter
+    def ptr(self, ptr):
+        self._pointers[0] = ptr
+
+    @property
+    def size(self):
+        return int(self._pointers[1])
+
+    @size.setter
+    def size(self, size):
+        self._pointers[1] = size
+
+    def _empty(self, field, shape, dtype):
+        assert (
+            os.getpid() == self._owner
+        ), "Shared storage must be allocated before forking."
+        return self._shared(shape, dtype)
+
+    def append(self, *args):
+        """Writes a single transition to storage and returns the slot it was written to.
+
+        :param *args: Variable length argument list. Contains transition elements in consistent order,
+            e.g. state, action, reward, next_state, done
+        """
+        with self._lock:
+            return super().append(*args)
+
+    def extend(self, *args):
+        """Writes a batch of transitions to storage and returns the slots written to.
+
+        :param *args: Variable length argument list. Contains batched transition elements in consistent order,
+            e.g. states, actions, rewards, next_states, dones
+        """
+        with self._lock:
+            return super().extend(*args)
+
+    def set_state(self, arrays, attrs):
+        """Restores storage state by copying arrays returned by get_state into shared memory.
+
+        :param arrays: Arrays holding the storage state, keyed by name
+        :type arrays: dict[str, numpy.ndarray]
+        :param attrs: Attributes holding the storage state
+        :type attrs: dict
+        """
+        with self._lock:
+            self.fields = None
+            if f"fields.{self.field_names[0]}" in arrays:
+                self.fields = {}
+                for field in self.field_names:
+                    array = arrays[f"fields.{field}"]
+                    self.fields[field] = self._empty(field, array.shape, array.dtype)
+                    _copy_rows(self.fields[field], array, 65536)
+            self.ptr, self.size = attrs["ptr"], attrs["size"]
+
+
+class DedupStorage(ArrayStorage):
+    """Array storage that keeps each observation once per environment stream. The state of
+    every transition is stored, and the next state is reconstructed at sample time from the
+    state of the following transition in the same stream. A next state is only stored
+    separately when it differs from the following state, e.g. after an environment reset,
+    or while the following transition has not been saved yet.
+
+    Streams are identified by position in a batch of vectorised transitions, with single
+    transitions belonging to stream 0. When frame_stack is set, states are stacks of frames
+    along their first axis and only the newest frame of each state is stored, with the
+    full stack reconstructed from preceding transitions in the stream.
+
+    :param max_size: Maximum number of transitions to store
+    :type max_size: int
+    :param field_names: Field names for stored transitions, must include 'state' and 'next_state'
+    :type field_names: list[str]
+    :param frame_stack: Number of stacked frames in each observation, defaults to None
+    :type frame_stack: int, optional
+    """
+
+    def __init__(self, max_size, field_names, frame_stack=None):
+        super().__init__(max_size, field_names)
+        assert (
+            "state" in field_names and "next_state" in field_names
+        ), "Deduplicated storage requires 'state' and 'next_state' fields."
+        assert (
+            frame_stack is None or frame_stack > 0
+        ), "Frame stack must be greater than zero."
+        self.frame_stack = frame_stack
+
+        # Slot whose state is this slot's next state, or -1
+        self.next_slot = np.full(max_size, -1, dtype=np.int64)
+        # Overflow index holding this slot's next state, or -1
+        self.next_overflow = np.full(max_size, -1, dtype=np.int64)
+        # Preceding slot in the same stream for frame stack reconstruction, or -1
+        self.prev_slot = np.full(max_size, -1, dtype=np.int64)
+        # Overflow index holding this slot's full frame stack, or -1
+        self.state_overflow = np.full(max_size, -1, dtype=np.int64)
+        # Whether next_state is state shifted by one frame
+        self.frame_shift = np.zeros(max_size, dtype=bool)
+        # Latest slot written for each stream, or -1
+        self.stream_last = np.full(1, -1, dtype=np.int64)
+
+        self.overflow = None
+        self.free = np.empty(0, dtype=np.int64)
+        self.n_free = 0
+
+    def __getitem__(self, idx):
+        """Returns experience stored at slot idx."""
+        if not -self.size <= idx < self.size:
+            raise IndexError("Storage index out of range.")
+        idx %= self.size
+        batch = self.gather([idx])
+        return self.experience(*(batch[field][0] for field in self.field_names))
+
+    def _allocate(self, *args):
+        """Allocates field arrays from a single (unbatched) transition."""
+        self.fields = {}
+        for field, value in zip(self.field_names, args):
+            if field == "next_state":
+                continue
+            shape = self._field_shape(value)
+            dtype = self._field_dtype(field, value)
+            if field == "state":
+                self.obs_shape = shape
+                self.obs_dtype = dtype
+                if self.frame_stack is not None:
+                    assert (
+                        shape[0] == self.frame_stack
+                    ), f"Expected {self.frame_stack} stacked frames, got state shape {shape}."
+                    shape = shape[1:]
+            self.fields[field] = self._empty(field, (self.max_size, *shape), dtype)
+        self.overflow = np.zeros((0, *self.obs_shape), dtype=self.obs_dtype)
+
+    def _overflow_alloc(self, values):
+        """Stores observations in overflow storage and returns their overflow indices."""
+        n = len(values)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        if self.n_free < n:
+            old_size = len(self.overflow)
+            new_size = max(2 * old_size, old_size + n, 64)
+            overflow = np.zeros((new_size, *self.obs_shape), dtype=self.obs_dtype)
+            overflow[:old_size] = self.overflow
+            self.overflow = overflow
+            free = np.empty(new_size, dtype=np.int64)
+            free[: self.n_free] = self.free[: self.n_free]
+            free[self.n_free : self.n_free + new_size - old_size] = np.arange(
+                new_size - 1, old_size - 1, -1
+            )
+            self.free = free
+            self.n_free += new_size - old_size
+
+        self.n_free -= n
+        idxs = self.free[self.n_free : self.n_free + n].copy()
+        self.overflow[idxs] = values
+        return idxs
+
+    def _overflow_release(self, idxs):
+        """Releases overflow indices, ignoring any that are -1."""
+        idxs = idxs[idxs >= 0]
+        self.free[self.n_free : self.n_free + len(idxs)] = idxs
+        self.n_free += len(idxs)
+
+    def _states(self, slots):
+        """Reconstructs full states stored at slots."""
+        slots = np.asarray(slots, dtype=np.int64)
+        if self.frame_stack is None:
+            return self.fields["state"][slots]
+
+        states = np.empty((len(slots), *self.obs_shape), dtype=self.obs_dtype)
+        rows = np.arange(len(slots))
+        current = slots.copy()
+        for i in range(self.frame_stack):
+            position = self.frame_stack - 1 - i
+            overflow = self.state_overflow[current]
+            full = overflow >= 0
+            if np.any(full):
+                states[rows[full], : position + 1] = self.overflow[overflow[full], i:]
+            rows, current = rows[~full], current[~full]
+            if len(rows) == 0:
+                break
+            states[rows, position] = self.fields["state"][current]
+            current = self.prev_slot[current]
+        return states
+
+    def _next_states(self, slots):
+        """Reconstructs next states of transitions stored at slots."""
+        slots = np.asarray(slots, dtype=np.int64)
+        next_slots = self.next_slot[slots]
+        linked = next_slots >= 0
+        next_states = np.empty((len(slots), *self.obs_shape), dtype=self.obs_dtype)
+        next_states[linked] = self._states(next_slots[linked])
+        next_states[~linked] = self.overflow[self.next_overflow[slots[~linked]]]
+        return next_states
+
+    def _release(self, slots):
+        """Releases bookkeeping of occupied slots that are about to be overwritten."""
+        if self.frame_stack is not None:
+            # Successors that reconstruct frames from overwritten slots keep a full stack
+            successors = self.next_slot[slots]
+            successors = successors[successors >= 0]
+            successors = successors[
+                (self.prev_slot[successors] >= 0)
+                & ~np.isin(successors, slots)
+                & np.isin(self.prev_slot[successors], slots)
+            ]
+            if len(successors) > 0:
+                self.state_overflow[successors] = self._overflow_alloc(
+                    self._states(successors)
+                )
+                self.prev_slot[successors] = -1
+
+        self._overflow_release(self.next_overflow[slots])
+        self._overflow_release(self.state_overflow[slots])
+        self.next_overflow[slots] = -1
+        self.state_overflow[slots] = -1
+        self.next_slot[slots] = -1
+        self.prev_slot[slots] = -1
+        self.stream_last[np.isin(self.stream_last, slots)] = -1
+
+    def append(self, *args):
+        """Writes a single transition to storage as stream 0 and returns the slot it was
+        written to.
+
+        :param *args: Variable length argument list. Contains transition elements in consistent order,
+            e.g. state, action, reward, next_state, done
+        """
+        return int(self.extend(*(np.expand_dims(arg, 0) for arg in args))[0])
+
+    def extend(self, *args):
+        """Writes a batch of transitions to storage, one per stream, and returns the slots
+        written to.
+
+        :param *args: Variable length argument list. Contains batched transition elements in consistent order,
+            e.g. states, actions, rewards, next_states, dones
+        """
+        args = [np.asarray(arg) for arg in args]
+        n = len(args[0])
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        if self.fields is None:
+            self._allocate(*(arg[0] for arg in args))
+        if n > len(self.stream_last):
+            stream_last = np.full(n, -1, dtype=np.int64)
+            stream_last[: len(self.stream_last)] = self.stream_last
+            self.stream_last = stream_last
+
+        # Only the most recent max_size transitions can survive a write larger than storage
+        streams = np.arange(n)
+        if n > self.max_size:
+            self._release(np.arange(self.size))
+            self._advance(n - self.max_size)
+            args = [arg[-self.max_size :] for arg in args]
+            streams = streams[-self.max_size :]
+            n = self.max_size
+
+        transition = dict(zip(self.field_names, args))
+        # Compare observations at storage precision
+        states = np.reshape(transition["state"], (n, *self.obs_shape)).astype(
+            self.overflow.dtype
+        )
+        next_states = np.reshape(transition["next_state"], (n, *self.obs_shape)).astype(
+            self.overflow.dtype
+        )
+
+        slots = (self.ptr + np.arange(n)) % self.max_size
+        occupied = slots[slots < self.size]
+        if len(occupied) > 0:
+            self._release(occupied)
+
+        # Link previous transitions whose next state is this state
+        prev = self.stream_last[streams]
+        candidates = np.flatnonzero(prev >= 0)
+        pending = self.overflow[self.next_overflow[prev[candidates]]]
+        linked = candidates[_rows_equal(pending, states[candidates])]
+        prev_linked = prev[linked]
+        self._overflow_release(self.next_overflow[prev_linked])
+        self.next_overflow[prev_linked] = -1
+        self.next_slot[prev_linked] = slots[linked]
+
+        if self.frame_stack is not None:
+            # Frames can be reconstructed from the previous transition if its next
+            # state was its state shifted by one frame
+            stacked = linked[self.frame_shift[prev_linked]]
+            self.prev_slot[slots[stacked]] = prev[stacked]
+            full = np.ones(n, dtype=bool)
+            full[stacked] = False
+            self.state_overflow[slots[full]] = self._overflow_alloc(states[full])
+            self.frame_shift[slots] = _rows_equal(states[:, 1:], next_states[:, :-1])
+            self.fields["state"][slots] = states[:, -1]
+        else:
+            self.fields["state"][slots] = states
+
+        self.next_overflow[slots] = self._overflow_alloc(next_states)
+        for field, value in transition.items():
+            if field in ["state", "next_state"]:
+                continue
+            array = self.fields[field]
+            array[slots] = np.reshape(value, (n, *array.shape[1:]))
+
+        self.stream_last[streams] = slots
+        self._advance(n)
+        return slots
+
+    def gather(self, idxs):
+        """Returns dictionary of field arrays gathered at the given slots, with states and
+        next states reconstructed.
+
+        :param idxs: Slot indices to gather
+        :type idxs: list[int] or numpy.ndarray
+        """
+        idxs = np.asarray(idxs, dtype=np.int64)
+        batch = {}
+        for field in self.field_names:
+            if field == "state":
+                batch[field] = self._states(idxs)
+            elif field == "next_state":
+                batch[field] = self._next_states(idxs)
+            else:
+                batch[field] = self.fields[field][idxs]
+        return batch
+
+    _STATE_ARRAYS = [
+        "next_slot",
+        "next_overflow",
+        "prev_slot",
+        "state_overflow",
+        "frame_shift",
+        "stream_last",
+        "free",
+    ]
+
+    def get_state(self):
+        """Returns arrays and JSON-serialisable attributes holding the storage state."""
+        arrays, attrs = super().get_state()
+        for name in self._STATE_ARRAYS:
+            arrays[name] = getattr(self, name)
+        attrs["n_free"] = int(self.n_free)
+        if self.overflow is not None:
+            arrays["overflow"] = self.overflow
+            attrs["obs_shape"] = list(self.obs_shape)
+            attrs["obs_dtype"] = self.obs_dtype.str
+        return arrays, attrs
+
+    def set_state(self, arrays, attrs):
+        """Restores storage state from arrays and attributes returned by get_state.
+
+        :param arrays: Arrays holding the storage state, keyed by name
+        :type arrays: dict[str, numpy.ndarray]
+        :param attrs: Attributes holding the storage state
+        :type attrs: dict
+        """
+        super().set_state(arrays, attrs)
+        for name in self._STATE_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.n_free = attrs["n_free"]
+        if "overflow" in arrays:
+            self.overflow = arrays["overflow"]
+            self.obs_shape = tuple(attrs["obs_shape"])
+            self.obs_dtype = np.dtype(attrs["obs_dtype"])
+
+
+class HDF5Storage:
+    """Read-only storage that samples transitions straight from an offline HDF5 dataset,
+    such as one created by ``MinariToAgileDataset``, so that datasets larger than RAM can
+    be trained on without being copied into a buffer first. Field names map in order to
+    the 'observations', 'actions', 'rewards', 'next_observations' and 'terminals'
+    datasets. Without 'next_observations', the next state of each transition is the
+    following observation, as when filling a buffer from the dataset.
+
+    Indices are read in sorted order. Chunked datasets are read one HDF5 chunk at a time,
+    so each chunk is decoded once per batch, and recently used chunks are kept in an LRU
+    cache. Random sampling touches most chunks of a dataset, so small chunks, or a cache
+    large enough to hold the most frequently sampled part of the dataset, work best.
+    Uncompressed contiguous datasets are memory-mapped, so the OS page cache holds recently
+    sampled rows.
+
+    :param max_size: Maximum number of transitions to sample from
+    :type max_size: int
+    :param field_names: Field names for stored transitions, e.g. ['state', 'action', 'reward']
+    :type field_names: list[str]
+    :param dataset: HDF5 dataset or path to an HDF5 file, defaults to None
+    :type dataset: h5py.File or str, optional
+    :param swap_channels: Swap image channels dimension from last to first
+        [H, W, C] -> [C, H, W], defaults to False
+    :type swap_channels: bool, optional
+    :param cache_bytes: Maximum size of decoded chunks to cache in bytes, defaults to 512 MiB
+    :type cache_bytes: int, optional
+    """
+
+    _KEYS = ("observations", "actions", "rewards", "next_observations", "terminals")
+
+    def __init__(
+        self,
+        max_size,
+        field_names,
+        dataset=None,
+        swap_channels=False,
+        cache_bytes=512 * 2**20,
+    ):
+        assert max_size > 0, "Max size must be greater than zero."
+        assert (
+            len(field_names) == 5
+        ), "HDF5 storage requires five field names, e.g. state, action, reward, next_state, done."
+        assert cache_bytes >= 0, "Cache size must be non-negative."
+
+        self.max_size = max_size
+        self.field_names = field_names
+        self.cache_bytes = cache_bytes
+        self.dataset = None
+        self.size = 0
+        self.hits = 0  # Chunk reads served from cache
+        self.misses = 0  # Reads from file
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        if dataset is not None:
+            self.open(dataset, swap_channels)
+
+    def __len__(self):
+        return self.size
+
+    def open(self, dataset, swap_channels=False):
+        """Opens an HDF5 dataset to sample transitions from.
+
+        :param dataset: HDF5 dataset or path to an HDF5 file
+        :type dataset: h5py.File or str
+        :param swap_channels: Swap image channels dimension from last to first
+            [H, W, C] -> [C, H, W], defaults to False
+        :type swap_channels: bool, optional
+        """
+        self.filename = dataset if isinstance(dataset, str) else dataset.file.filename
+        self.dataset = h5py.File(dataset, "r") if isinstance(dataset, str) else dataset
+        self.swap_channels = swap_channels
+        self._pid = os.getpid()
+        self._cache.clear()
+        self._cached_bytes = 0
+        self._mmaps = {}
+        for key in self._KEYS:
+            if key in self.dataset:
+                data = self.dataset[key]
+                offset = data.id.get_offset()
+                if data.chunks is None and offset is not None:
+                    self._mmaps[key] = np.memmap(
+                        self.filename,
+                        dtype=data.dtype,
+                        mode="r",
+                        offset=offset,
+                        shape=data.shape,
+                    )
+
+        self.next_key = (
+            "next_observations" if "next_observations" in self.dataset else None
+        )
+        length = self.dataset["rewards"].shape[0]
+        if self.next_key is None:
+            # The final observation only serves as a next state
+            length -= 1
+        self.size = min(length, self.max_size)
+
+    def _chunk(self, key, chunk_id, rows):
+        """Returns decoded chunk of a dataset, from the cache if possible."""
+        cache_key = (key, chunk_id)
+        chunk = self._cache.get(cache_key)
+        if chunk is not None:
+            self._cache.move_to_end(cache_key)
+            self.hits += 1
+            return chunk
+        self.misses += 1
+        chunk = self.dataset[key][chunk_id * rows : (chunk_id + 1) * rows]
+        self._cache[cache_key] = chunk
+        self._cached_bytes += chunk.nbytes
+        while self._cached_bytes > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted.nbytes
+        return chunk
+
+    def _read(self, key, idxs):
+        """Returns rows of a dataset at sorted indices, reading each chunk once."""
+        if key in self._mmaps:
+            return self._mmaps[key][idxs]
+        data = self.dataset[key]
+        if data.chunks is None:
+            # Contiguous datasets without a file offset, e.g. held in memory, are read directly
+            unique_idxs, inverse = np.unique(idxs, return_inverse=True)
+            self.misses += 1
+            return data[unique_idxs][inverse]
+
+        rows = data.chunks[0]
+        chunk_ids = idxs // rows
+        unique_ids, starts = np.unique(chunk_ids, return_index=True)
+        ends = np.append(starts[1:], len(idxs))
+        out = np.empty((len(idxs), *data.shape[1:]), dtype=data.dtype)
+        for chunk_id, start, end in zip(unique_ids, starts, ends):
+            chunk = self._chunk(key, int(chunk_id), rows)
+            out[start:end] = chunk[idxs[start:end] - chunk_id * rows]
+        return out
+
+    def gather(self, idxs):
+        """Returns dictionary of field arrays read at the given indices.
+
+        :param idxs: Transition indices to gather
+        :type idxs: list[int] or numpy.ndarray
+        """
+        if os.getpid() != self._pid:
+            # HDF5 file handles are not safe to share with forked processes
+            self.open(self.filename, self.swap_channels)
+
+        idxs = np.asarray(idxs, dtype=np.int64)
+        order = np.argsort(idxs)
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        sorted_idxs = idxs[order]
+
+        batch = {}
+        for field, key in zip(self.field_names, self._KEYS):
+            if key == "next_observations" and self.next_key is None:
+                values = self._read("observations", sorted_idxs + 1)
+            else:
+                values = self._read(key, sorted_idxs)
+            if key in ("observations", "next_observations") and self.swap_channels:
+                values = np.moveaxis(values, [-1], [-3])
+            if values.ndim == 1:
+                values = values[:, None]
+            batch[field] = values[inverse]
+        return batch
+
+    def append(self, *args):
+        raise TypeError("HDF5 storage is read-only.")
+
+    def extend(self, *args):
+        raise TypeError("HDF5 storage is read-only.")
+
+    def get_state(self):
+        raise TypeError(
+            "HDF5 storage cannot be saved, its transitions are kept in the dataset file."
+        )
+
+
+class MultiAgentArrayStorage(ArrayStorage):
+    """Columnar ring-buffer storage for multi-agent replay buffers. Each field of each agent
+    is kept in its own preallocated NumPy array of shape (max_size, *field_shape), so that
+    transitions passed as dictionaries keyed by agent id are written with one slice
+    assignment per (field, agent_id) and gathered with one index array shared by all agents.
+
+    :param max_size: Maximum number of transitions to store
+    :type max_size: int
+    :param field_names: Field names for stored transitions, e.g. ['state', 'action', 'reward']
+    :type field_names: list[str]
+    :param agent_ids: Names of all agents that will act in the environment
+    :type agent_ids: list[str]
+    """
+
+    def __init__(self, max_size, field_names, agent_ids):
+        super().__init__(max_size, field_names)
+        assert len(agent_ids) > 0, "Agent ids must contain at least one agent id."
+        self.agent_ids = agent_ids
+
+    def __getitem__(self, idx):
+        """Returns experience stored at slot idx, with each field as a dictionary of views
+        into storage keyed by agent id."""
+        if not -self.size <= idx < self.size:
+            raise IndexError("Storage index out of range.")
+        idx %= self.size
+        return self.experience(
+            *(
+                {
+                    agent_id: self.fields[field][agent_id][idx]
+                    for agent_id in self.agent_ids
+                }
+                for field in self.field_names
+            )
+        )
+
+    def _allocate(self, *args):
+        """Allocates one array per (field, agent_id) from a single (unbatched) transition."""
+        self.fields = {
+            field: {
+                agent_id: self._empty(
+                    field,
+                    (self.max_size, *self._field_shape(value[agent_id])),
+                    self._field_dtype(field, value[agent_id]),
+                )
+                for agent_id in self.agent_ids
+            }
+            for field, value in zip(self.field_names, args)
+        }
+
+    def append(self, *args):
+        """Writes a single transition to storage and returns the slot it was written to.
+
+        :param *args: Variable length argument list. Contains transition elements as dictionaries
+            keyed by agent id in consistent order, e.g. state, action, reward, next_state, done
+        """
+        if self.fields is None:
+            self._allocate(*args)
+
+        idx = self.ptr
+        for field, value in zip(self.field_names, args):
+            for agent_id, array in self.fields[field].items():
+                array[idx] = np.reshape(value[agent_id], array.shape[1:])
+        self._advance(1)
+        return idx
+
+    def extend(self, *args):
+        """Writes a batch of transitions to storage with one slice assignment per
+        (field, agent_id) and returns the slots written to.
+
+        :param *args: Variable length argument list. Contains batched transition elements as
+            dictionaries keyed by agent id in consistent order, e.g. states, actions, rewards,
+            next_states, dones
+        """
+        args = [
+            {agent_id: np.asarray(value) for agent_id, value in arg.items()}
+            for arg in args
+        ]
+        n = len(args[0][self.agent_ids[0]])
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        if self.fields is None:
+            self._allocate(
+                *(
+                    {agent_id: value[0] for agent_id, value in arg.items()}
+                    for arg in args
+                )
+            )
+
+        # Only the most recent max_size transitions can survive a write larger than storage
+        offset = 0
+        if n > self.max_size:
+            self._advance(n - self.max_size)
+            offset = n - self.max_size
+            n = self.max_size
+
+        start = self.ptr
+        if start + n <= self.max_size:
+            idxs = slice(start, start + n)
+        else:
+            idxs = (start + np.arange(n)) % self.max_size
+        for field, value in zip(self.field_names, args):
+            for agent_id, array in self.fields[field].items():
+                array[idxs] = np.reshape(
+                    value[agent_id][offset:], (n, *array.shape[1:])
+                )
+        self._advance(n)
+        return np.arange(start, start + n) % self.max_size
+
+    def gather(self, idxs):
+        """Returns dictionary of field dictionaries, keyed by agent id, of arrays gathered at
+        the given slots.
+
+        :param idxs: Slot indices to gather
+        :type idxs: list[int] or numpy.ndarray
+        """
+        idxs = np.asarray(idxs, dtype=np.int64)
+        return {
+            field: {
+                agent_id: array[idxs] for agent_id, array in self.fields[field].items()
+            }
+            for field in self.field_names
+        }
+
+    def get_state(self):
+        """Returns arrays and JSON-serialisable attributes holding the storage state."""
+        arrays = {}
+        if self.fields is not None:
+            for field, agent_arrays in self.fields.items():
+                for agent_id, array in agent_arrays.items():
+                    arrays[f"fields.{field}.{agent_id}"] = array
+        return arrays, {"ptr": int(self.ptr), "size": int(self.size)}
+
+    def set_state(self, arrays, attrs):
+        """Restores storage state from arrays and attributes returned by get_state.
+
+        :param arrays: Arrays holding the storage state, keyed by name
+        :type arrays: dict[str, numpy.ndarray]
+        :param attrs: Attributes holding the storage state
+        :type attrs: dict
+        """
+        self.fields = None
+        if any(name.startswith("fields.") for name in arrays):
+            self.fields = {
+                field: {
+                    agent_id: arrays[f"fields.{field}.{agent_id}"]
+                    for agent_id in self.agent_ids
+                }
+                for field in self.field_names
+            }
+        self.ptr, self.size = attrs["ptr"], attrs["size"]
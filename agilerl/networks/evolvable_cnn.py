@@ -493,9 +493,13 @@ class EvolvableCNN(nn.Module):
         :type q: bool, optional
         """
         if not isinstance(x, torch.Tensor):
-            x = torch.FloatTensor(x)
+            x = np.asarray(x)
+            if x.dtype == np.float64:
+                x = x.astype(np.float32)
+            x = torch.from_numpy(x)
             x = x.to(self.device)
 
+        # Inputs, e.g. uint8 frames, are cast and normalized once on the network's device
         if x.dtype != torch.float32:
             x = x.type(torch.float32)
 
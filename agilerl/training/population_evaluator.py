@@ -0,0 +1,208 @@
+import multiprocessing
+import queue
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait
+
+import numpy as np
+import torch
+
+from agilerl.training.population_executor import _seed_everything
+
+
+def _env_seed(seed, idx, count):
+    """Returns the seed an evaluation environment is reset with before testing the
+    population member at index idx, in the evaluation call count."""
+    return int(np.random.SeedSequence([seed, idx, count]).generate_state(1)[0])
+
+
+def _evaluator_worker(make_env, pipe, seed):
+    """Worker process. Evaluates the population members it is sent with agent.test in its
+    own environment, and sends back their fitnesses and evaluation times."""
+    torch.set_num_threads(1)
+    env = None
+    try:
+        env = make_env()
+        while True:
+            command, data = pipe.recv()
+            if command == "test":
+                idx, count, agent, test_kwargs = data
+                env_seed = _seed_everything(seed, idx, count)
+                env.reset(seed=env_seed)
+                start = time.perf_counter()
+                fitness = agent.test(env, **test_kwargs)
+                pipe.send(("ok", (idx, fitness, time.perf_counter() - start)))
+            elif command == "close":
+                break
+    except Exception:
+        pipe.send(("error", traceback.format_exc()))
+    finally:
+        if env is not None:
+            env.close()
+
+
+class PopulationEvaluator:
+    """Evaluates the fitness of population members concurrently, each with agent.test in
+    one of a pool of pre-built evaluation environments.
+
+    With the "thread" backend, environments are built in the training process and members
+    are tested in a thread pool, which overlaps environment stepping that releases the
+    GIL, e.g. vectorized environments stepping in subprocesses, and network forward passes.
+    With the "process" backend, worker processes are forked the first time the population
+    is evaluated, each building its own environment, and members are sent to free workers
+    to be tested, so that evaluation runs on as many CPU cores as there are workers. Only
+    fitnesses are sent back, and appended to each member's fitness.
+
+    Environments are reset with a seed drawn from the evaluator seed, the member's position
+    in the population and the number of evaluations before each test, so that fitnesses do
+    not depend on which environment a member is tested in. With the "process" backend,
+    Python, NumPy and PyTorch random number generators are also reseeded, so that
+    evaluation is reproducible for a given seed.
+
+    :param make_env: Function returning a new evaluation environment. Environments can be
+        vectorized.
+    :type make_env: callable
+    :param num_workers: Number of workers and evaluation environments, defaults to None
+        (one for each population member)
+    :type num_workers: int, optional
+    :param backend: Evaluate members in a pool of threads ("thread") or processes
+        ("process"), defaults to "thread"
+    :type backend: str, optional
+    :param seed: Base seed for evaluation environments, defaults to None (drawn from
+        NumPy's global random state)
+    :type seed: int, optional
+    """
+
+    def __init__(self, make_env, num_workers=None, backend="thread", seed=None):
+        assert callable(
+            make_env
+        ), "'make_env' must be a function returning an environment."
+        if num_workers is not None:
+            assert (
+                isinstance(num_workers, int) and num_workers > 0
+            ), "Number of workers must be a positive integer."
+        assert backend in [
+            "thread",
+            "process",
+        ], "Evaluation backend must be 'thread' or 'process'."
+        self.make_env = make_env
+        self.num_workers = num_workers
+        self.backend = backend
+        self.seed = seed
+        self.envs = queue.Queue()
+        self.num_envs = 0
+        self.pool = None
+        self.pool_size = 0
+        self.pipes = []
+        self.processes = []
+        self.count = 0
+        self.eval_times = []
+
+    def evaluate(self, pop, **test_kwargs):
+        """Evaluates every member of the population with agent.test and returns their
+        fitnesses. The time taken to evaluate each member is recorded in eval_times.
+
+        :param pop: Population of agents
+        :type pop: list[object]
+        :param **test_kwargs: Arguments of agent.test, e.g. swap_channels, max_steps and loop
+        """
+        if self.seed is None:
+            self.seed = int(np.random.randint(2**31))
+        num_workers = min(self.num_workers or len(pop), len(pop))
+        if self.backend == "thread":
+            results = self._evaluate_threads(pop, num_workers, test_kwargs)
+        else:
+            results = self._evaluate_processes(pop, num_workers, test_kwargs)
+        self.count += 1
+        self.eval_times = [eval_time for _, eval_time in results]
+        return [fitness for fitness, _ in results]
+
+    def close(self):
+        """Stops the worker threads and processes and closes the evaluation environments."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        while not self.envs.empty():
+            self.envs.get().close()
+        self.num_envs = 0
+        for pipe in self.pipes:
+            try:
+                pipe.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+            pipe.close()
+        for process in self.processes:
+            process.join()
+        self.pipes, self.processes = [], []
+
+    def _evaluate_threads(self, pop, num_workers, test_kwargs):
+        """Tests population members in a thread pool, each thread taking a free environment."""
+        while self.num_envs < num_workers:
+            self.envs.put(self.make_env())
+            self.num_envs += 1
+        if self.pool is None or self.pool_size < num_workers:
+            if self.pool is not None:
+                self.pool.shutdown()
+            self.pool = ThreadPoolExecutor(max_workers=num_workers)
+            self.pool_size = num_workers
+
+        def test(idx, agent):
+            env = self.envs.get()
+            try:
+                env.reset(seed=_env_seed(self.seed, idx, self.count))
+                start = time.perf_counter()
+                fitness = agent.test(env, **test_kwargs)
+                return fitness, time.perf_counter() - start
+            finally:
+                self.envs.put(env)
+
+        futures = [self.pool.submit(test, idx, agent) for idx, agent in enumerate(pop)]
+        return [future.result() for future in futures]
+
+    def _evaluate_processes(self, pop, num_workers, test_kwargs):
+        """Sends population members to free worker processes until all have been tested."""
+        assert all(
+            torch.device(getattr(agent, "device", "cpu")).type == "cpu" for agent in pop
+        ), "Evaluation in worker processes requires agents on the CPU."
+        ctx = multiprocessing.get_context("fork")
+        while len(self.pipes) < num_workers:
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_evaluator_worker,
+                args=(self.make_env, child_pipe, self.seed),
+                daemon=True,
+            )
+            process.start()
+            child_pipe.close()
+            self.pipes.append(parent_pipe)
+            self.processes.append(process)
+
+        results = [None] * len(pop)
+        pending = list(enumerate(pop))[::-1]
+        busy = []
+        for pipe in self.pipes[:num_workers]:
+            if not pending:
+                break
+            self._send(pipe, pending.pop(), test_kwargs)
+            busy.append(pipe)
+        while busy:
+            for pipe in wait(busy):
+                status, result = pipe.recv()
+                if status == "error":
+                    self.close()
+                    raise RuntimeError(f"Evaluation worker failed:\n{result}")
+                idx, fitness, eval_time = result
+                # The member was tested on a copy, so its fitness is recorded here
+                pop[idx].fitness.append(fitness)
+                results[idx] = (fitness, eval_time)
+                if pending:
+                    self._send(pipe, pending.pop(), test_kwargs)
+                else:
+                    busy.remove(pipe)
+        return results
+
+    def _send(self, pipe, item, test_kwargs):
+        """Sends a population member and its position to a worker process to be tested."""
+        idx, agent = item
+        pipe.send(("test", (idx, self.count, agent, test_kwargs)))
@@ -0,0 +1,175 @@
+import multiprocessing
+import random
+import traceback
+
+import numpy as np
+import torch
+
+
+def _seed_everything(seed, slot, count):
+    """Seeds Python, NumPy and PyTorch random number generators from a base seed, a
+    population slot and the number of calls made for that slot."""
+    seed = int(np.random.SeedSequence([seed, slot, count]).generate_state(1)[0])
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    return seed
+
+
+def _population_worker(slot, make_env, run_episode, pipe, seed):
+    """Worker process. Trains and evaluates the population member of its slot in its own
+    environment, and sends back its scores, fitness and weights."""
+    torch.set_num_threads(1)
+    env, agent = None, None
+    try:
+        env = make_env()
+        env.reset(seed=_seed_everything(seed, slot, 0))
+        count = 1
+
+        while True:
+            command, data = pipe.recv()
+            if command == "set":
+                agent = data
+                pipe.send(("ok", None))
+            elif command == "run":
+                _seed_everything(seed, slot, count)
+                count += 1
+                pipe.send(("ok", run_episode(agent, env, *data)))
+            elif command == "get":
+                if data is not None:
+                    _seed_everything(seed, slot, count)
+                    count += 1
+                    agent.test(env, **data)
+                pipe.send(("ok", agent))
+            elif command == "close":
+                break
+    except Exception:
+        pipe.send(("error", traceback.format_exc()))
+    finally:
+        if env is not None:
+            env.close()
+
+
+class PopulationExecutor:
+    """Trains population members in parallel, each in its own worker process with its own
+    copy of the environment and replay buffer.
+
+    Workers are forked from the training function when it starts, so that they inherit its
+    state, including the filled replay buffer for offline training. Each worker keeps the
+    member of its population slot between evolution steps, and only scores, fitnesses
+    and the agents themselves, with their network weights, are sent back to the training
+    function for tournament selection and mutation. Random number generators are reseeded
+    from the executor seed, the slot and the episode before each episode and evaluation,
+    so that training is reproducible for a given seed.
+
+    Experiences stay in each slot's replay buffer, so members no longer learn from each
+    other's experiences, and agents must be kept on the CPU.
+
+    :param make_env: Function returning a new environment, called once for each population
+        slot in its worker. Environments can be vectorized.
+    :type make_env: callable
+    :param seed: Base seed for workers, defaults to None (drawn from NumPy's global random
+        state)
+    :type seed: int, optional
+    """
+
+    def __init__(self, make_env, seed=None):
+        assert callable(
+            make_env
+        ), "'make_env' must be a function returning an environment."
+        self.make_env = make_env
+        self.seed = seed
+        self.pipes = []
+        self.processes = []
+        self._send_pop = True
+
+    def start(self, run_episode, pop):
+        """Forks one worker process for each population member.
+
+        :param run_episode: Function training an agent for one episode in an environment,
+            called as run_episode(agent, env, *args), returning its score, or None if no
+            episode is played, and number of steps
+        :type run_episode: callable
+        :param pop: Population of agents
+        :type pop: list[object]
+        """
+        assert all(
+            torch.device(getattr(agent, "device", "cpu")).type == "cpu" for agent in pop
+        ), "Parallel population training requires agents on the CPU."
+        self.close()
+        if self.seed is None:
+            self.seed = int(np.random.randint(2**31))
+        ctx = multiprocessing.get_context("fork")
+        for slot in range(len(pop)):
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_population_worker,
+                args=(
+                    slot,
+                    self.make_env,
+                    run_episode,
+                    child_pipe,
+                    self.seed,
+                ),
+                daemon=True,
+            )
+            process.start()
+            child_pipe.close()
+            self.pipes.append(parent_pipe)
+            self.processes.append(process)
+        self._send_pop = True
+
+    def run(self, pop, *args):
+        """Trains every member of the population for one episode in the workers, recording
+        their scores and steps, and returns the total number of steps.
+
+        :param pop: Population of agents
+        :type pop: list[object]
+        """
+        if self._send_pop:
+            # Members may have been selected or mutated since they were last sent
+            self._request("set", pop)
+            self._send_pop = False
+
+        total_steps = 0
+        for agent, (score, steps) in zip(pop, self._request("run", [args] * len(pop))):
+            if score is not None:
+                agent.scores.append(score)
+            agent.steps[-1] += steps
+            total_steps += steps
+        return total_steps
+
+    def sync(self, pop, **test_kwargs):
+        """Returns the population trained in the workers, after evaluating each member with
+        agent.test in its own environment if test arguments are given.
+
+        :param pop: Population of agents
+        :type pop: list[object]
+        :param **test_kwargs: Arguments of agent.test, e.g. swap_channels, max_steps and loop
+        """
+        pop = self._request("get", [test_kwargs or None] * len(pop))
+        self._send_pop = True
+        return pop
+
+    def close(self):
+        """Stops the worker processes."""
+        for pipe in self.pipes:
+            try:
+                pipe.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+            pipe.close()
+        for process in self.processes:
+            process.join()
+        self.pipes, self.processes = [], []
+
+    def _request(self, command, data):
+        """Sends a command with one data item to each worker and returns their results."""
+        for pipe, item in zip(self.pipes, data):
+            pipe.send((command, item))
+        replies = [pipe.recv() for pipe in self.pipes]
+        for status, result in replies:
+            if status == "error":
+                self.close()
+                raise RuntimeError(f"Population worker failed:\n{result}")
+        return [result for _, result in replies]
@@ -7,9 +7,12 @@ import wandb
 from torch.utils.data import DataLoader
 from tqdm import trange
 
+from agilerl.components.replay_buffer import ShardedPrioritizedReplayBuffer
 from agilerl.components.replay_data import ReplayDataset
 from agilerl.components.sampler import Sampler
+from agilerl.utils.phase_timer import PhaseTimer
 from agilerl.utils.utils import calculate_vectorized_scores
+from agilerl.utils.vector_envs import AsyncStepper
 
 
 def train(
@@ -37,12 +40,18 @@ def train(
     mutation=None,
     checkpoint=None,
     checkpoint_path=None,
+    save_memory=False,
     save_elite=False,
     elite_path=None,
     wb=False,
     verbose=True,
     accelerator=None,
     wandb_api_key=None,
+    prefetch=0,
+    overlap=False,
+    executor=None,
+    evaluator=None,
+    profile=False,
 ):
     """The general online RL training function. Returns trained population of agents
     and their fitnesses.
@@ -82,7 +91,8 @@ def train(
     :type target: float, optional
     :param n_step: Use multi-step experience replay buffer, defaults to False
     :type n_step: bool, optional
-    :param per: Using prioritized experience replay buffer, defaults to False
+    :param per: Using prioritized experience replay buffer, with distributed training memory should
+        be a ShardedPrioritizedReplayBuffer to sample from the experiences of all processes, defaults to False
     :type per: bool, optional
     :param noisy: Using noisy network exploration, defaults to False
     :type noisy: bool, optional
@@ -97,6 +107,9 @@ def train(
     :type checkpoint: int, optional
     :param checkpoint_path: Location to save checkpoint, defaults to None
     :type checkpoint_path: str, optional
+    :param save_memory: Save replay buffers alongside each checkpoint, overwriting the previous
+        snapshot, so that training can be resumed by loading them, defaults to False
+    :type save_memory: bool, optional
     :param save_elite: Boolean flag indicating whether to save elite member at the end
         of training, defaults to False
     :type save_elite: bool, optional
@@ -110,6 +123,25 @@ def train(
     :type accelerator: accelerate.Accelerator(), optional
     :param wandb_api_key: API key for Weights & Biases, defaults to None
     :type wandb_api_key: str, optional
+    :param prefetch: Number of replay batches to assemble in a background thread while
+        the agent acts and learns, defaults to 0 (no prefetching)
+    :type prefetch: int, optional
+    :param overlap: Run each learning update while the environment steps, between
+        env.step_async and env.step_wait. Updates are delayed by one step, so that they
+        learn from the experiences saved before the step, and transitions are saved in the
+        same order, defaults to False
+    :type overlap: bool, optional
+    :param executor: Train population members in parallel worker processes, each with its
+        own environment and copy of the replay buffer, defaults to None
+    :type executor: agilerl.training.population_executor.PopulationExecutor(), optional
+    :param evaluator: Evaluate the fitness of population members concurrently, each in its
+        own evaluation environment, instead of one after another in env, defaults to None
+    :type evaluator: agilerl.training.population_evaluator.PopulationEvaluator(), optional
+    :param profile: Time each phase of training, e.g. action selection, environment
+        steps, sampling and learning, and report environment steps and updates per
+        second and the share of time spent in each phase at each evolution step.
+        Phases run in the workers of an executor are not timed, defaults to False
+    :type profile: bool, optional
     """
     assert isinstance(
         algo, str
@@ -126,6 +158,16 @@ def train(
         ), "Target score must be a float or an integer."
     assert isinstance(n_step, bool), "'n_step' must be a boolean."
     assert isinstance(per, bool), "'per' must be a boolean."
+    if executor is not None:
+        assert (
+            accelerator is None
+        ), "Parallel population training is not supported with distributed training."
+        assert (
+            not save_memory
+        ), "Replay buffers stay in the workers with parallel population training."
+        assert (
+            evaluator is None
+        ), "Population members are already evaluated in their workers with an executor."
     if checkpoint is not None:
         assert isinstance(checkpoint, int), "Checkpoint must be an integer."
     assert isinstance(
@@ -213,8 +255,10 @@ def train(
     # Detect if environment is vectorised
     if hasattr(env, "num_envs"):
         is_vectorised = True
+        num_envs = env.num_envs
     else:
         is_vectorised = False
+        num_envs = 1
 
     save_path = (
         checkpoint_path.split(".pt")[0]
@@ -224,7 +268,25 @@ def train(
         )
     )
 
-    if accelerator is not None:
+    n_step_sampler = None
+    if accelerator is not None and per:
+        # Prioritized replay samples from the buffer directly, which is sharded across
+        # processes when it is a ShardedPrioritizedReplayBuffer
+        if not isinstance(memory, ShardedPrioritizedReplayBuffer):
+            warnings.warn(
+                "Distributed prioritized replay without a ShardedPrioritizedReplayBuffer, "
+                "each process will only sample its own experiences."
+            )
+        else:
+            assert (
+                n_step_memory is None
+            ), "Multi-step memory is not supported with a sharded replay buffer."
+        sampler = Sampler(distributed=False, per=per, memory=memory)
+        if n_step_memory is not None:
+            n_step_sampler = Sampler(
+                distributed=False, n_step=True, memory=n_step_memory
+            )
+    elif accelerator is not None:
         # Create dataloader from replay buffer
         replay_dataset = ReplayDataset(memory, pop[0].batch_size)
         replay_dataloader = DataLoader(replay_dataset, batch_size=None)
@@ -233,7 +295,14 @@ def train(
             distributed=True, dataset=replay_dataset, dataloader=replay_dataloader
         )
     else:
-        sampler = Sampler(distributed=False, per=per, memory=memory)
+        # Prefetched batches are moved to the agents' device in the background thread
+        sampler = Sampler(
+            distributed=False,
+            per=per,
+            memory=memory,
+            prefetch=prefetch,
+            device=getattr(pop[0], "device", None),
+        )
         if n_step_memory is not None:
             n_step_sampler = Sampler(
                 distributed=False, n_step=True, memory=n_step_memory
@@ -260,35 +329,44 @@ def train(
 
     pop_fitnesses = []
     total_steps = 0
-
-    # Pre-training mutation
-    if accelerator is None:
-        if mutation is not None:
-            pop = mutation.mutation(pop, pre_training_mut=True)
-
-    # RL training loop
-    for idx_epi in pbar:
-        if accelerator is not None:
-            accelerator.wait_for_everyone()
-        for agent in pop:  # Loop through population
-            state = env.reset()[0]  # Reset environment at start of episode
-            rewards, terminations, truncs = [], [], []
-            score = 0
-            for idx_step in range(max_steps):
-                if swap_channels:
-                    state = np.moveaxis(state, [-1], [-3])
-                # Get next action from agent
+    timer = PhaseTimer(enabled=profile)
+
+    def run_episode(agent, env, epsilon):
+        """Trains an agent for one episode, returning its score and number of steps."""
+        # Steps environment in its workers, or a background thread, while agent learns
+        stepper = AsyncStepper(env) if overlap else None
+        state = env.reset()[0]  # Reset environment at start of episode
+        rewards, terminations, truncs = [], [], []
+        score = 0
+        learn_pending = False
+        for idx_step in range(max_steps):
+            if swap_channels:
+                state = np.moveaxis(state, [-1], [-3])
+            # Get next action from agent
+            with timer.phase("action"):
                 if noisy:
                     action = agent.getAction(state)
                 else:
                     action = agent.getAction(state, epsilon)
-                if not is_vectorised:
-                    action = action[0]
-                next_state, reward, done, trunc, _ = env.step(
-                    action
-                )  # Act in environment
+            if not is_vectorised:
+                action = action[0]
+            if overlap:
+                with timer.phase("env_step"):
+                    stepper.step_async(action)
+                # Learn from experiences saved before this step while env steps
+                if learn_pending:
+                    _learn(agent, sampler, n_step_sampler, n_step, per, timer)
+                    learn_pending = False
+                with timer.phase("env_step"):
+                    next_state, reward, done, trunc, _ = stepper.step_wait()
+            else:
+                with timer.phase("env_step"):
+                    next_state, reward, done, trunc, _ = env.step(
+                        action
+                    )  # Act in environment
 
-                # Save experience to replay buffer
+            # Save experience to replay buffer
+            with timer.phase("buffer"), sampler.lock:
                 if n_step_memory is not None:
                     if swap_channels:
                         one_step_transition = n_step_memory.save2memoryVectEnvs(
@@ -328,51 +406,65 @@ def train(
                             is_vectorised=is_vectorised,
                         )
 
-                if per:
-                    fraction = min((idx_step + 1) / max_steps, 1.0)
-                    agent.beta += fraction * (1.0 - agent.beta)
-
-                # Learn according to learning frequency
-                if (
-                    memory.counter % agent.learn_step == 0
-                    and len(memory) >= agent.batch_size
-                ):
-                    # Sample replay buffer
-                    # Learn according to agent's RL algorithm
-                    if per:
-                        experiences = sampler.sample(agent.batch_size, agent.beta)
-                        if n_step_memory is not None:
-                            n_step_experiences = n_step_sampler.sample(experiences[6])
-                            experiences += n_step_experiences
-                        idxs, priorities = agent.learn(
-                            experiences, n_step=n_step, per=per
-                        )
-                        memory.update_priorities(idxs, priorities)
-                    else:
-                        experiences = sampler.sample(agent.batch_size)
-                        if n_step:
-                            agent.learn(experiences, n_step=n_step)
-                        else:
-                            agent.learn(experiences)
-
-                if is_vectorised:
-                    terminations.append(done)
-                    rewards.append(reward)
-                    truncs.append(trunc)
+            if per:
+                fraction = min((idx_step + 1) / max_steps, 1.0)
+                agent.beta += fraction * (1.0 - agent.beta)
+
+            # Learn according to learning frequency
+            if (
+                memory.counter % agent.learn_step == 0
+                and len(memory) >= agent.batch_size
+            ):
+                if overlap:
+                    learn_pending = True
                 else:
-                    score += reward
-                state = next_state
+                    _learn(agent, sampler, n_step_sampler, n_step, per, timer)
 
             if is_vectorised:
-                scores = calculate_vectorized_scores(
-                    np.array(rewards), np.array(terminations)
-                )
-                score = np.mean(scores)
+                terminations.append(done)
+                rewards.append(reward)
+                truncs.append(trunc)
+            else:
+                score += reward
+            state = next_state
+
+        if learn_pending:
+            _learn(agent, sampler, n_step_sampler, n_step, per, timer)
+
+        if is_vectorised:
+            scores = calculate_vectorized_scores(
+                np.array(rewards), np.array(terminations)
+            )
+            score = np.mean(scores)
+
+        agent.scores.append(score)
 
-            agent.scores.append(score)
+        agent.steps[-1] += max_steps
+        if stepper is not None:
+            stepper.close()
+        return score, max_steps
 
-            agent.steps[-1] += max_steps
-            total_steps += max_steps
+    # Pre-training mutation
+    if accelerator is None:
+        if mutation is not None:
+            pop = mutation.mutation(pop, pre_training_mut=True)
+
+    if executor is not None:
+        executor.start(run_episode, pop)
+
+    # RL training loop
+    for idx_epi in pbar:
+        if accelerator is not None:
+            accelerator.wait_for_everyone()
+        if executor is not None:
+            steps = executor.run(pop, epsilon)
+            total_steps += steps
+            timer.count("env_steps", steps * num_envs)
+        else:
+            for agent in pop:  # Loop through population
+                _, steps = run_episode(agent, env, epsilon)
+                total_steps += steps
+                timer.count("env_steps", steps * num_envs)
 
         # Update epsilon for exploration
         epsilon = max(eps_end, epsilon * eps_decay)
@@ -380,14 +472,38 @@ def train(
         # Now evolve if necessary
         if (idx_epi + 1) % evo_epochs == 0:
             # Evaluate population
-            fitnesses = [
-                agent.test(
-                    env, swap_channels=swap_channels, max_steps=max_steps, loop=evo_loop
-                )
-                for agent in pop
-            ]
+            with timer.phase("eval"):
+                if executor is not None:
+                    pop = executor.sync(
+                        pop,
+                        swap_channels=swap_channels,
+                        max_steps=max_steps,
+                        loop=evo_loop,
+                    )
+                    fitnesses = [agent.fitness[-1] for agent in pop]
+                elif evaluator is not None:
+                    fitnesses = evaluator.evaluate(
+                        pop,
+                        swap_channels=swap_channels,
+                        max_steps=max_steps,
+                        loop=evo_loop,
+                    )
+                else:
+                    fitnesses = [
+                        agent.test(
+                            env,
+                            swap_channels=swap_channels,
+                            max_steps=max_steps,
+                            loop=evo_loop,
+                        )
+                        for agent in pop
+                    ]
             pop_fitnesses.append(fitnesses)
 
+            # Throughput since the last evolution step
+            throughput = timer.summary()
+            timer.reset()
+
             mean_scores = np.mean([agent.scores[-evo_epochs:] for agent in pop], axis=1)
 
             if wb:
@@ -401,6 +517,7 @@ def train(
                                 "train/mean_score": np.mean(mean_scores),
                                 "eval/mean_fitness": np.mean(fitnesses),
                                 "eval/best_fitness": np.max(fitnesses),
+                                **throughput,
                             }
                         )
                     accelerator.wait_for_everyone()
@@ -411,6 +528,7 @@ def train(
                             "train/mean_score": np.mean(mean_scores),
                             "eval/mean_fitness": np.mean(fitnesses),
                             "eval/best_fitness": np.max(fitnesses),
+                            **throughput,
                         }
                     )
 
@@ -427,6 +545,11 @@ def train(
             ):
                 if wb:
                     wandb.finish()
+                sampler.close()
+                if executor is not None:
+                    executor.close()
+                if evaluator is not None:
+                    evaluator.close()
                 return pop, pop_fitnesses
 
             # Tournament selection and population mutation
@@ -437,8 +560,10 @@ def train(
                         model.unwrap_models()
                     accelerator.wait_for_everyone()
                     if accelerator.is_main_process:
-                        elite, pop = tournament.select(pop)
-                        pop = mutation.mutation(pop)
+                        with timer.phase("tournament"):
+                            elite, pop = tournament.select(pop)
+                        with timer.phase("mutation"):
+                            pop = mutation.mutation(pop)
                         for pop_i, model in enumerate(pop):
                             model.saveCheckpoint(
                                 f"{accel_temp_models_path}/{algo}_{pop_i}.pt"
@@ -453,8 +578,10 @@ def train(
                     for model in pop:
                         model.wrap_models()
                 else:
-                    elite, pop = tournament.select(pop)
-                    pop = mutation.mutation(pop)
+                    with timer.phase("tournament"):
+                        elite, pop = tournament.select(pop)
+                    with timer.phase("mutation"):
+                        pop = mutation.mutation(pop)
 
                 if save_elite and (idx_epi + 1 == n_episodes):
                     elite_save_path = (
@@ -487,27 +614,53 @@ def train(
                     """,
                     end="\r",
                 )
+                if evaluator is not None:
+                    eval_times = [
+                        "%.2f" % eval_time for eval_time in evaluator.eval_times
+                    ]
+                    print(f"Eval times (s):\t\t{eval_times}", end="\r")
+                if sampler.prefetch > 0:
+                    print(
+                        f"Sampler waits:\t\t{sampler.waits}/{sampler.requests}",
+                        end="\r",
+                    )
+
+            if profile:
+                print(f"Throughput:\t\t{PhaseTimer.format(throughput)}", end="\r")
 
         # Save model checkpoint
         if checkpoint is not None:
             if (idx_epi + 1) % checkpoint == 0:
-                if accelerator is not None:
-                    accelerator.wait_for_everyone()
-                    for model in pop:
-                        model.unwrap_models()
-                    accelerator.wait_for_everyone()
-                    if accelerator.is_main_process:
+                with timer.phase("checkpoint"):
+                    if accelerator is not None:
+                        accelerator.wait_for_everyone()
+                        for model in pop:
+                            model.unwrap_models()
+                        accelerator.wait_for_everyone()
+                        if accelerator.is_main_process:
+                            for i, agent in enumerate(pop):
+                                agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
+                            print("Saved checkpoint.")
+                        if save_memory:
+                            # Each process collects its own experiences
+                            memory.save(
+                                f"{save_path}_memory_{accelerator.process_index}"
+                            )
+                        accelerator.wait_for_everyone()
+                        for model in pop:
+                            model.wrap_models()
+                        accelerator.wait_for_everyone()
+                    else:
+                        if executor is not None:
+                            pop = executor.sync(pop)
                         for i, agent in enumerate(pop):
                             agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
+                        if save_memory:
+                            with sampler.lock:
+                                memory.save(f"{save_path}_memory")
+                                if n_step_memory is not None:
+                                    n_step_memory.save(f"{save_path}_n_step_memory")
                         print("Saved checkpoint.")
-                    accelerator.wait_for_everyone()
-                    for model in pop:
-                        model.wrap_models()
-                    accelerator.wait_for_everyone()
-                else:
-                    for i, agent in enumerate(pop):
-                        agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
-                    print("Saved checkpoint.")
 
     if wb:
         if accelerator is not None:
@@ -518,4 +671,34 @@ def train(
         else:
             wandb.finish()
 
+    sampler.close()
+    if executor is not None:
+        executor.close()
+    if evaluator is not None:
+        evaluator.close()
     return pop, pop_fitnesses
+
+
+def _learn(agent, sampler, n_step_sampler=None, n_step=False, per=False, timer=None):
+    """Samples replay buffer and learns according to agent's RL algorithm."""
+    if timer is None:
+        timer = PhaseTimer()
+    if per:
+        with timer.phase("sample"):
+            experiences = sampler.sample(agent.batch_size, agent.beta)
+            if n_step_sampler is not None:
+                n_step_experiences = n_step_sampler.sample(experiences[6])
+                experiences += n_step_experiences
+        with timer.phase("learn"):
+            idxs, priorities = agent.learn(experiences, n_step=n_step, per=per)
+        with timer.phase("buffer"):
+            sampler.update_priorities(idxs, priorities)
+    else:
+        with timer.phase("sample"):
+            experiences = sampler.sample(agent.batch_size)
+        with timer.phase("learn"):
+            if n_step:
+                agent.learn(experiences, n_step=n_step)
+            else:
+                agent.learn(experiences)
+    timer.count("updates")
@@ -0,0 +1,550 @@
+import multiprocessing
+import queue
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+import torch
+import wandb
+from tqdm import trange
+
+from agilerl.components.replay_buffer import (
+    MultiStepReplayBuffer,
+    PrioritizedReplayBuffer,
+)
+from agilerl.components.sampler import Sampler
+from agilerl.training.population_executor import _seed_everything
+from agilerl.utils.utils import calculate_vectorized_scores
+
+
+def _receive(inbox, pop):
+    """Applies population and weight updates sent by the learner to an actor's population,
+    returning the updated population."""
+    while True:
+        try:
+            kind, payload = inbox.get_nowait()
+        except queue.Empty:
+            return pop
+        if kind == "pop":
+            pop = payload
+        else:
+            for agent, state_dict in zip(pop, payload):
+                agent.actor.load_state_dict(state_dict)
+
+
+def _actor_loop(
+    actor_id,
+    make_env,
+    pop,
+    memory,
+    inbox,
+    results,
+    env_steps,
+    stop,
+    swap_channels,
+    max_steps,
+    noisy,
+    eps_start,
+    eps_end,
+    eps_decay,
+    seed,
+):
+    """Actor process. Acts in its own environment with each member of its copy of the
+    population in turn, for max_steps steps at a time, writing experiences to shared memory
+    and reporting the score of each member's episode to the learner."""
+    # Forked processes inherit the learner's random state, so each actor is reseeded from
+    # the base seed and its id
+    env_seed = _seed_everything(seed, actor_id, 0)
+    torch.set_num_threads(1)
+    # Unread results are dropped instead of blocking exit
+    results.cancel_join_thread()
+
+    env = make_env()
+    env.reset(seed=env_seed)
+    is_vectorised = hasattr(env, "num_envs")
+    num_envs = env.num_envs if is_vectorised else 1
+    epsilon = eps_start
+    episode = 0
+    while not stop.is_set():
+        pop = _receive(inbox, pop)
+        agent = pop[(actor_id + episode) % len(pop)]
+        state = env.reset()[0]
+        rewards, terminations = [], []
+        score = 0
+        for idx_step in range(max_steps):
+            if stop.is_set():
+                break
+            pop = _receive(inbox, pop)
+            # Members received in a population update act from the next step on
+            agent = pop[(actor_id + episode) % len(pop)]
+            if swap_channels:
+                state = np.moveaxis(state, [-1], [-3])
+            with torch.no_grad():
+                if noisy:
+                    action = agent.getAction(state)
+                else:
+                    action = agent.getAction(state, epsilon)
+            if not is_vectorised:
+                action = action[0]
+            next_state, reward, done, trunc, _ = env.step(action)
+
+            if swap_channels:
+                next_state_stored = np.moveaxis(next_state, [-1], [-3])
+            else:
+                next_state_stored = next_state
+            memory.save2memory(
+                state,
+                action,
+                reward,
+                next_state_stored,
+                done,
+                is_vectorised=is_vectorised,
+            )
+            with env_steps.get_lock():
+                env_steps.value += num_envs
+
+            if is_vectorised:
+                terminations.append(done)
+                rewards.append(reward)
+            else:
+                score += reward
+                if done or trunc:
+                    next_state = env.reset()[0]
+            state = next_state
+        else:
+            if is_vectorised:
+                scores = calculate_vectorized_scores(
+                    np.array(rewards), np.array(terminations)
+                )
+                score = np.mean(scores)
+            results.put((agent.index, score, max_steps))
+        epsilon = max(eps_end, epsilon * eps_decay)
+        episode += 1
+
+
+def _broadcast(inboxes, kind, payload):
+    """Sends a population or weight update to every actor."""
+    for inbox in inboxes:
+        inbox.put((kind, payload))
+
+
+def _actor_weights(pop):
+    """Returns a copy of the policy network weights of each population member."""
+    return [
+        {key: value.detach().clone() for key, value in agent.actor.state_dict().items()}
+        for agent in pop
+    ]
+
+
+def train_actor_learner(
+    make_env,
+    env_name,
+    algo,
+    pop,
+    memory,
+    INIT_HP=None,
+    MUT_P=None,
+    swap_channels=False,
+    n_episodes=2000,
+    max_steps=500,
+    evo_epochs=5,
+    evo_loop=1,
+    eps_start=1.0,
+    eps_end=0.1,
+    eps_decay=0.995,
+    target=200.0,
+    noisy=False,
+    tournament=None,
+    mutation=None,
+    checkpoint=None,
+    checkpoint_path=None,
+    save_elite=False,
+    elite_path=None,
+    wb=False,
+    verbose=True,
+    wandb_api_key=None,
+    num_actors=2,
+    sync_freq=100,
+    seed=None,
+):
+    """Ape-X style off-policy RL training function, with acting and learning in separate
+    processes. Returns trained population of agents and their fitnesses.
+
+    Actor processes each step their own environment, acting with every member of a copy of
+    the population in turn and writing experiences to a replay buffer in shared memory.
+    The learner process, which calls this function, continuously samples from the replay
+    buffer and updates the population, sending new policy weights to the actors every
+    sync_freq learning steps and the whole population after each evolution step, so that
+    actors pick up tournament selection and mutations. Each epoch, every member of the
+    population performs max_steps learning steps.
+
+    Actors are started by forking the learner, so this function is only supported on
+    platforms with the 'fork' start method, and agents must be kept on the CPU.
+
+    :param make_env: Function returning a new environment to train in, called once in each actor
+        process and once by the learner for evaluation. Environments can be vectorized.
+    :type make_env: callable
+    :param env_name: Environment name
+    :type env_name: str
+    :param algo: RL algorithm name
+    :type algo: str
+    :param pop: Population of agents
+    :type pop: list[object]
+    :param memory: Experience Replay Buffer, created with storage='shared'
+    :type memory: object
+    :param INIT_HP: Dictionary containing initial hyperparameters, defaults to None
+    :type INIT_HP: dict, optional
+    :param MUT_P: Dictionary containing mutation parameters, defaults to None
+    :type MUT_P: dict, optional
+    :param swap_channels: Swap image channels dimension from last to first
+        [H, W, C] -> [C, H, W], defaults to False
+    :type swap_channels: bool, optional
+    :param n_episodes: Maximum number of training epochs, defaults to 2000
+    :type n_episodes: int, optional
+    :param max_steps: Number of learning steps per population member each epoch, and number of
+        actor environment steps per episode, defaults to 500
+    :type max_steps: int, optional
+    :param evo_epochs: Evolution frequency (epochs), defaults to 5
+    :type evo_epochs: int, optional
+    :param evo_loop: Number of evaluation episodes, defaults to 1
+    :type evo_loop: int, optional
+    :param eps_start: Maximum exploration - initial epsilon value, defaults to 1.0
+    :type eps_start: float, optional
+    :param eps_end: Minimum exploration - final epsilon value, defaults to 0.1
+    :type eps_end: float, optional
+    :param eps_decay: Epsilon decay per actor episode, defaults to 0.995
+    :type eps_decay: float, optional
+    :param target: Target score for early stopping, defaults to 200.
+    :type target: float, optional
+    :param noisy: Using noisy network exploration, defaults to False
+    :type noisy: bool, optional
+    :param tournament: Tournament selection object, defaults to None
+    :type tournament: object, optional
+    :param mutation: Mutation object, defaults to None
+    :type mutation: object, optional
+    :param checkpoint: Checkpoint frequency (epochs), defaults to None
+    :type checkpoint: int, optional
+    :param checkpoint_path: Location to save checkpoint, defaults to None
+    :type checkpoint_path: str, optional
+    :param save_elite: Boolean flag indicating whether to save elite member at the end
+        of training, defaults to False
+    :type save_elite: bool, optional
+    :param elite_path: Location to save elite agent, defaults to None
+    :type elite_path: str, optional
+    :param wb: Weights & Biases tracking, defaults to False
+    :type wb: bool, optional
+    :param verbose: Display training stats, defaults to True
+    :type verbose: bool, optional
+    :param wandb_api_key: API key for Weights & Biases, defaults to None
+    :type wandb_api_key: str, optional
+    :param num_actors: Number of actor processes, defaults to 2
+    :type num_actors: int, optional
+    :param sync_freq: Number of learning steps between sending policy weights to actors,
+        defaults to 100
+    :type sync_freq: int, optional
+    :param seed: Base seed for actor processes, each seeded from the base seed and its
+        actor id, defaults to None (drawn from NumPy's global random state)
+    :type seed: int, optional
+    """
+    assert isinstance(
+        algo, str
+    ), "'algo' must be the name of the algorithm as a string."
+    assert callable(make_env), "'make_env' must be a function returning an environment."
+    assert isinstance(n_episodes, int), "Number of episodes must be an integer."
+    assert isinstance(max_steps, int), "Number of steps must be an integer."
+    assert isinstance(evo_epochs, int), "Evolution frequency must be an integer."
+    assert isinstance(eps_start, float), "Starting epsilon must be a float."
+    assert isinstance(eps_end, float), "Final value of epsilone must be a float."
+    assert isinstance(eps_decay, float), "Epsilon decay rate must be a float."
+    if target is not None:
+        assert isinstance(
+            target, (float, int)
+        ), "Target score must be a float or an integer."
+    if checkpoint is not None:
+        assert isinstance(checkpoint, int), "Checkpoint must be an integer."
+    assert isinstance(
+        wb, bool
+    ), "'wb' must be a boolean flag, indicating whether to record run with W&B"
+    assert isinstance(verbose, bool), "Verbose must be a boolean."
+    assert (
+        isinstance(num_actors, int) and num_actors > 0
+    ), "Number of actors must be a positive integer."
+    assert (
+        isinstance(sync_freq, int) and sync_freq > 0
+    ), "Sync frequency must be a positive integer."
+    assert (
+        getattr(memory, "storage", None) == "shared"
+    ), "Actor-learner training requires a replay buffer with storage='shared'."
+    assert not isinstance(
+        memory, (PrioritizedReplayBuffer, MultiStepReplayBuffer)
+    ), "Actor-learner training does not support prioritized or multi-step replay buffers."
+    assert all(
+        torch.device(agent.device).type == "cpu" for agent in pop
+    ), "Actor-learner training requires agents on the CPU."
+    if save_elite is False and elite_path is not None:
+        warnings.warn(
+            "'save_elite' set to False but 'elite_path' has been defined, elite will not\
+                      be saved unless 'save_elite' is set to True."
+        )
+    if checkpoint is None and checkpoint_path is not None:
+        warnings.warn(
+            "'checkpoint' set to None but 'checkpoint_path' has been defined, checkpoint will not\
+                      be saved unless 'checkpoint' is defined."
+        )
+
+    if wb:
+        if not hasattr(wandb, "api"):
+            if wandb_api_key is not None:
+                wandb.login(key=wandb_api_key)
+            else:
+                warnings.warn("Must login to wandb with API key.")
+
+        wandb.init(
+            # set the wandb project where this run will be logged
+            project="AgileRL",
+            name="{}-EvoHPO-{}-{}".format(
+                env_name, algo, datetime.now().strftime("%m%d%Y%H%M%S")
+            ),
+            # track hyperparameters and run metadata
+            config={
+                "algo": f"Evo HPO {algo}",
+                "env": env_name,
+                "batch_size": INIT_HP["BATCH_SIZE"] if INIT_HP else None,
+                "lr": INIT_HP["LR"] if INIT_HP else None,
+                "gamma": INIT_HP["GAMMA"] if INIT_HP else None,
+                "memory_size": INIT_HP["MEMORY_SIZE"] if INIT_HP else None,
+                "learn_step": INIT_HP["LEARN_STEP"] if INIT_HP else None,
+                "tau": INIT_HP["TAU"] if INIT_HP else None,
+                "pop_size": INIT_HP["POP_SIZE"] if INIT_HP else None,
+                "no_mut": MUT_P["NO_MUT"] if MUT_P else None,
+                "arch_mut": MUT_P["ARCH_MUT"] if MUT_P else None,
+                "params_mut": MUT_P["PARAMS_MUT"] if MUT_P else None,
+                "act_mut": MUT_P["ACT_MUT"] if MUT_P else None,
+                "rl_hp_mut": MUT_P["RL_HP_MUT"] if MUT_P else None,
+                "num_actors": num_actors,
+            },
+        )
+
+    save_path = (
+        checkpoint_path.split(".pt")[0]
+        if checkpoint_path is not None
+        else "{}-EvoHPO-{}-{}".format(
+            env_name, algo, datetime.now().strftime("%m%d%Y%H%M%S")
+        )
+    )
+
+    # Pre-training mutation
+    if mutation is not None:
+        pop = mutation.mutation(pop, pre_training_mut=True)
+
+    env = make_env()
+    is_vectorised = hasattr(env, "num_envs")
+
+    # Shared memory is allocated from one transition before actors are forked
+    if len(memory) == 0:
+        state = env.reset()[0]
+        if swap_channels:
+            state = np.moveaxis(state, [-1], [-3])
+        action = pop[0].getAction(state) if noisy else pop[0].getAction(state, 1.0)
+        if not is_vectorised:
+            action = action[0]
+        next_state, reward, done, _, _ = env.step(action)
+        if swap_channels:
+            next_state = np.moveaxis(next_state, [-1], [-3])
+        memory.save2memory(
+            state, action, reward, next_state, done, is_vectorised=is_vectorised
+        )
+
+    sampler = Sampler(distributed=False, memory=memory)
+
+    if seed is None:
+        seed = int(np.random.randint(2**31))
+    ctx = multiprocessing.get_context("fork")
+    stop = ctx.Event()
+    env_steps = ctx.Value("q", 0)
+    results = ctx.Queue()
+    inboxes = [ctx.Queue() for _ in range(num_actors)]
+    actors = [
+        ctx.Process(
+            target=_actor_loop,
+            args=(
+                actor_id,
+                make_env,
+                pop,
+                memory,
+                inboxes[actor_id],
+                results,
+                env_steps,
+                stop,
+                swap_channels,
+                max_steps,
+                noisy,
+                eps_start,
+                eps_end,
+                eps_decay,
+                seed,
+            ),
+            daemon=True,
+        )
+        for actor_id in range(num_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    def collect_results():
+        """Records episode scores and steps reported by actors."""
+        agents = {agent.index: agent for agent in pop}
+        while True:
+            try:
+                index, score, steps = results.get_nowait()
+            except queue.Empty:
+                return
+            if index in agents:
+                agents[index].scores.append(score)
+                agents[index].steps[-1] += steps
+
+    print("\nTraining...")
+
+    bar_format = "{l_bar}{bar:10}| {n:4}/{total_fmt} [{elapsed:>7}<{remaining:>7}, {rate_fmt}{postfix}]"
+    pbar = trange(n_episodes, unit="ep", bar_format=bar_format, ascii=True)
+
+    pop_fitnesses = []
+    updates = 0
+    start_time = time.time()
+
+    try:
+        # Wait for actors to fill memory with enough experiences to learn from
+        batch_size = max(agent.batch_size for agent in pop)
+        while len(memory) < batch_size:
+            assert any(
+                actor.is_alive() for actor in actors
+            ), "All actor processes have exited."
+            time.sleep(1e-3)
+
+        # RL training loop
+        for idx_epi in pbar:
+            for agent in pop:  # Loop through population
+                for idx_step in range(max_steps):
+                    experiences = sampler.sample(agent.batch_size)
+                    agent.learn(experiences)
+                    updates += 1
+                    if updates % sync_freq == 0:
+                        _broadcast(inboxes, "weights", _actor_weights(pop))
+            collect_results()
+
+            # Now evolve if necessary
+            if (idx_epi + 1) % evo_epochs == 0:
+                # Evaluate population
+                fitnesses = [
+                    agent.test(
+                        env,
+                        swap_channels=swap_channels,
+                        max_steps=max_steps,
+                        loop=evo_loop,
+                    )
+                    for agent in pop
+                ]
+                pop_fitnesses.append(fitnesses)
+
+                elapsed = time.time() - start_time
+                env_steps_per_sec = env_steps.value / elapsed
+                updates_per_sec = updates / elapsed
+                mean_scores = [
+                    np.mean(agent.scores[-evo_epochs:]) if agent.scores else np.nan
+                    for agent in pop
+                ]
+
+                if wb:
+                    wandb.log(
+                        {
+                            "global_step": env_steps.value,
+                            "train/mean_score": np.nanmean(mean_scores),
+                            "train/env_steps_per_sec": env_steps_per_sec,
+                            "train/updates_per_sec": updates_per_sec,
+                            "eval/mean_fitness": np.mean(fitnesses),
+                            "eval/best_fitness": np.max(fitnesses),
+                        }
+                    )
+
+                # Update step counter
+                for agent in pop:
+                    agent.steps.append(agent.steps[-1])
+
+                # Early stop if consistently reaches target
+                if (
+                    np.all(
+                        np.greater(
+                            [np.mean(agent.fitness[-100:]) for agent in pop], target
+                        )
+                    )
+                    and idx_epi >= 100
+                ):
+                    if wb:
+                        wandb.finish()
+                    return pop, pop_fitnesses
+
+                # Tournament selection and population mutation
+                if tournament and mutation is not None:
+                    elite, pop = tournament.select(pop)
+                    pop = mutation.mutation(pop)
+                    _broadcast(inboxes, "pop", pop)
+
+                    if save_elite and (idx_epi + 1 == n_episodes):
+                        elite_save_path = (
+                            elite_path.split(".pt")[0]
+                            if elite_path is not None
+                            else "{}-elite_{}-{}".format(
+                                env_name, algo, datetime.now().strftime("%m%d%Y%H%M%S")
+                            )
+                        )
+                        elite.saveCheckpoint(f"{elite_save_path}.pt")
+
+                if verbose:
+                    fitness = ["%.2f" % fitness for fitness in fitnesses]
+                    avg_fitness = [
+                        "%.2f" % np.mean(agent.fitness[-100:]) for agent in pop
+                    ]
+                    avg_score = [
+                        "%.2f" % np.mean(agent.scores[-100:]) if agent.scores else "nan"
+                        for agent in pop
+                    ]
+                    agents = [agent.index for agent in pop]
+                    num_steps = [agent.steps[-1] for agent in pop]
+                    muts = [agent.mut for agent in pop]
+                    pbar.update(0)
+
+                    print(
+                        f"""
+                        --- Epoch {idx_epi + 1} ---
+                        Fitness:\t\t{fitness}
+                        100 fitness avgs:\t{avg_fitness}
+                        100 score avgs:\t{avg_score}
+                        Agents:\t\t{agents}
+                        Steps:\t\t{num_steps}
+                        Mutations:\t\t{muts}
+                        Env steps/sec:\t{env_steps_per_sec:.1f}
+                        Updates/sec:\t{updates_per_sec:.1f}
+                        """,
+                        end="\r",
+                    )
+
+            # Save model checkpoint
+            if checkpoint is not None:
+                if (idx_epi + 1) % checkpoint == 0:
+                    for i, agent in enumerate(pop):
+                        agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
+                    print("Saved checkpoint.")
+
+        if wb:
+            wandb.finish()
+        return pop, pop_fitnesses
+
+    finally:
+        stop.set()
+        for inbox in inboxes:
+            inbox.cancel_join_thread()
+        for actor in actors:
+            actor.join(timeout=5)
+            if actor.is_alive():
+                actor.terminate()
@@ -9,6 +9,8 @@ from tqdm import trange
 
 from agilerl.components.replay_data import ReplayDataset
 from agilerl.components.sampler import Sampler
+from agilerl.utils.phase_timer import PhaseTimer
+from agilerl.utils.vector_envs import AsyncStepper
 
 
 def train_multi_agent(
@@ -39,6 +41,11 @@ def train_multi_agent(
     verbose=True,
     accelerator=None,
     wandb_api_key=None,
+    prefetch=0,
+    overlap=False,
+    executor=None,
+    evaluator=None,
+    profile=False,
 ):
     """The general online multi-agent RL training function. Returns trained population of agents
     and their fitnesses.
@@ -100,6 +107,25 @@ def train_multi_agent(
     :type accelerator: accelerate.Accelerator(), optional
     :param wandb_api_key: API key for Weights & Biases, defaults to None
     :type wandb_api_key: str, optional
+    :param prefetch: Number of replay batches to assemble in a background thread
+        while the agents act and learn, defaults to 0 (no prefetching)
+    :type prefetch: int, optional
+    :param overlap: Run each learning update while the environment steps, in its workers
+        or a background thread. Updates are delayed by one step, so that they learn from
+        the experiences saved before the step, and transitions are saved in the same
+        order, defaults to False
+    :type overlap: bool, optional
+    :param executor: Train population members in parallel worker processes, each with its
+        own environment and copy of the replay buffer, defaults to None
+    :type executor: agilerl.training.population_executor.PopulationExecutor(), optional
+    :param evaluator: Evaluate the fitness of population members concurrently, each in its
+        own evaluation environment, instead of one after another in env, defaults to None
+    :type evaluator: agilerl.training.population_evaluator.PopulationEvaluator(), optional
+    :param profile: Time each phase of training, e.g. action selection, environment
+        steps, sampling and learning, and report environment steps and updates per
+        second and the share of time spent in each phase at each evolution step.
+        Phases run in the workers of an executor are not timed, defaults to False
+    :type profile: bool, optional
     """
     assert isinstance(
         algo, str
@@ -120,6 +146,13 @@ def train_multi_agent(
         wb, bool
     ), "'wb' must be a boolean flag, indicating whether to record run with W&B"
     assert isinstance(verbose, bool), "Verbose must be a boolean."
+    if executor is not None:
+        assert (
+            accelerator is None
+        ), "Parallel population training is not supported with distributed training."
+        assert (
+            evaluator is None
+        ), "Population members are already evaluated in their workers with an executor."
     if save_elite is False and elite_path is not None:
         warnings.warn(
             "'save_elite' set to False but 'elite_path' has been defined, elite will not\
@@ -216,7 +249,13 @@ def train_multi_agent(
             distributed=True, dataset=replay_dataset, dataloader=replay_dataloader
         )
     else:
-        sampler = Sampler(distributed=False, memory=memory)
+        # Prefetched batches are moved to the agents' device in the background thread
+        sampler = Sampler(
+            distributed=False,
+            memory=memory,
+            prefetch=prefetch,
+            device=getattr(pop[0], "device", None),
+        )
 
     epsilon = eps_start
 
@@ -239,82 +278,120 @@ def train_multi_agent(
 
     pop_fitnesses = []
     total_steps = 0
+    timer = PhaseTimer(enabled=profile)
+
+    def run_episode(agent, env, epsilon):
+        """Trains an agent for one episode, returning its score and number of steps."""
+        # Steps environment in its workers, or a background thread, while agent learns
+        stepper = AsyncStepper(env) if overlap else None
+        state, info = env.reset()  # Reset environment at start of episode
+        agent_reward = {agent_id: 0 for agent_id in env.agents}
+        if swap_channels:
+            state = {
+                agent_id: np.moveaxis(np.expand_dims(s, 0), [3], [1])
+                for agent_id, s in state.items()
+            }
+
+        steps = 0
+        learn_pending = False
+        for _ in range(max_steps):
+            steps += 1
+            # Get next action from agent
+            agent_mask = info["agent_mask"] if "agent_mask" in info.keys() else None
+            env_defined_actions = (
+                info["env_defined_actions"]
+                if "env_defined_actions" in info.keys()
+                else None
+            )
+            with timer.phase("action"):
+                cont_actions, discrete_action = agent.getAction(
+                    state, epsilon, agent_mask, env_defined_actions
+                )
+            if agent.discrete_actions:
+                action = discrete_action
+            else:
+                action = cont_actions
+            if overlap:
+                with timer.phase("env_step"):
+                    stepper.step_async(action)
+                # Learn from experiences saved before this step while env steps
+                if learn_pending:
+                    _learn(agent, sampler, timer)
+                    learn_pending = False
+                with timer.phase("env_step"):
+                    next_state, reward, done, truncation, info = stepper.step_wait()
+            else:
+                with timer.phase("env_step"):
+                    next_state, reward, done, truncation, info = env.step(
+                        action
+                    )  # Act in environment
 
-    # Pre-training mutation
-    if accelerator is None:
-        if mutation is not None:
-            pop = mutation.mutation(pop, pre_training_mut=True)
-
-    # RL training loop
-    for idx_epi in pbar:
-        if accelerator is not None:
-            accelerator.wait_for_everyone()
-        for agent in pop:  # Loop through population
-            state, info = env.reset()  # Reset environment at start of episode
-            agent_reward = {agent_id: 0 for agent_id in env.agents}
+            # Save experience to replay buffer
             if swap_channels:
-                state = {
-                    agent_id: np.moveaxis(np.expand_dims(s, 0), [3], [1])
-                    for agent_id, s in state.items()
+                state = {agent_id: np.squeeze(s) for agent_id, s in state.items()}
+                next_state = {
+                    agent_id: np.moveaxis(ns, [2], [0])
+                    for agent_id, ns in next_state.items()
                 }
 
-            for _ in range(max_steps):
-                total_steps += 1
-                # Get next action from agent
-                agent_mask = info["agent_mask"] if "agent_mask" in info.keys() else None
-                env_defined_actions = (
-                    info["env_defined_actions"]
-                    if "env_defined_actions" in info.keys()
-                    else None
-                )
-                cont_actions, discrete_action = agent.getAction(
-                    state, epsilon, agent_mask, env_defined_actions
-                )
-                if agent.discrete_actions:
-                    action = discrete_action
-                else:
-                    action = cont_actions
-                next_state, reward, done, truncation, info = env.step(
-                    action
-                )  # Act in environment
-
-                # Save experience to replay buffer
-                if swap_channels:
-                    state = {agent_id: np.squeeze(s) for agent_id, s in state.items()}
-                    next_state = {
-                        agent_id: np.moveaxis(ns, [2], [0])
-                        for agent_id, ns in next_state.items()
-                    }
-
-                if any(truncation.values()) or any(done.values()):
-                    break
+            if any(truncation.values()) or any(done.values()):
+                break
 
+            with timer.phase("buffer"), sampler.lock:
                 memory.save2memory(state, cont_actions, reward, next_state, done)
 
-                for agent_id, r in reward.items():
-                    agent_reward[agent_id] += r
+            for agent_id, r in reward.items():
+                agent_reward[agent_id] += r
+
+            # Learn according to learning frequency
+            if (memory.counter % agent.learn_step == 0) and (
+                len(memory) >= agent.batch_size
+            ):
+                if overlap:
+                    learn_pending = True
+                else:
+                    _learn(agent, sampler, timer)
+
+            # Update the state
+            if swap_channels:
+                next_state = {
+                    agent_id: np.expand_dims(ns, 0)
+                    for agent_id, ns in next_state.items()
+                }
+            state = next_state
+
+        if learn_pending:
+            _learn(agent, sampler, timer)
+
+        score = sum(agent_reward.values())
+        agent.scores.append(score)
 
-                # Learn according to learning frequency
-                if (memory.counter % agent.learn_step == 0) and (
-                    len(memory) >= agent.batch_size
-                ):
-                    # Sample replay buffer
-                    experiences = sampler.sample(agent.batch_size)
-                    # Learn according to agent's RL algorithm
-                    agent.learn(experiences)
+        agent.steps[-1] += steps
+        if stepper is not None:
+            stepper.close()
+        return score, steps
 
-                # Update the state
-                if swap_channels:
-                    next_state = {
-                        agent_id: np.expand_dims(ns, 0)
-                        for agent_id, ns in next_state.items()
-                    }
-                state = next_state
+    # Pre-training mutation
+    if accelerator is None:
+        if mutation is not None:
+            pop = mutation.mutation(pop, pre_training_mut=True)
 
-            score = sum(agent_reward.values())
-            agent.scores.append(score)
+    if executor is not None:
+        executor.start(run_episode, pop)
 
-            agent.steps[-1] += total_steps
+    # RL training loop
+    for idx_epi in pbar:
+        if accelerator is not None:
+            accelerator.wait_for_everyone()
+        if executor is not None:
+            steps = executor.run(pop, epsilon)
+            total_steps += steps
+            timer.count("env_steps", steps)
+        else:
+            for agent in pop:  # Loop through population
+                _, steps = run_episode(agent, env, epsilon)
+                total_steps += steps
+                timer.count("env_steps", steps)
 
         # Update epsilon for exploration
         epsilon = max(eps_end, epsilon * eps_decay)
@@ -322,14 +399,38 @@ def train_multi_agent(
         # Now evolve if necessary
         if (idx_epi + 1) % evo_epochs == 0:
             # Evaluate population
-            fitnesses = [
-                agent.test(
-                    env, swap_channels=swap_channels, max_steps=max_steps, loop=evo_loop
-                )
-                for agent in pop
-            ]
+            with timer.phase("eval"):
+                if executor is not None:
+                    pop = executor.sync(
+                        pop,
+                        swap_channels=swap_channels,
+                        max_steps=max_steps,
+                        loop=evo_loop,
+                    )
+                    fitnesses = [agent.fitness[-1] for agent in pop]
+                elif evaluator is not None:
+                    fitnesses = evaluator.evaluate(
+                        pop,
+                        swap_channels=swap_channels,
+                        max_steps=max_steps,
+                        loop=evo_loop,
+                    )
+                else:
+                    fitnesses = [
+                        agent.test(
+                            env,
+                            swap_channels=swap_channels,
+                            max_steps=max_steps,
+                            loop=evo_loop,
+                        )
+                        for agent in pop
+                    ]
             pop_fitnesses.append(fitnesses)
 
+            # Throughput since the last evolution step
+            throughput = timer.summary()
+            timer.reset()
+
             mean_scores = np.mean([agent.scores[-20:] for agent in pop], axis=1)
 
             if wb:
@@ -346,6 +447,7 @@ def train_multi_agent(
                                 ),
                                 "eval/mean_fitness": np.mean(fitnesses),
                                 "eval/best_fitness": np.max(fitnesses),
+                                **throughput,
                             }
                         )
                     accelerator.wait_for_everyone()
@@ -359,6 +461,7 @@ def train_multi_agent(
                             ),
                             "eval/mean_fitness": np.mean(fitnesses),
                             "eval/best_fitness": np.max(fitnesses),
+                            **throughput,
                         }
                     )
 
@@ -385,6 +488,11 @@ def train_multi_agent(
             ):
                 if wb:
                     wandb.finish()
+                sampler.close()
+                if executor is not None:
+                    executor.close()
+                if evaluator is not None:
+                    evaluator.close()
                 return pop, pop_fitnesses
 
             # Tournament selection and population mutation
@@ -395,8 +503,10 @@ def train_multi_agent(
                         model.unwrap_models()
                     accelerator.wait_for_everyone()
                     if accelerator.is_main_process:
-                        elite, pop = tournament.select(pop)
-                        pop = mutation.mutation(pop)
+                        with timer.phase("tournament"):
+                            elite, pop = tournament.select(pop)
+                        with timer.phase("mutation"):
+                            pop = mutation.mutation(pop)
                         for pop_i, model in enumerate(pop):
                             model.saveCheckpoint(
                                 f"{accel_temp_models_path}/{algo}_{pop_i}.pt"
@@ -411,8 +521,10 @@ def train_multi_agent(
                     for model in pop:
                         model.wrap_models()
                 else:
-                    elite, pop = tournament.select(pop)
-                    pop = mutation.mutation(pop)
+                    with timer.phase("tournament"):
+                        elite, pop = tournament.select(pop)
+                    with timer.phase("mutation"):
+                        pop = mutation.mutation(pop)
 
                 if save_elite and (idx_epi + 1 == n_episodes):
                     elite_save_path = (
@@ -445,27 +557,43 @@ def train_multi_agent(
                     """,
                     end="\r",
                 )
+                if evaluator is not None:
+                    eval_times = [
+                        "%.2f" % eval_time for eval_time in evaluator.eval_times
+                    ]
+                    print(f"Eval times (s):\t\t{eval_times}", end="\r")
+                if sampler.prefetch > 0:
+                    print(
+                        f"Sampler waits:\t\t{sampler.waits}/{sampler.requests}",
+                        end="\r",
+                    )
+
+            if profile:
+                print(f"Throughput:\t\t{PhaseTimer.format(throughput)}", end="\r")
 
         # Save model checkpoint
         if checkpoint is not None:
             if (idx_epi + 1) % checkpoint == 0:
-                if accelerator is not None:
-                    accelerator.wait_for_everyone()
-                    for model in pop:
-                        model.unwrap_models()
-                    accelerator.wait_for_everyone()
-                    if accelerator.is_main_process:
+                with timer.phase("checkpoint"):
+                    if accelerator is not None:
+                        accelerator.wait_for_everyone()
+                        for model in pop:
+                            model.unwrap_models()
+                        accelerator.wait_for_everyone()
+                        if accelerator.is_main_process:
+                            for i, agent in enumerate(pop):
+                                agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
+                            print("Saved checkpoint.")
+                        accelerator.wait_for_everyone()
+                        for model in pop:
+                            model.wrap_models()
+                        accelerator.wait_for_everyone()
+                    else:
+                        if executor is not None:
+                            pop = executor.sync(pop)
                         for i, agent in enumerate(pop):
                             agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
                         print("Saved checkpoint.")
-                    accelerator.wait_for_everyone()
-                    for model in pop:
-                        model.wrap_models()
-                    accelerator.wait_for_everyone()
-                else:
-                    for i, agent in enumerate(pop):
-                        agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
-                    print("Saved checkpoint.")
 
     if wb:
         if accelerator is not None:
@@ -476,4 +604,18 @@ def train_multi_agent(
         else:
             wandb.finish()
 
+    sampler.close()
+    if executor is not None:
+        executor.close()
+    if evaluator is not None:
+        evaluator.close()
     return pop, pop_fitnesses
+
+
+def _learn(agent, sampler, timer):
+    """Samples replay buffer and learns according to agent's RL algorithm."""
+    with timer.phase("sample"):
+        experiences = sampler.sample(agent.batch_size)
+    with timer.phase("learn"):
+        agent.learn(experiences)
+    timer.count("updates")
@@ -9,7 +9,47 @@ from tqdm import trange
 
 from agilerl.components.replay_data import ReplayDataset
 from agilerl.components.sampler import Sampler
-from agilerl.utils.minari_utils import MinariToAgileBuffer
+from agilerl.utils.minari_utils import (
+    MinariToAgileBuffer,
+    MinariToAgileDataset,
+    agile_dataset_path,
+)
+from agilerl.utils.phase_timer import PhaseTimer
+
+
+def _fill_memory(dataset, memory, swap_channels=False, chunk_size=65536):
+    """Fills replay buffer with the transitions of an h5py-style dataset, reading and
+    writing chunks of chunk_size transitions at a time. The next state of each transition
+    is the following observation, so the final observation only serves as a next state.
+
+    :param dataset: Offline RL dataset with 'observations', 'actions', 'rewards' and 'terminals'
+    :type dataset: h5py-style dataset
+    :param memory: Experience Replay Buffer
+    :type memory: object
+    :param swap_channels: Swap image channels dimension from last to first [H, W, C] -> [C, H, W], defaults to False
+    :type swap_channels: bool, optional
+    :param chunk_size: Number of transitions read at a time, defaults to 65536
+    :type chunk_size: int, optional
+    """
+    dataset_length = dataset["rewards"].shape[0]
+    for start in range(0, dataset_length - 1, chunk_size):
+        end = min(start + chunk_size, dataset_length - 1)
+        # One extra observation is read for the next state of the final transition
+        observations = np.asarray(dataset["observations"][start : end + 1])
+        if swap_channels:
+            observations = np.moveaxis(observations, [-1], [-3])
+        states, next_states = observations[:-1], observations[1:]
+        actions = np.asarray(dataset["actions"][start:end])
+        rewards = np.asarray(dataset["rewards"][start:end])
+        dones = np.asarray(dataset["terminals"][start:end]).astype(bool)
+        memory.add_batch(
+            **dict(
+                zip(
+                    memory.field_names,
+                    (states, actions, rewards, next_states, dones),
+                )
+            )
+        )
 
 
 def train_offline(
@@ -39,6 +79,12 @@ def train_offline(
     minari_dataset_id=None,
     remote=False,
     wandb_api_key=None,
+    prefetch=0,
+    num_workers=0,
+    cache_dir=None,
+    executor=None,
+    evaluator=None,
+    profile=False,
 ):
     """The general offline RL training function. Returns trained population of agents and their fitnesses.
 
@@ -52,7 +98,8 @@ def train_offline(
     :type algo: str
     :param pop: Population of agents
     :type pop: list[object]
-    :param memory: Experience Replay Buffer
+    :param memory: Experience Replay Buffer. With 'hdf5' storage, batches are read from
+        the dataset file during training instead of filling the buffer first
     :type memory: object
     :param INIT_HP: Dictionary containing initial hyperparameters, defaults to None
     :type INIT_HP: dict, optional
@@ -93,6 +140,27 @@ def train_offline(
     :type accelerator: accelerate.Accelerator(), optional
     :param wandb_api_key: API key for Weights & Biases, defaults to None
     :type wandb_api_key: str, optional
+    :param prefetch: Number of replay batches to assemble in a background thread
+        while the agent learns, or per dataloader worker with distributed training,
+        defaults to 0 (no prefetching)
+    :type prefetch: int, optional
+    :param num_workers: Number of dataloader worker processes sampling the replay buffer
+        with distributed training, defaults to 0
+    :type num_workers: int, optional
+    :param cache_dir: Directory to cache Minari datasets converted for the replay buffer
+        in, so that later runs skip conversion, defaults to None
+    :type cache_dir: str, optional
+    :param executor: Train population members in parallel worker processes, each with its
+        own environment for evaluation and copy of the filled replay buffer, defaults to None
+    :type executor: agilerl.training.population_executor.PopulationExecutor(), optional
+    :param evaluator: Evaluate the fitness of population members concurrently, each in its
+        own evaluation environment, instead of one after another in env, defaults to None
+    :type evaluator: agilerl.training.population_evaluator.PopulationEvaluator(), optional
+    :param profile: Time each phase of training, e.g. action selection, environment
+        steps, sampling and learning, and report environment steps and updates per
+        second and the share of time spent in each phase at each evolution step.
+        Phases run in the workers of an executor are not timed, defaults to False
+    :type profile: bool, optional
     """
     assert isinstance(
         algo, str
@@ -110,6 +178,13 @@ def train_offline(
         wb, bool
     ), "'wb' must be a boolean flag, indicating whether to record run with W&B"
     assert isinstance(verbose, bool), "Verbose must be a boolean."
+    if executor is not None:
+        assert (
+            accelerator is None
+        ), "Parallel population training is not supported with distributed training."
+        assert (
+            evaluator is None
+        ), "Population members are already evaluated in their workers with an executor."
     if save_elite is False and elite_path is not None:
         warnings.warn(
             "'save_elite' set to False but 'elite_path' has been defined, elite will not\
@@ -203,37 +278,41 @@ def train_offline(
     else:
         print("Filling replay buffer with dataset...")
 
-    if minari_dataset_id:
+    if getattr(memory, "storage", None) == "hdf5":
+        # Batches are read directly from the dataset file during training
+        if minari_dataset_id:
+            if accelerator is None or accelerator.is_main_process:
+                print(f"Converting Minari Dataset with dataset_id {minari_dataset_id}")
+                MinariToAgileDataset(minari_dataset_id, remote=remote).close()
+            if accelerator is not None:
+                accelerator.wait_for_everyone()
+            dataset = agile_dataset_path(minari_dataset_id)
+        if memory.memory.dataset is None:
+            memory.memory.open(dataset, swap_channels)
+        else:
+            assert (
+                memory.memory.swap_channels == swap_channels
+            ), "Replay buffer dataset was opened with a different 'swap_channels' setting."
+        print("Sampling from dataset file.")
+
+    elif minari_dataset_id:
         print(f"Loading Minari Dataset with dataset_id {minari_dataset_id} in Buffer")
 
-        memory = MinariToAgileBuffer(minari_dataset_id, memory, accelerator, remote)
+        memory = MinariToAgileBuffer(
+            minari_dataset_id,
+            memory,
+            accelerator,
+            remote,
+            swap_channels=swap_channels,
+            cache_dir=cache_dir,
+        )
 
         print(f"Minari Dataset with dataset_id {minari_dataset_id} loaded in Buffer")
 
     else:
         print("Loading buffer...")
         print(dataset["rewards"])
-        dataset_length = dataset["rewards"].shape[0]
-        # for i in range(dataset_length):
-        #     state = dataset['observations'][i]
-        #     next_state = dataset['next_observations'][i]
-        #     if swap_channels:
-        #         state = np.moveaxis(state, [3], [1])
-        #         next_state = np.moveaxis(next_state, [3], [1])
-        #     action = dataset['actions'][i]
-        #     reward = dataset['rewards'][i]
-        #     done = bool(dataset['terminals'][i])
-        #     memory.save2memory(state, action, next_state, reward, done)
-        for i in range(dataset_length - 1):
-            state = dataset["observations"][i]
-            next_state = dataset["observations"][i + 1]
-            if swap_channels:
-                state = np.moveaxis(state, [-1], [-3])
-                next_state = np.moveaxis(next_state, [-1], [-3])
-            action = dataset["actions"][i]
-            reward = dataset["rewards"][i]
-            done = bool(dataset["terminals"][i])
-            memory.save2memory(state, action, reward, next_state, done)
+        _fill_memory(dataset, memory, swap_channels)
         if accelerator is not None:
             if accelerator.is_main_process:
                 print("Loaded buffer.")
@@ -244,13 +323,26 @@ def train_offline(
     if accelerator is not None:
         # Create dataloader from replay buffer
         replay_dataset = ReplayDataset(memory, pop[0].batch_size)
-        replay_dataloader = DataLoader(replay_dataset, batch_size=None)
+        # The buffer is fully loaded, so worker processes can sample from their own copy
+        replay_dataloader = DataLoader(
+            replay_dataset,
+            batch_size=None,
+            num_workers=num_workers,
+            prefetch_factor=prefetch if num_workers > 0 and prefetch > 0 else None,
+            persistent_workers=num_workers > 0,
+        )
         replay_dataloader = accelerator.prepare(replay_dataloader)
         sampler = Sampler(
             distributed=True, dataset=replay_dataset, dataloader=replay_dataloader
         )
     else:
-        sampler = Sampler(distributed=False, memory=memory)
+        # Prefetched batches are moved to the agents' device in the background thread
+        sampler = Sampler(
+            distributed=False,
+            memory=memory,
+            prefetch=prefetch,
+            device=getattr(pop[0], "device", None),
+        )
 
     if accelerator is not None:
         print(f"\nDistributed training on {accelerator.device}...")
@@ -271,36 +363,79 @@ def train_offline(
 
     pop_fitnesses = []
     total_steps = 0
+    timer = PhaseTimer(enabled=profile)
+
+    def run_episode(agent, env):
+        """Trains an agent for max_steps learning steps, returning no score, as no
+        episode is played, and the number of steps."""
+        for idx_step in range(max_steps):
+            with timer.phase("sample"):
+                experiences = sampler.sample(agent.batch_size)  # Sample replay buffer
+            # Learn according to agent's RL algorithm
+            with timer.phase("learn"):
+                agent.learn(experiences)
+            timer.count("updates")
+
+        agent.steps[-1] += max_steps
+        return None, max_steps
 
     # Pre-training mutation
     if accelerator is None:
         if mutation is not None:
             pop = mutation.mutation(pop, pre_training_mut=True)
 
+    if executor is not None:
+        executor.start(run_episode, pop)
+
     # RL training loop
     for idx_epi in pbar:
         if accelerator is not None:
             accelerator.wait_for_everyone()
-        for agent in pop:  # Loop through population
-            for idx_step in range(max_steps):
-                experiences = sampler.sample(agent.batch_size)  # Sample replay buffer
-                # Learn according to agent's RL algorithm
-                agent.learn(experiences)
-
-            agent.steps[-1] += max_steps
-            total_steps += max_steps
+        if executor is not None:
+            steps = executor.run(pop)
+            total_steps += steps
+            # Each step is a learning update in the workers
+            timer.count("updates", steps)
+        else:
+            for agent in pop:  # Loop through population
+                _, steps = run_episode(agent, env)
+                total_steps += steps
 
         # Now evolve if necessary
         if (idx_epi + 1) % evo_epochs == 0:
             # Evaluate population
-            fitnesses = [
-                agent.test(
-                    env, swap_channels=swap_channels, max_steps=max_steps, loop=evo_loop
-                )
-                for agent in pop
-            ]
+            with timer.phase("eval"):
+                if executor is not None:
+                    pop = executor.sync(
+                        pop,
+                        swap_channels=swap_channels,
+                        max_steps=max_steps,
+                        loop=evo_loop,
+                    )
+                    fitnesses = [agent.fitness[-1] for agent in pop]
+                elif evaluator is not None:
+                    fitnesses = evaluator.evaluate(
+                        pop,
+                        swap_channels=swap_channels,
+                        max_steps=max_steps,
+                        loop=evo_loop,
+                    )
+                else:
+                    fitnesses = [
+                        agent.test(
+                            env,
+                            swap_channels=swap_channels,
+                            max_steps=max_steps,
+                            loop=evo_loop,
+                        )
+                        for agent in pop
+                    ]
             pop_fitnesses.append(fitnesses)
 
+            # Throughput since the last evolution step
+            throughput = timer.summary()
+            timer.reset()
+
             if wb:
                 if accelerator is not None:
                     accelerator.wait_for_everyone()
@@ -311,6 +446,7 @@ def train_offline(
                                 * accelerator.state.num_processes,
                                 "eval/mean_fitness": np.mean(fitnesses),
                                 "eval/best_fitness": np.max(fitnesses),
+                                **throughput,
                             }
                         )
                     accelerator.wait_for_everyone()
@@ -320,6 +456,7 @@ def train_offline(
                             "global_step": total_steps,
                             "eval/mean_fitness": np.mean(fitnesses),
                             "eval/best_fitness": np.max(fitnesses),
+                            **throughput,
                         }
                     )
 
@@ -336,6 +473,11 @@ def train_offline(
             ):
                 if wb:
                     wandb.finish()
+                sampler.close()
+                if executor is not None:
+                    executor.close()
+                if evaluator is not None:
+                    evaluator.close()
                 return pop, pop_fitnesses
 
             # Tournament selection and population mutation
@@ -346,8 +488,10 @@ def train_offline(
                         model.unwrap_models()
                     accelerator.wait_for_everyone()
                     if accelerator.is_main_process:
-                        elite, pop = tournament.select(pop)
-                        pop = mutation.mutation(pop)
+                        with timer.phase("tournament"):
+                            elite, pop = tournament.select(pop)
+                        with timer.phase("mutation"):
+                            pop = mutation.mutation(pop)
                         for pop_i, model in enumerate(pop):
                             model.saveCheckpoint(
                                 f"{accel_temp_models_path}/{algo}_{pop_i}.pt"
@@ -362,8 +506,10 @@ def train_offline(
                     for model in pop:
                         model.wrap_models()
                 else:
-                    elite, pop = tournament.select(pop)
-                    pop = mutation.mutation(pop)
+                    with timer.phase("tournament"):
+                        elite, pop = tournament.select(pop)
+                    with timer.phase("mutation"):
+                        pop = mutation.mutation(pop)
 
                 if save_elite and (idx_epi + 1 == n_episodes):
                     elite_save_path = (
@@ -396,26 +542,42 @@ def train_offline(
                     """,
                     end="\r",
                 )
+                if evaluator is not None:
+                    eval_times = [
+                        "%.2f" % eval_time for eval_time in evaluator.eval_times
+                    ]
+                    print(f"Eval times (s):\t\t{eval_times}", end="\r")
+                if sampler.prefetch > 0:
+                    print(
+                        f"Sampler waits:\t\t{sampler.waits}/{sampler.requests}",
+                        end="\r",
+                    )
+
+            if profile:
+                print(f"Throughput:\t\t{PhaseTimer.format(throughput)}", end="\r")
 
         if checkpoint is not None:
             if (idx_epi + 1) % checkpoint == 0:
-                if accelerator is not None:
-                    accelerator.wait_for_everyone()
-                    for model in pop:
-                        model.unwrap_models()
-                    accelerator.wait_for_everyone()
-                    if accelerator.is_main_process:
+                with timer.phase("checkpoint"):
+                    if accelerator is not None:
+                        accelerator.wait_for_everyone()
+                        for model in pop:
+                            model.unwrap_models()
+                        accelerator.wait_for_everyone()
+                        if accelerator.is_main_process:
+                            for i, agent in enumerate(pop):
+                                agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
+                            print("Saved checkpoint.")
+                        accelerator.wait_for_everyone()
+                        for model in pop:
+                            model.wrap_models()
+                        accelerator.wait_for_everyone()
+                    else:
+                        if executor is not None:
+                            pop = executor.sync(pop)
                         for i, agent in enumerate(pop):
                             agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
                         print("Saved checkpoint.")
-                    accelerator.wait_for_everyone()
-                    for model in pop:
-                        model.wrap_models()
-                    accelerator.wait_for_everyone()
-                else:
-                    for i, agent in enumerate(pop):
-                        agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
-                    print("Saved checkpoint.")
 
     if wb:
         if accelerator is not None:
@@ -426,4 +588,9 @@ def train_offline(
         else:
             wandb.finish()
 
+    sampler.close()
+    if executor is not None:
+        executor.close()
+    if evaluator is not None:
+        evaluator.close()
     return pop, pop_fitnesses
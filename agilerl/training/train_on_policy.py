@@ -6,6 +6,8 @@ import numpy as np
 import wandb
 from tqdm import trange
 
+from agilerl.utils.phase_timer import PhaseTimer
+
 os.environ["CUDA_LAUNCH_BLOCKING"] = "1"
 
 
@@ -32,6 +34,9 @@ def train_on_policy(
     verbose=True,
     accelerator=None,
     wandb_api_key=None,
+    executor=None,
+    evaluator=None,
+    profile=False,
 ):
     """The general on-policy RL training function. Returns trained population of agents
     and their fitnesses.
@@ -83,6 +88,17 @@ def train_on_policy(
     :type accelerator: accelerate.Accelerator(), optional
     :param wandb_api_key: API key for Weights & Biases, defaults to None
     :type wandb_api_key: str, optional
+    :param executor: Train population members in parallel worker processes, each with its
+        own environment, defaults to None
+    :type executor: agilerl.training.population_executor.PopulationExecutor(), optional
+    :param evaluator: Evaluate the fitness of population members concurrently, each in its
+        own evaluation environment, instead of one after another in env, defaults to None
+    :type evaluator: agilerl.training.population_evaluator.PopulationEvaluator(), optional
+    :param profile: Time each phase of training, e.g. action selection, environment
+        steps, sampling and learning, and report environment steps and updates per
+        second and the share of time spent in each phase at each evolution step.
+        Phases run in the workers of an executor are not timed, defaults to False
+    :type profile: bool, optional
     """
     assert isinstance(
         algo, str
@@ -100,6 +116,13 @@ def train_on_policy(
         wb, bool
     ), "'wb' must be a boolean flag, indicating whether to record run with W&B"
     assert isinstance(verbose, bool), "Verbose must be a boolean."
+    if executor is not None:
+        assert (
+            accelerator is None
+        ), "Parallel population training is not supported with distributed training."
+        assert (
+            evaluator is None
+        ), "Population members are already evaluated in their workers with an executor."
     if save_elite is False and elite_path is not None:
         warnings.warn(
             "'save_elite' set to False but 'elite_path' has been defined, elite will not\
@@ -174,8 +197,10 @@ def train_on_policy(
     # Detect if environment is vectorised
     if hasattr(env, "num_envs"):
         is_vectorised = True
+        num_envs = env.num_envs
     else:
         is_vectorised = False
+        num_envs = 1
 
     save_path = (
         checkpoint_path.split(".pt")[0]
@@ -207,40 +232,36 @@ def train_on_policy(
 
     pop_fitnesses = []
     total_steps = 0
+    timer = PhaseTimer(enabled=profile)
 
-    # Pre-training mutation
-    if accelerator is not None:
-        if mutation is not None:
-            pop = mutation.mutation(pop, pre_training_mut=True)
+    def run_episode(agent, env):
+        """Trains an agent for one episode, returning its score and number of steps."""
+        state = env.reset()[0]  # Reset environment at start of episode
+        score = 0
 
-    # RL training loop
-    for idx_epi in pbar:
-        if accelerator is not None:
-            accelerator.wait_for_everyone()
-        for agent in pop:  # Loop through population
-            state = env.reset()[0]  # Reset environment at start of episode
-            score = 0
-
-            states = []
-            actions = []
-            log_probs = []
-            rewards = []
-            dones = []
-            values = []
-
-            for idx_step in range(max_steps):
-                if swap_channels:
-                    state = np.moveaxis(state, [-1], [-3])
-                # Get next action from agent
+        states = []
+        actions = []
+        log_probs = []
+        rewards = []
+        dones = []
+        values = []
+
+        for idx_step in range(max_steps):
+            if swap_channels:
+                state = np.moveaxis(state, [-1], [-3])
+            # Get next action from agent
+            with timer.phase("action"):
                 action, log_prob, _, value = agent.getAction(state)
-                if not is_vectorised:
-                    action = action[0]
-                    log_prob = log_prob[0]
-                    value = value[0]
+            if not is_vectorised:
+                action = action[0]
+                log_prob = log_prob[0]
+                value = value[0]
+            with timer.phase("env_step"):
                 next_state, reward, done, trunc, _ = env.step(
                     action
                 )  # Act in environment
 
+            with timer.phase("buffer"):
                 states.append(state)
                 actions.append(action)
                 log_probs.append(log_prob)
@@ -248,40 +269,88 @@ def train_on_policy(
                 dones.append(done)
                 values.append(value)
 
-                state = next_state
-                score += reward
+            state = next_state
+            score += reward
 
-            if swap_channels:
-                next_state = np.moveaxis(next_state, [-1], [-3])
-
-            agent.scores.append(score)
-
-            experiences = (
-                states,
-                actions,
-                log_probs,
-                rewards,
-                dones,
-                values,
-                next_state,
-            )
-            # Learn according to agent's RL algorithm
+        if swap_channels:
+            next_state = np.moveaxis(next_state, [-1], [-3])
+
+        agent.scores.append(score)
+
+        experiences = (
+            states,
+            actions,
+            log_probs,
+            rewards,
+            dones,
+            values,
+            next_state,
+        )
+        # Learn according to agent's RL algorithm
+        with timer.phase("learn"):
             agent.learn(experiences)
+        timer.count("updates")
+
+        agent.steps[-1] += idx_step + 1
+        return score, idx_step + 1
+
+    # Pre-training mutation
+    if accelerator is not None:
+        if mutation is not None:
+            pop = mutation.mutation(pop, pre_training_mut=True)
 
-            agent.steps[-1] += idx_step + 1
-            total_steps += idx_step + 1
+    if executor is not None:
+        executor.start(run_episode, pop)
+
+    # RL training loop
+    for idx_epi in pbar:
+        if accelerator is not None:
+            accelerator.wait_for_everyone()
+        if executor is not None:
+            steps = executor.run(pop)
+            total_steps += steps
+            timer.count("env_steps", steps * num_envs)
+        else:
+            for agent in pop:  # Loop through population
+                _, steps = run_episode(agent, env)
+                total_steps += steps
+                timer.count("env_steps", steps * num_envs)
 
         # Now evolve if necessary
         if (idx_epi + 1) % evo_epochs == 0:
             # Evaluate population
-            fitnesses = [
-                agent.test(
-                    env, swap_channels=swap_channels, max_steps=max_steps, loop=evo_loop
-                )
-                for agent in pop
-            ]
+            with timer.phase("eval"):
+                if executor is not None:
+                    pop = executor.sync(
+                        pop,
+                        swap_channels=swap_channels,
+                        max_steps=max_steps,
+                        loop=evo_loop,
+                    )
+                    fitnesses = [agent.fitness[-1] for agent in pop]
+                elif evaluator is not None:
+                    fitnesses = evaluator.evaluate(
+                        pop,
+                        swap_channels=swap_channels,
+                        max_steps=max_steps,
+                        loop=evo_loop,
+                    )
+                else:
+                    fitnesses = [
+                        agent.test(
+                            env,
+                            swap_channels=swap_channels,
+                            max_steps=max_steps,
+                            loop=evo_loop,
+                        )
+                        for agent in pop
+                    ]
             pop_fitnesses.append(fitnesses)
 
+            # Throughput since the last evolution step
+            throughput = timer.summary()
+            timer.reset()
+
             mean_scores = np.mean([agent.scores[-20:] for agent in pop], axis=1)
 
             if wb:
@@ -295,6 +364,7 @@ def train_on_policy(
                                 "train/mean_score": np.mean(mean_scores),
                                 "eval/mean_fitness": np.mean(fitnesses),
                                 "eval/best_fitness": np.max(fitnesses),
+                                **throughput,
                             }
                         )
                     accelerator.wait_for_everyone()
@@ -305,6 +375,7 @@ def train_on_policy(
                             "train/mean_score": np.mean(mean_scores),
                             "eval/mean_fitness": np.mean(fitnesses),
                             "eval/best_fitness": np.max(fitnesses),
+                            **throughput,
                         }
                     )
 
@@ -321,6 +392,10 @@ def train_on_policy(
             ):
                 if wb:
                     wandb.finish()
+                if executor is not None:
+                    executor.close()
+                if evaluator is not None:
+                    evaluator.close()
                 return pop, pop_fitnesses
 
             # Tournament selection and population mutation
@@ -331,8 +406,10 @@ def train_on_policy(
                         model.unwrap_models()
                     accelerator.wait_for_everyone()
                     if accelerator.is_main_process:
-                        elite, pop = tournament.select(pop)
-                        pop = mutation.mutation(pop)
+                        with timer.phase("tournament"):
+                            elite, pop = tournament.select(pop)
+                        with timer.phase("mutation"):
+                            pop = mutation.mutation(pop)
                         for pop_i, model in enumerate(pop):
                             model.saveCheckpoint(
                                 f"{accel_temp_models_path}/{algo}_{pop_i}.pt"
@@ -347,8 +424,10 @@ def train_on_policy(
                     for model in pop:
                         model.wrap_models()
                 else:
-                    elite, pop = tournament.select(pop)
-                    pop = mutation.mutation(pop)
+                    with timer.phase("tournament"):
+                        elite, pop = tournament.select(pop)
+                    with timer.phase("mutation"):
+                        pop = mutation.mutation(pop)
 
                 if save_elite and (idx_epi + 1 == n_episodes):
                     elite_save_path = (
@@ -381,28 +460,39 @@ def train_on_policy(
                     """,
                     end="\r",
                 )
+                if evaluator is not None:
+                    eval_times = [
+                        "%.2f" % eval_time for eval_time in evaluator.eval_times
+                    ]
+                    print(f"Eval times (s):\t\t{eval_times}", end="\r")
+
+            if profile:
+                print(f"Throughput:\t\t{PhaseTimer.format(throughput)}", end="\r")
 
         # Save model checkpoint
         if checkpoint is not None:
             print("Checkpoint")
             if (idx_epi + 1) % checkpoint == 0:
-                if accelerator is not None:
-                    accelerator.wait_for_everyone()
-                    for model in pop:
-                        model.unwrap_models()
-                    accelerator.wait_for_everyone()
-                    if accelerator.is_main_process:
+                with timer.phase("checkpoint"):
+                    if accelerator is not None:
+                        accelerator.wait_for_everyone()
+                        for model in pop:
+                            model.unwrap_models()
+                        accelerator.wait_for_everyone()
+                        if accelerator.is_main_process:
+                            for i, agent in enumerate(pop):
+                                agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
+                            print("Saved checkpoint.")
+                        accelerator.wait_for_everyone()
+                        for model in pop:
+                            model.wrap_models()
+                        accelerator.wait_for_everyone()
+                    else:
+                        if executor is not None:
+                            pop = executor.sync(pop)
                         for i, agent in enumerate(pop):
                             agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
                         print("Saved checkpoint.")
-                    accelerator.wait_for_everyone()
-                    for model in pop:
-                        model.wrap_models()
-                    accelerator.wait_for_everyone()
-                else:
-                    for i, agent in enumerate(pop):
-                        agent.saveCheckpoint(f"{save_path}_{i}_{idx_epi+1}.pt")
-                    print("Saved checkpoint.")
 
     if wb:
         if accelerator is not None:
@@ -413,4 +503,8 @@ def train_on_policy(
         else:
             wandb.finish()
 
+    if executor is not None:
+        executor.close()
+    if evaluator is not None:
+        evaluator.close()
     return pop, pop_fitnesses
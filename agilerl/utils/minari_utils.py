@@ -1,13 +1,26 @@
+import hashlib
+import json
 import os
+import shutil
+import time
+import traceback
 
 import h5py
 import minari
+import numpy as np
+from filelock import FileLock
 from minari.storage.datasets_root_dir import get_dataset_path
 from minari.storage.hosting import download_dataset
 from minari.storage.local import load_dataset
 
+from agilerl.components.storage import load_arrays
 
-def load_minari_dataset(dataset_id, accelerator=None, remote=False):
+# Datasets of converted transitions, in the order of replay buffer field names
+_KEYS = ("observations", "actions", "rewards", "next_observations", "terminals")
+
+
+def _ensure_local_dataset(dataset_id, accelerator=None, remote=False):
+    """Downloads a remote Minari dataset if it is not available locally."""
     if remote:
         if dataset_id not in list(minari.list_remote_datasets().keys()):
             raise KeyError(
@@ -32,59 +45,273 @@ def load_minari_dataset(dataset_id, accelerator=None, remote=False):
                 f"No local Dataset found for dataset id {dataset_id}. check https://minari.farama.org/ for more details on remote dataset. For loading a remote dataset assign remote=True"
             )
 
+
+def load_minari_dataset(dataset_id, accelerator=None, remote=False):
+    _ensure_local_dataset(dataset_id, accelerator, remote)
+
     minari_dataset = load_dataset(dataset_id)
 
     return minari_dataset
 
 
-def MinariToAgileBuffer(dataset_id, memory, accelerator=None, remote=False):
-    minari_dataset = load_minari_dataset(dataset_id, accelerator, remote)
+def agile_dataset_path(dataset_id):
+    """Returns path of the HDF5 file that MinariToAgileDataset writes for a Minari dataset.
+
+    :param dataset_id: Minari dataset ID
+    :type dataset_id: str
+    """
+    agile_dataset_id = dataset_id.split("-")
+    agile_dataset_id[0] = agile_dataset_id[0] + "_agile"
+    agile_dataset_id = "-".join(agile_dataset_id)
+
+    agile_file_path = get_dataset_path(agile_dataset_id)
+    return os.path.join(agile_file_path, "data", "main_data.hdf5")
+
+
+def _iterate_chunks(minari_dataset, chunk_size=65536, swap_channels=False):
+    """Yields the transitions of a Minari dataset in chunks of about chunk_size
+    transitions, as (observations, actions, rewards, next_observations, terminals)
+    arrays. Each episode is converted with array slicing, so at most one chunk and one
+    episode are held in memory at a time.
 
+    :param minari_dataset: Minari dataset
+    :type minari_dataset: minari.MinariDataset
+    :param chunk_size: Number of transitions per chunk, defaults to 65536
+    :type chunk_size: int, optional
+    :param swap_channels: Swap image channels dimension from last to first
+        [H, W, C] -> [C, H, W], defaults to False
+    :type swap_channels: bool, optional
+    """
+    chunk, chunk_length = [], 0
     for episode in minari_dataset.iterate_episodes():
-        for num_steps in range(0, len(episode.rewards)):
-            observation = episode.observations[num_steps]
-            next_observation = episode.observations[num_steps + 1]
-            action = episode.actions[num_steps]
-            reward = episode.rewards[num_steps]
-            terminal = episode.terminations[num_steps]
-            memory.save2memory(observation, action, reward, next_observation, terminal)
+        observations = np.asarray(episode.observations)
+        if swap_channels:
+            observations = np.moveaxis(observations, [-1], [-3])
+        chunk.append(
+            (
+                observations[:-1],
+                np.asarray(episode.actions),
+                np.asarray(episode.rewards),
+                observations[1:],
+                np.asarray(episode.terminations),
+            )
+        )
+        chunk_length += len(episode.rewards)
+        if chunk_length >= chunk_size:
+            yield tuple(np.concatenate(field) for field in zip(*chunk))
+            chunk, chunk_length = [], 0
+    if chunk:
+        yield tuple(np.concatenate(field) for field in zip(*chunk))
 
-    return memory
 
+def dataset_hash(dataset_id):
+    """Returns SHA-256 hash identifying the version of a local Minari dataset, from the
+    names, sizes and modification times of its data files. File contents are not read, so
+    the hash is cheap to compute on every run and every process, and changes whenever the
+    dataset is recreated or downloaded again.
 
-def MinariToAgileDataset(dataset_id, remote=False):
-    observations = []
-    next_observations = []
-    actions = []
-    rewards = []
-    terminals = []
+    :param dataset_id: Minari dataset ID
+    :type dataset_id: str
+    """
+    data_path = os.path.join(get_dataset_path(dataset_id), "data")
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(data_path)):
+        stat = os.stat(os.path.join(data_path, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
 
-    minari_dataset = load_minari_dataset(dataset_id, remote)
 
-    for episode in minari_dataset.iterate_episodes():
-        observations.extend(episode.observations[:-1])
-        next_observations.extend(episode.observations[1:])
-        actions.extend(episode.actions[:])
-        rewards.extend(episode.rewards[:])
-        terminals.extend(episode.terminations[:])
+def cached_buffer_path(cache_dir, dataset_id, swap_channels=False):
+    """Returns directory of the cached, buffer-ready transitions of a local Minari dataset,
+    keyed by dataset ID, data file version hash and channel order.
 
-    agile_dataset_id = dataset_id.split("-")
-    agile_dataset_id[0] = agile_dataset_id[0] + "_agile"
-    agile_dataset_id = "-".join(agile_dataset_id)
+    :param cache_dir: Directory containing cached datasets
+    :type cache_dir: str
+    :param dataset_id: Minari dataset ID
+    :type dataset_id: str
+    :param swap_channels: Swap image channels dimension from last to first
+        [H, W, C] -> [C, H, W], defaults to False
+    :type swap_channels: bool, optional
+    """
+    channels = "swapped" if swap_channels else "original"
+    name = f"{dataset_id}-{dataset_hash(dataset_id)[:16]}-{channels}"
+    return os.path.join(cache_dir, name)
 
-    agile_file_path = get_dataset_path(agile_dataset_id)
 
-    agile_dataset_path = os.path.join(agile_file_path, "data")
-    os.makedirs(agile_dataset_path, exist_ok=True)
-    data_path = os.path.join(agile_dataset_path, "main_data.hdf5")
+def _write_cache(minari_dataset, path, chunk_size=65536, swap_channels=False):
+    """Writes the transitions of a Minari dataset chunk by chunk to .npy files that can be
+    loaded memory-mapped with agilerl.components.storage.load_arrays. Files are written to
+    a temporary directory that is renamed once complete."""
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    arrays, length = {}, 0
+    for chunk in _iterate_chunks(minari_dataset, chunk_size, swap_channels):
+        n = len(chunk[0])
+        for key, data in zip(_KEYS, chunk):
+            if key not in arrays:
+                arrays[key] = np.lib.format.open_memmap(
+                    os.path.join(tmp_path, f"{key}.npy"),
+                    mode="w+",
+                    dtype=data.dtype,
+                    shape=(minari_dataset.total_steps, *data.shape[1:]),
+                )
+            arrays[key][length : length + n] = data
+        length += n
+    names = list(arrays)
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({"length": length, "arrays": names}, f)
+    os.rename(tmp_path, path)
+
+
+def _build_once(path, build_fn, builder=True, poll_interval=0.1, timeout=None):
+    """Builds a cache directory with build_fn unless it already exists. Builders hold a
+    file lock while building, so concurrent runs never build the same cache twice, while
+    other processes wait on the lock until the cache exists. A builder that fails writes
+    the error to a failure file next to the cache, which waiting processes raise on
+    instead of waiting for a cache that will not be built, and waiting processes give up
+    after timeout seconds."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    lock = FileLock(f"{path}.lock")
+    failure_path = f"{path}.failed"
+    # Failure files left by earlier runs are ignored
+    stale_failure = (
+        os.path.getmtime(failure_path) if os.path.exists(failure_path) else None
+    )
+    start = time.monotonic()
+    while True:
+        with lock:
+            if os.path.exists(os.path.join(path, "meta.json")):
+                return
+            if builder:
+                try:
+                    build_fn(path)
+                except Exception:
+                    with open(failure_path, "w") as f:
+                        f.write(traceback.format_exc())
+                    raise
+                if os.path.exists(failure_path):
+                    os.remove(failure_path)
+                return
+            if (
+                os.path.exists(failure_path)
+                and os.path.getmtime(failure_path) != stale_failure
+            ):
+                with open(failure_path) as f:
+                    raise RuntimeError(f"Building cache {path} failed:\n{f.read()}")
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"Timed out waiting for cache {path} to be built.")
+        time.sleep(poll_interval)
+
+
+def MinariToAgileBuffer(
+    dataset_id,
+    memory,
+    accelerator=None,
+    remote=False,
+    chunk_size=65536,
+    swap_channels=False,
+    cache_dir=None,
+    cache_timeout=None,
+):
+    """Fills replay buffer with the transitions of a Minari dataset, adding chunks of
+    chunk_size transitions at a time.
+
+    With a cache directory, the first run writes the converted transitions there as
+    memory-mappable arrays, keyed by dataset ID, data file version hash and channel order,
+    and later runs fill the buffer from the cache without converting episodes. Only the
+    main process builds the cache, while other processes wait on a file lock, and raise an
+    error if the main process fails to build it.
+
+    :param dataset_id: Minari dataset ID
+    :type dataset_id: str
+    :param memory: Experience replay buffer
+    :type memory: agilerl.components.replay_buffer.ReplayBuffer()
+    :param accelerator: Accelerator for distributed computing, defaults to None
+    :type accelerator: accelerate.Accelerator(), optional
+    :param remote: Download dataset if it is not available locally, defaults to False
+    :type remote: bool, optional
+    :param chunk_size: Number of transitions added at a time, defaults to 65536
+    :type chunk_size: int, optional
+    :param swap_channels: Swap image channels dimension from last to first
+        [H, W, C] -> [C, H, W], defaults to False
+    :type swap_channels: bool, optional
+    :param cache_dir: Directory to cache converted datasets in, defaults to None
+    :type cache_dir: str, optional
+    :param cache_timeout: Seconds that processes other than the main process wait for the
+        cache to be built before raising an error, defaults to None (wait indefinitely)
+    :type cache_timeout: float, optional
+    """
+    if cache_dir is None:
+        minari_dataset = load_minari_dataset(dataset_id, accelerator, remote)
+        chunks = _iterate_chunks(minari_dataset, chunk_size, swap_channels)
+    else:
+        # Loading a Minari dataset reads every episode, so it is only loaded to build the cache
+        _ensure_local_dataset(dataset_id, accelerator, remote)
+        path = cached_buffer_path(cache_dir, dataset_id, swap_channels)
+        _build_once(
+            path,
+            lambda path: _write_cache(
+                load_dataset(dataset_id), path, chunk_size, swap_channels
+            ),
+            builder=accelerator is None or accelerator.is_main_process,
+            timeout=cache_timeout,
+        )
+        arrays, meta = load_arrays(path, mmap=True)
+        chunks = (
+            tuple(arrays[key][start : start + chunk_size] for key in _KEYS)
+            for start in range(0, meta["length"], chunk_size)
+        )
+
+    for chunk in chunks:
+        memory.add_batch(**dict(zip(memory.field_names, chunk)))
+
+    return memory
+
+
+def MinariToAgileDataset(dataset_id, remote=False, chunk_size=65536, compression=None):
+    """Converts a Minari dataset into an AgileRL HDF5 dataset with 'observations',
+    'next_observations', 'actions', 'rewards' and 'terminals'. Transitions are written
+    chunk by chunk to resizable, chunked datasets, so the whole dataset is never held in
+    memory.
+
+    :param dataset_id: Minari dataset ID
+    :type dataset_id: str
+    :param remote: Download dataset if it is not available locally, defaults to False
+    :type remote: bool, optional
+    :param chunk_size: Number of transitions written at a time, defaults to 65536
+    :type chunk_size: int, optional
+    :param compression: HDF5 compression filter, e.g. 'gzip' or 'lzf', defaults to None
+    :type compression: str, optional
+    """
+    minari_dataset = load_minari_dataset(dataset_id, remote=remote)
+
+    data_path = agile_dataset_path(dataset_id)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
 
-    # with h5py.File(os.path.join(agile_file_path, "data", "main_data.hdf5"), "w") as f:
     f = h5py.File(data_path, "w")
 
-    f.create_dataset("observations", data=observations)
-    f.create_dataset("next_observations", data=next_observations)
-    f.create_dataset("actions", data=actions)
-    f.create_dataset("rewards", data=rewards)
-    f.create_dataset("terminals", data=terminals)
+    length = 0
+    for chunk in _iterate_chunks(minari_dataset, chunk_size):
+        n = len(chunk[0])
+        for key, data in zip(_KEYS, chunk):
+            if key not in f:
+                f.create_dataset(
+                    key,
+                    shape=(0,) + data.shape[1:],
+                    maxshape=(None,) + data.shape[1:],
+                    dtype=data.dtype,
+                    chunks=True,
+                    compression=compression,
+                )
+            f[key].resize(length + n, axis=0)
+            f[key][length : length + n] = data
+        length += n
 
     return f
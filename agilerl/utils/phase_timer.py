@@ -0,0 +1,128 @@
+import time
+
+
+class _Phase:
+    """Context manager adding the time spent in its block to a phase of a PhaseTimer."""
+
+    __slots__ = ("times", "name", "start")
+
+    def __init__(self, times, name):
+        self.times = times
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.times[self.name] += time.perf_counter() - self.start
+
+
+class _NullPhase:
+    """Context manager doing nothing, returned by a disabled PhaseTimer."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return None
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class PhaseTimer:
+    """Measures where wall-clock time goes in a training loop. Time spent in each phase,
+    e.g. action selection, environment steps, buffer writes, sampling and learning, is
+    accumulated with timer.phase(name) blocks, and environment steps and learning updates
+    are counted with timer.count(name, n).
+
+    summary() returns environment steps and updates per second, and the percentage of
+    wall-clock time spent in each phase, since the timer was last reset. Time outside
+    any phase is reported as "other". A disabled timer returns a shared no-op context
+    manager from phase() and ignores counts, so that it can be left in training loops.
+
+    :param enabled: Record phase times and counts, defaults to False
+    :type enabled: bool, optional
+    """
+
+    PHASES = (
+        "action",
+        "env_step",
+        "buffer",
+        "sample",
+        "learn",
+        "eval",
+        "tournament",
+        "mutation",
+        "checkpoint",
+    )
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        """Clears phase times and counts and restarts the wall-clock."""
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.counts = {"env_steps": 0, "updates": 0}
+        self.start = time.perf_counter()
+
+    def phase(self, name):
+        """Returns a context manager adding the time spent in its block to a phase.
+
+        :param name: Phase name, one of PhaseTimer.PHASES
+        :type name: str
+        """
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self.times, name)
+
+    def count(self, name, n=1):
+        """Adds to a counter, e.g. "env_steps" or "updates".
+
+        :param name: Counter name
+        :type name: str
+        :param n: Amount to add, defaults to 1
+        :type n: int, optional
+        """
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def summary(self):
+        """Returns throughput and phase percentages since the last reset, keyed for logging
+        to Weights & Biases, or an empty dictionary if the timer is disabled."""
+        if not self.enabled:
+            return {}
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        summary = {
+            f"throughput/{name}_per_sec": count / elapsed
+            for name, count in self.counts.items()
+        }
+        for name, phase_time in self.times.items():
+            summary[f"throughput/{name}_pct"] = 100 * phase_time / elapsed
+        summary["throughput/other_pct"] = max(
+            100 - 100 * sum(self.times.values()) / elapsed, 0.0
+        )
+        return summary
+
+    @staticmethod
+    def format(summary):
+        """Returns a summary as a string to print.
+
+        :param summary: Summary returned by PhaseTimer.summary()
+        :type summary: dict
+        """
+        rates = [
+            f"{key[len('throughput/') : -len('_per_sec')]}/s: {value:.1f}"
+            for key, value in summary.items()
+            if key.endswith("_per_sec")
+        ]
+        pcts = [
+            f"{key[len('throughput/') : -len('_pct')]}: {value:.1f}%"
+            for key, value in summary.items()
+            if key.endswith("_pct")
+        ]
+        return " | ".join(rates) + "\n" + " | ".join(pcts)
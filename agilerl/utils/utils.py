@@ -10,18 +10,63 @@ from agilerl.algorithms.maddpg import MADDPG
 from agilerl.algorithms.matd3 import MATD3
 from agilerl.algorithms.ppo import PPO
 from agilerl.algorithms.td3 import TD3
+from agilerl.utils.vector_envs import (
+    BatchedAsyncVectorEnv,
+    measure_step_latency,
+    worker_layout,
+)
+
+
+def makeVectEnvs(
+    env_name,
+    num_envs=1,
+    mode="async",
+    envs_per_worker=1,
+    shared_memory=True,
+    cpu_affinity=None,
+):
+    """Returns vectorized gym environments.
 
-
-def makeVectEnvs(env_name, num_envs=1):
-    """Returns async-vectorized gym environments.
+    Asynchronous environments run in worker processes. With envs_per_worker > 1 or CPU
+    affinity, several environments are stepped per worker by a BatchedAsyncVectorEnv,
+    otherwise each runs in its own process in a gym.vector.AsyncVectorEnv. In 'auto'
+    mode, the step latency of one environment is measured at startup to choose between
+    synchronous stepping, for cheap environments where messages between processes would
+    dominate, and batches of environments per worker.
 
     :param env_name: Gym environment name
     :type env_name: str
     :param num_envs: Number of vectorized environments, defaults to 1
     :type num_envs: int, optional
+    :param mode: Vectorization mode, 'sync', 'async' or 'auto', defaults to 'async'
+    :type mode: str, optional
+    :param envs_per_worker: Number of environments stepped by each worker process in
+        'async' mode, defaults to 1
+    :type envs_per_worker: int, optional
+    :param shared_memory: Return observations from workers through shared memory,
+        defaults to True
+    :type shared_memory: bool, optional
+    :param cpu_affinity: Pin worker processes to CPU cores, True for one core per worker
+        or a list of cores, defaults to None (no pinning)
+    :type cpu_affinity: bool or list[int], optional
     """
-    return gym.vector.AsyncVectorEnv(
-        [lambda: gym.make(env_name) for i in range(num_envs)]
+    assert mode in ["sync", "async", "auto"], "Mode must be 'sync', 'async' or 'auto'."
+    env_fns = [lambda: gym.make(env_name) for i in range(num_envs)]
+
+    if mode == "auto":
+        mode, envs_per_worker = worker_layout(
+            num_envs, measure_step_latency(env_fns[0])
+        )
+
+    if mode == "sync":
+        return gym.vector.SyncVectorEnv(env_fns)
+    if envs_per_worker == 1 and cpu_affinity is None:
+        return gym.vector.AsyncVectorEnv(env_fns, shared_memory=shared_memory)
+    return BatchedAsyncVectorEnv(
+        env_fns,
+        envs_per_worker=envs_per_worker,
+        shared_memory=shared_memory,
+        cpu_affinity=cpu_affinity,
     )
 
 
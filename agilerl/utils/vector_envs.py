@@ -0,0 +1,554 @@
+import math
+import multiprocessing as mp
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+
+import gymnasium as gym
+import numpy as np
+from gymnasium.error import AlreadyPendingCallError, NoAsyncCallError
+from gymnasium.vector.async_vector_env import AsyncState
+from gymnasium.vector.utils import (
+    CloudpickleWrapper,
+    clear_mpi_env_vars,
+    concatenate,
+    create_empty_array,
+    create_shared_memory,
+    iterate,
+    read_from_shared_memory,
+    write_to_shared_memory,
+)
+
+
+def measure_step_latency(env_fn, steps=100, seed=None):
+    """Returns mean wall-clock time in seconds of one env.step of an environment, taking
+    random actions and resetting the environment when episodes end.
+
+    :param env_fn: Function that creates the environment
+    :type env_fn: Callable[[], gymnasium.Env]
+    :param steps: Number of steps to time, defaults to 100
+    :type steps: int, optional
+    :param seed: Seed for environment reset and action sampling, defaults to None
+    :type seed: int, optional
+    """
+    env = env_fn()
+    env.action_space.seed(seed)
+    env.reset(seed=seed)
+    elapsed = 0
+    for _ in range(steps):
+        action = env.action_space.sample()
+        start = time.perf_counter()
+        _, _, terminated, truncated, _ = env.step(action)
+        elapsed += time.perf_counter() - start
+        if terminated or truncated:
+            env.reset()
+    env.close()
+    return elapsed / steps
+
+
+def available_cpus():
+    """Returns sorted list of CPU cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_layout(num_envs, step_latency, ipc_latency=1e-4, num_cpus=None):
+    """Returns (mode, envs_per_worker) for vectorizing num_envs environments whose steps
+    take step_latency seconds. Each worker process is given enough environments that
+    stepping them outweighs the cost of one round trip to the worker, and there are at
+    most as many workers as CPU cores. When that leaves a single worker, the environments
+    are stepped synchronously in the main process instead.
+
+    :param num_envs: Number of vectorized environments
+    :type num_envs: int
+    :param step_latency: Seconds per env.step of one environment
+    :type step_latency: float
+    :param ipc_latency: Seconds per round trip between main and worker process,
+        defaults to 1e-4
+    :type ipc_latency: float, optional
+    :param num_cpus: Number of CPU cores available to workers, defaults to None
+        (all cores this process may run on)
+    :type num_cpus: int, optional
+    """
+    if num_cpus is None:
+        num_cpus = len(available_cpus())
+    envs_per_worker = max(
+        math.ceil(num_envs / num_cpus),
+        math.ceil(ipc_latency / max(step_latency, 1e-9)),
+    )
+    if envs_per_worker >= num_envs:
+        return "sync", num_envs
+    return "async", envs_per_worker
+
+
+class AsyncStepper:
+    """Steps an environment in the background, so that the caller can do other work, such
+    as a learning update, between step_async and step_wait. Vector environments with
+    step_async and step_wait methods step in their own workers, other environments are
+    stepped in a background thread.
+
+    :param env: The environment to step, can be vectorized
+    :type env: Gym-style or PettingZoo-style environment
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self._executor = None
+        self._future = None
+        if not (hasattr(env, "step_async") and hasattr(env, "step_wait")):
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def step_async(self, action):
+        """Starts stepping the environment with an action.
+
+        :param action: Action, or batch of actions for vectorized environments
+        :type action: numpy.ndarray or dict
+        """
+        if self._executor is None:
+            self.env.step_async(action)
+        else:
+            assert self._future is None, "Environment is already being stepped."
+            self._future = self._executor.submit(self.env.step, action)
+
+    def step_wait(self):
+        """Waits for the environment step started by step_async and returns its result."""
+        if self._executor is None:
+            return self.env.step_wait()
+        future, self._future = self._future, None
+        return future.result()
+
+    def close(self):
+        """Stops the background thread, without closing the environment."""
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+class BatchedAsyncVectorEnv(gym.vector.VectorEnv):
+    """Vectorized environment that runs groups of environments in parallel, stepping
+    several environments per worker process.
+
+    Each worker steps its environments with a gymnasium.vector.SyncVectorEnv, so results
+    are the same as with gymnasium.vector.AsyncVectorEnv, which runs one environment per
+    process, while messages between processes are exchanged once per group.
+
+    :param env_fns: Functions that create the environments
+    :type env_fns: list[Callable[[], gymnasium.Env]]
+    :param envs_per_worker: Number of environments stepped by each worker process,
+        defaults to 1
+    :type envs_per_worker: int, optional
+    :param shared_memory: Return observations from workers through shared memory,
+        defaults to True
+    :type shared_memory: bool, optional
+    :param cpu_affinity: Pin workers to CPU cores. True pins worker i to the i-th core this
+        process may run on, a list of cores pins worker i to cpu_affinity[i % len], defaults
+        to None (no pinning)
+    :type cpu_affinity: bool or list[int], optional
+    :param copy: Return copies of observations from reset and step, defaults to True
+    :type copy: bool, optional
+    :param context: Multiprocessing start method, defaults to None (default context)
+    :type context: str, optional
+    :param daemon: Run workers as daemon processes, defaults to True
+    :type daemon: bool, optional
+    """
+
+    def __init__(
+        self,
+        env_fns,
+        envs_per_worker=1,
+        shared_memory=True,
+        cpu_affinity=None,
+        copy=True,
+        context=None,
+        daemon=True,
+    ):
+        assert envs_per_worker >= 1, "Number of environments per worker must be >= 1."
+        ctx = mp.get_context(context)
+        self.env_fns = env_fns
+        self.envs_per_worker = envs_per_worker
+        self.shared_memory = shared_memory
+        self.copy = copy
+
+        dummy_env = env_fns[0]()
+        self.metadata = dummy_env.metadata
+        observation_space = dummy_env.observation_space
+        action_space = dummy_env.action_space
+        dummy_env.close()
+        del dummy_env
+        super().__init__(
+            num_envs=len(env_fns),
+            observation_space=observation_space,
+            action_space=action_space,
+        )
+
+        if self.shared_memory:
+            _obs_buffer = create_shared_memory(
+                self.single_observation_space, n=self.num_envs, ctx=ctx
+            )
+            self.observations = read_from_shared_memory(
+                self.single_observation_space, _obs_buffer, n=self.num_envs
+            )
+        else:
+            _obs_buffer = None
+            self.observations = create_empty_array(
+                self.single_observation_space, n=self.num_envs, fn=np.zeros
+            )
+
+        # Environments [offsets[i], offsets[i + 1]) are stepped by worker i
+        self.offsets = list(range(0, self.num_envs, envs_per_worker)) + [self.num_envs]
+        if cpu_affinity is True:
+            cpu_affinity = available_cpus()
+
+        self.parent_pipes, self.processes = [], []
+        self.error_queue = ctx.Queue()
+        with clear_mpi_env_vars():
+            for idx, (start, end) in enumerate(zip(self.offsets, self.offsets[1:])):
+                cpu = None
+                if cpu_affinity:
+                    cpu = cpu_affinity[idx % len(cpu_affinity)]
+                parent_pipe, child_pipe = ctx.Pipe()
+                process = ctx.Process(
+                    target=_batched_worker,
+                    name=f"Worker<{type(self).__name__}>-{idx}",
+                    args=(
+                        idx,
+                        CloudpickleWrapper(env_fns[start:end]),
+                        start,
+                        child_pipe,
+                        parent_pipe,
+                        _obs_buffer,
+                        cpu,
+                        self.error_queue,
+                    ),
+                )
+
+                self.parent_pipes.append(parent_pipe)
+                self.processes.append(process)
+
+                process.daemon = daemon
+                process.start()
+                child_pipe.close()
+
+        self._state = AsyncState.DEFAULT
+
+    def reset_async(self, seed=None, options=None):
+        """Sends calls to reset to the workers.
+
+        :param seed: Seed for the first environment, or list of seeds for each environment,
+            defaults to None
+        :type seed: int or list[int], optional
+        :param options: Reset options, defaults to None
+        :type options: dict, optional
+        """
+        self._assert_is_running()
+        if seed is None:
+            seed = [None for _ in range(self.num_envs)]
+        if isinstance(seed, int):
+            seed = [seed + i for i in range(self.num_envs)]
+        assert len(seed) == self.num_envs
+
+        if self._state != AsyncState.DEFAULT:
+            raise AlreadyPendingCallError(
+                f"Calling `reset_async` while waiting for a pending call to `{self._state.value}` to complete",
+                self._state.value,
+            )
+
+        for pipe, start, end in zip(self.parent_pipes, self.offsets, self.offsets[1:]):
+            kwargs = {"seed": seed[start:end]}
+            if options is not None:
+                kwargs["options"] = options
+            pipe.send(("reset", kwargs))
+        self._state = AsyncState.WAITING_RESET
+
+    def reset_wait(self, timeout=None, seed=None, options=None):
+        """Waits for the workers to reset and returns batched observations and infos.
+
+        :param timeout: Seconds to wait before raising multiprocessing.TimeoutError,
+            defaults to None (wait indefinitely)
+        :type timeout: float, optional
+        """
+        self._assert_is_running()
+        if self._state != AsyncState.WAITING_RESET:
+            raise NoAsyncCallError(
+                "Calling `reset_wait` without any prior call to `reset_async`.",
+                AsyncState.WAITING_RESET.value,
+            )
+        results = self._receive(timeout, "reset_wait")
+
+        infos = {}
+        observations_list = []
+        for (observations, info), start in zip(results, self.offsets):
+            observations_list.extend(observations or [])
+            infos = self._merge_info(infos, info, start)
+
+        return self._observations(observations_list), infos
+
+    def step_async(self, actions):
+        """Sends the batch of actions to the workers.
+
+        :param actions: Batch of actions, element of the batched action space
+        :type actions: numpy.ndarray
+        """
+        self._assert_is_running()
+        if self._state != AsyncState.DEFAULT:
+            raise AlreadyPendingCallError(
+                f"Calling `step_async` while waiting for a pending call to `{self._state.value}` to complete.",
+                self._state.value,
+            )
+
+        actions = list(iterate(self.action_space, actions))
+        for pipe, start, end in zip(self.parent_pipes, self.offsets, self.offsets[1:]):
+            pipe.send(("step", actions[start:end]))
+        self._state = AsyncState.WAITING_STEP
+
+    def step_wait(self, timeout=None):
+        """Waits for the workers to step and returns batched observations, rewards,
+        terminations, truncations and infos.
+
+        :param timeout: Seconds to wait before raising multiprocessing.TimeoutError,
+            defaults to None (wait indefinitely)
+        :type timeout: float, optional
+        """
+        self._assert_is_running()
+        if self._state != AsyncState.WAITING_STEP:
+            raise NoAsyncCallError(
+                "Calling `step_wait` without any prior call to `step_async`.",
+                AsyncState.WAITING_STEP.value,
+            )
+        results = self._receive(timeout, "step_wait")
+
+        observations_list, infos = [], {}
+        for (observations, _, _, _, info), start in zip(results, self.offsets):
+            observations_list.extend(observations or [])
+            infos = self._merge_info(infos, info, start)
+        _, rewards, terminateds, truncateds, _ = zip(*results)
+
+        return (
+            self._observations(observations_list),
+            np.concatenate(rewards),
+            np.concatenate(terminateds).astype(np.bool_),
+            np.concatenate(truncateds).astype(np.bool_),
+            infos,
+        )
+
+    def call_async(self, name, *args, **kwargs):
+        """Calls a method, or gets an attribute, of each environment in the workers.
+
+        :param name: Name of the method or attribute
+        :type name: str
+        """
+        self._assert_is_running()
+        if self._state != AsyncState.DEFAULT:
+            raise AlreadyPendingCallError(
+                f"Calling `call_async` while waiting for a pending call to `{self._state.value}` to complete.",
+                self._state.value,
+            )
+
+        for pipe in self.parent_pipes:
+            pipe.send(("_call", (name, args, kwargs)))
+        self._state = AsyncState.WAITING_CALL
+
+    def call_wait(self, timeout=None):
+        """Waits for the calls triggered by call_async and returns one result per
+        environment.
+
+        :param timeout: Seconds to wait before raising multiprocessing.TimeoutError,
+            defaults to None (wait indefinitely)
+        :type timeout: float, optional
+        """
+        self._assert_is_running()
+        if self._state != AsyncState.WAITING_CALL:
+            raise NoAsyncCallError(
+                "Calling `call_wait` without any prior call to `call_async`.",
+                AsyncState.WAITING_CALL.value,
+            )
+        results = self._receive(timeout, "call_wait")
+        return [result for group in results for result in group]
+
+    def set_attr(self, name, values):
+        """Sets an attribute of each environment in the workers.
+
+        :param name: Name of the attribute
+        :type name: str
+        :param values: One value for all environments, or list of values for each
+        :type values: list or tuple or object
+        """
+        self._assert_is_running()
+        if not isinstance(values, (list, tuple)):
+            values = [values for _ in range(self.num_envs)]
+        assert len(values) == self.num_envs
+
+        if self._state != AsyncState.DEFAULT:
+            raise AlreadyPendingCallError(
+                f"Calling `set_attr` while waiting for a pending call to `{self._state.value}` to complete.",
+                self._state.value,
+            )
+
+        for pipe, start, end in zip(self.parent_pipes, self.offsets, self.offsets[1:]):
+            pipe.send(("_setattr", (name, list(values[start:end]))))
+        self._receive(None, "set_attr")
+
+    def close_extras(self, timeout=None, terminate=False):
+        """Closes the environments and stops the workers.
+
+        :param timeout: Seconds to wait for a pending call before terminating the workers,
+            defaults to None (wait indefinitely)
+        :type timeout: float, optional
+        :param terminate: Terminate workers instead of closing their environments,
+            defaults to False
+        :type terminate: bool, optional
+        """
+        timeout = 0 if terminate else timeout
+        try:
+            if self._state != AsyncState.DEFAULT:
+                gym.logger.warn(
+                    f"Calling `close` while waiting for a pending call to `{self._state.value}` to complete."
+                )
+                function = getattr(self, f"{self._state.value}_wait")
+                function(timeout)
+        except mp.TimeoutError:
+            terminate = True
+
+        if terminate:
+            for process in self.processes:
+                if process.is_alive():
+                    process.terminate()
+        else:
+            for pipe in self.parent_pipes:
+                if (pipe is not None) and (not pipe.closed):
+                    pipe.send(("close", None))
+            for pipe in self.parent_pipes:
+                if (pipe is not None) and (not pipe.closed):
+                    pipe.recv()
+
+        for pipe in self.parent_pipes:
+            if pipe is not None:
+                pipe.close()
+        for process in self.processes:
+            process.join()
+
+    def _receive(self, timeout, call):
+        """Returns one result per worker once all workers have responded, raising the first
+        exception raised in a worker."""
+        end_time = None if timeout is None else time.perf_counter() + timeout
+        for pipe in self.parent_pipes:
+            remaining = None
+            if end_time is not None:
+                remaining = max(end_time - time.perf_counter(), 0)
+            if not pipe.poll(remaining):
+                self._state = AsyncState.DEFAULT
+                raise mp.TimeoutError(
+                    f"The call to `{call}` has timed out after {timeout} second(s)."
+                )
+
+        results, successes = zip(*[pipe.recv() for pipe in self.parent_pipes])
+        self._state = AsyncState.DEFAULT
+        if not all(successes):
+            index, exctype, value = self.error_queue.get()
+            gym.logger.error(
+                f"Received the following error from Worker-{index}: {exctype.__name__}: {value}"
+            )
+            self.close(terminate=True)
+            raise exctype(value)
+        return results
+
+    def _merge_info(self, infos, info, start):
+        """Adds the vectorized info of the worker whose first environment is start."""
+        for key, value in info.items():
+            if isinstance(value, dict):
+                infos[key] = self._merge_info(infos.get(key, {}), value, start)
+                continue
+            value = np.asarray(value)
+            if key not in infos:
+                if value.dtype.kind in "biuf":
+                    infos[key] = np.zeros(self.num_envs, dtype=value.dtype)
+                else:
+                    infos[key] = np.full(self.num_envs, None, dtype=object)
+            infos[key][start : start + len(value)] = value
+        return infos
+
+    def _observations(self, observations_list):
+        """Returns batched observations, gathered from the workers' observations unless
+        they were written to shared memory."""
+        if not self.shared_memory:
+            self.observations = concatenate(
+                self.single_observation_space, observations_list, self.observations
+            )
+        return deepcopy(self.observations) if self.copy else self.observations
+
+    def _assert_is_running(self):
+        if self.closed:
+            raise gym.error.ClosedEnvironmentError(
+                f"Trying to operate on `{type(self).__name__}`, after a call to `close()`."
+            )
+
+    def __del__(self):
+        if not getattr(self, "closed", True) and hasattr(self, "_state"):
+            self.close(terminate=True)
+
+
+def _batched_worker(
+    index, env_fns, start, pipe, parent_pipe, shared_memory, cpu, error_queue
+):
+    """Steps a group of environments for BatchedAsyncVectorEnv, writing observations of
+    environment start + i to row start + i of shared memory."""
+    parent_pipe.close()
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+    envs = gym.vector.SyncVectorEnv(env_fns.fn, copy=False)
+    actions = create_empty_array(envs.single_action_space, n=envs.num_envs)
+
+    def send_observations(observations):
+        observations = iterate(envs.observation_space, observations)
+        if shared_memory is None:
+            return [deepcopy(observation) for observation in observations]
+        for i, observation in enumerate(observations):
+            write_to_shared_memory(
+                envs.single_observation_space, start + i, observation, shared_memory
+            )
+        return None
+
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == "reset":
+                observations, info = envs.reset(**data)
+                pipe.send(((send_observations(observations), info), True))
+            elif command == "step":
+                observations, rewards, terminateds, truncateds, info = envs.step(
+                    concatenate(envs.single_action_space, data, actions)
+                )
+                pipe.send(
+                    (
+                        (
+                            send_observations(observations),
+                            rewards,
+                            terminateds,
+                            truncateds,
+                            info,
+                        ),
+                        True,
+                    )
+                )
+            elif command == "close":
+                pipe.send((None, True))
+                break
+            elif command == "_call":
+                name, args, kwargs = data
+                pipe.send((envs.call(name, *args, **kwargs), True))
+            elif command == "_setattr":
+                name, values = data
+                envs.set_attr(name, values)
+                pipe.send((None, True))
+            else:
+                raise RuntimeError(
+                    f"Received unknown command `{command}`. Must be one of "
+                    "{`reset`, `step`, `close`, `_call`, `_setattr`}."
+                )
+    except (KeyboardInterrupt, Exception):
+        error_queue.put((index,) + sys.exc_info()[:2])
+        pipe.send((None, False))
+    finally:
+        envs.close()
@@ -37,6 +37,8 @@ class MakeEvolvable(nn.Module):
     :type max_channel_size: int, optional
     :param output_vanish: Vanish output by multiplying by 0.1, defaults to False
     :type output_vanish: bool, optional
+    :param normalize: Normalize CNN inputs by dividing by 255 on the network's device, defaults to False
+    :type normalize: bool, optional
     :param init_layers: Initialise network layers, defaults to False
     :type init_layers: bool, optional
     :param device: Device for accelerated computing, 'cpu' or 'cuda', defaults to 'cpu'
@@ -61,6 +63,7 @@ class MakeEvolvable(nn.Module):
         min_channel_size=32,
         max_channel_size=256,
         output_vanish=False,
+        normalize=False,
         init_layers=False,
         device="cpu",
         accelerator=None,
@@ -102,6 +105,7 @@ class MakeEvolvable(nn.Module):
         self.min_channel_size = min_channel_size
         self.max_channel_size = max_channel_size
         self.output_vanish = output_vanish
+        self.normalize = normalize
         self.device = device
         self.accelerator = accelerator
 
@@ -146,7 +150,12 @@ class MakeEvolvable(nn.Module):
         :type xc: torch.Tensor() or np.array, optional
         """
         if not isinstance(x, torch.Tensor):
-            x = torch.FloatTensor(np.array(x))
+            x = np.array(x)
+            if self.cnn_layer_info and x.dtype == np.uint8:
+                # Keep frames as uint8 until they are on the device
+                x = torch.from_numpy(x)
+            else:
+                x = torch.FloatTensor(x)
 
         if self.accelerator is None:
             x = x.to(self.device)
@@ -155,6 +164,8 @@ class MakeEvolvable(nn.Module):
         if self.cnn_layer_info:
             if x.dtype != torch.float32:
                 x = x.type(torch.float32)
+            if self.normalize:
+                x = x / 255.0
             x = self.feature_net(x)
             x = x.reshape(x.size(0), -1)
             # Ensure dtype is float32
@@ -680,6 +691,7 @@ class MakeEvolvable(nn.Module):
             "padding": self.padding,
             "extra_critic_dims": self.extra_critic_dims,
             "output_vanish": self.output_vanish,
+            "normalize": self.normalize,
             "init_layers": self.init_layers,
             "has_conv_layer": self.has_conv_layers,
             "arch": self.arch,
@@ -0,0 +1,91 @@
+import time
+
+import gymnasium as gym
+
+from agilerl.components.replay_buffer import ReplayBuffer
+from agilerl.training.train import train
+from agilerl.training.train_actor_learner import train_actor_learner
+from agilerl.utils.utils import initialPopulation
+
+
+def make_env(num_envs=8):
+    return gym.vector.SyncVectorEnv(
+        [lambda: gym.make("CartPole-v1") for _ in range(num_envs)]
+    )
+
+
+def make_pop(pop_size):
+    return initialPopulation(
+        algo="DQN",
+        state_dim=[4],
+        action_dim=2,
+        one_hot=False,
+        net_config={"arch": "mlp", "h_size": [64, 64]},
+        INIT_HP={
+            "BATCH_SIZE": 64,
+            "LR": 1e-3,
+            "GAMMA": 0.99,
+            "LEARN_STEP": 1,
+            "TAU": 1e-3,
+            "DOUBLE": False,
+        },
+        population_size=pop_size,
+    )
+
+
+def count_updates(pop):
+    """Wraps agent.learn to count learning steps."""
+    counter = {"updates": 0}
+    for agent in pop:
+        learn = agent.learn
+
+        def counted(*args, learn=learn, **kwargs):
+            counter["updates"] += 1
+            return learn(*args, **kwargs)
+
+        agent.learn = counted
+    return counter
+
+
+def main(pop_size=2, n_episodes=4, max_steps=500, num_actors=2, num_envs=8):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+
+    pop = make_pop(pop_size)
+    counter = count_updates(pop)
+    memory = ReplayBuffer(2, 100_000, field_names, storage="array")
+    start = time.perf_counter()
+    train(
+        make_env(num_envs),
+        "CartPole-v1",
+        "DQN",
+        pop,
+        memory,
+        n_episodes=n_episodes,
+        max_steps=max_steps,
+        evo_epochs=n_episodes,
+        verbose=False,
+    )
+    elapsed = time.perf_counter() - start
+    env_steps = n_episodes * pop_size * max_steps * num_envs
+    print(
+        f"single process: {env_steps / elapsed:8.1f} env steps/s | "
+        f"{counter['updates'] / elapsed:8.1f} updates/s"
+    )
+
+    pop = make_pop(pop_size)
+    memory = ReplayBuffer(2, 100_000, field_names, storage="shared")
+    train_actor_learner(
+        lambda: make_env(num_envs),
+        "CartPole-v1",
+        "DQN",
+        pop,
+        memory,
+        n_episodes=n_episodes,
+        max_steps=max_steps,
+        evo_epochs=n_episodes,
+        num_actors=num_actors,
+    )
+
+
+if __name__ == "__main__":
+    main()
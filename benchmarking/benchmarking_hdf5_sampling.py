@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from agilerl.components.replay_buffer import ReplayBuffer
+from agilerl.components.sampler import Sampler
+from agilerl.training.train_offline import _fill_memory
+
+
+def write_dataset(path, dataset_length, obs_shape, chunk_rows, compression):
+    """Writes random offline dataset with the given observation chunk layout."""
+    with h5py.File(path, "w") as f:
+        f.create_dataset(
+            "observations",
+            shape=(dataset_length, *obs_shape),
+            dtype=np.uint8,
+            chunks=(chunk_rows, *obs_shape) if chunk_rows else None,
+            compression=compression,
+        )
+        for start in range(0, dataset_length, 10_000):
+            n = min(10_000, dataset_length - start)
+            f["observations"][start : start + n] = np.random.randint(
+                0, 256, (n, *obs_shape), dtype=np.uint8
+            )
+        f.create_dataset("actions", data=np.random.randint(0, 4, dataset_length))
+        f.create_dataset("rewards", data=np.random.rand(dataset_length))
+        f.create_dataset("terminals", data=np.random.rand(dataset_length) < 0.01)
+
+
+def time_sampler(memory, prefetch, batch_size, batches):
+    sampler = Sampler(memory=memory, prefetch=prefetch)
+    sampler.sample(batch_size)
+    start = time.perf_counter()
+    for _ in range(batches):
+        sampler.sample(batch_size)
+        time.sleep(0.002)  # Stands in for a learning step
+    elapsed = time.perf_counter() - start
+    sampler.close()
+    return batches / elapsed
+
+
+def main(dataset_length=50_000, obs_shape=(42, 42, 4), batch_size=256, batches=100):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    print(f"{dataset_length} transitions of shape {obs_shape}")
+    for layout, chunk_rows, compression in [
+        ("contiguous", None, None),
+        ("16-row chunks", 16, None),
+        ("256-row lzf chunks", 256, "lzf"),
+    ]:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "dataset.hdf5")
+            write_dataset(path, dataset_length, obs_shape, chunk_rows, compression)
+            with h5py.File(path, "r") as dataset:
+                start = time.perf_counter()
+                memory = ReplayBuffer(4, dataset_length, field_names, storage="array")
+                _fill_memory(dataset, memory, swap_channels=True)
+                startup = time.perf_counter() - start
+                rate = time_sampler(memory, 0, batch_size, batches)
+                print(
+                    f"{layout:>18}, array buffer:          startup {startup:6.2f} s | "
+                    f"{rate:7.1f} batches/s"
+                )
+                del memory
+
+                for cache_mib, prefetch in [(64, 0), (64, 4), (512, 4)]:
+                    start = time.perf_counter()
+                    memory = ReplayBuffer(
+                        4, dataset_length, field_names, storage="hdf5"
+                    )
+                    memory.memory.cache_bytes = cache_mib * 2**20
+                    memory.memory.open(dataset, swap_channels=True)
+                    startup = time.perf_counter() - start
+                    rate = time_sampler(memory, prefetch, batch_size, batches)
+                    print(
+                        f"{layout:>18}, hdf5 {cache_mib:3} MiB, prefetch {prefetch}: "
+                        f"startup {startup:6.2f} s | {rate:7.1f} batches/s"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import tempfile
+import time
+import tracemalloc
+
+import gymnasium as gym
+import minari
+import numpy as np
+
+from agilerl.components.replay_buffer import ReplayBuffer
+from agilerl.utils import minari_utils
+
+
+def create_dataset(dataset_id, num_episodes):
+    """Stores a Minari dataset of random CartPole episodes locally."""
+    if dataset_id in minari.list_local_datasets():
+        minari.delete_dataset(dataset_id)
+    env = gym.make("CartPole-v1")
+    buffer = []
+    for _ in range(num_episodes):
+        observation, _ = env.reset()
+        observations, actions, rewards, terminations, truncations = (
+            [observation],
+            [],
+            [],
+            [],
+            [],
+        )
+        terminated = truncated = False
+        while not (terminated or truncated):
+            action = env.action_space.sample()
+            observation, reward, terminated, truncated, _ = env.step(action)
+            observations.append(observation)
+            actions.append(action)
+            rewards.append(reward)
+            terminations.append(terminated)
+            truncations.append(truncated)
+        buffer.append(
+            {
+                "observations": np.asarray(observations),
+                "actions": np.asarray(actions),
+                "rewards": np.asarray(rewards),
+                "terminations": np.asarray(terminations),
+                "truncations": np.asarray(truncations),
+            }
+        )
+    minari.create_dataset_from_buffers(
+        dataset_id=dataset_id, env=env, buffer=buffer, algorithm_name="random_policy"
+    )
+
+
+def buffer_per_transition(dataset_id, memory):
+    """Fills memory one transition at a time, as MinariToAgileBuffer previously did."""
+    minari_dataset = minari_utils.load_minari_dataset(dataset_id)
+    for episode in minari_dataset.iterate_episodes():
+        for step in range(len(episode.rewards)):
+            memory.save2memory(
+                episode.observations[step],
+                episode.actions[step],
+                episode.rewards[step],
+                episode.observations[step + 1],
+                episode.terminations[step],
+            )
+
+
+def dataset_from_lists(dataset_id):
+    """Builds whole lists before writing, as MinariToAgileDataset previously did."""
+    minari_dataset = minari_utils.load_minari_dataset(dataset_id)
+    data = {key: [] for key in ("observations", "next_observations", "actions")}
+    for episode in minari_dataset.iterate_episodes():
+        data["observations"].extend(episode.observations[:-1])
+        data["next_observations"].extend(episode.observations[1:])
+        data["actions"].extend(episode.actions[:])
+    return {key: np.asarray(value) for key, value in data.items()}
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def main(dataset_id="cartpole-benchmark-v0", num_episodes=2000, chunk_size=4096):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    create_dataset(dataset_id, num_episodes)
+
+    memory = ReplayBuffer(2, 100_000, field_names, storage="array")
+    elapsed, _ = measure(buffer_per_transition, dataset_id, memory)
+    print(
+        f"buffer, per-transition: {elapsed:7.2f} s | {len(memory) / elapsed:10.0f} transitions/s"
+    )
+    memory = ReplayBuffer(2, 100_000, field_names, storage="array")
+    elapsed, _ = measure(
+        minari_utils.MinariToAgileBuffer, dataset_id, memory, None, False, chunk_size
+    )
+    print(
+        f"buffer, chunked:        {elapsed:7.2f} s | {len(memory) / elapsed:10.0f} transitions/s"
+    )
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for run in ["first", "cached"]:
+            memory = ReplayBuffer(2, 100_000, field_names, storage="array")
+            start = time.perf_counter()
+            minari_utils.MinariToAgileBuffer(
+                dataset_id, memory, chunk_size=chunk_size, cache_dir=cache_dir
+            )
+            elapsed = time.perf_counter() - start
+            print(f"buffer, {run} cache run: {elapsed:6.2f} s")
+
+    elapsed, peak = measure(dataset_from_lists, dataset_id)
+    print(f"dataset, whole lists:   {elapsed:7.2f} s | peak {peak:8.1f} MiB")
+    elapsed, peak = measure(
+        lambda: minari_utils.MinariToAgileDataset(
+            dataset_id, chunk_size=chunk_size
+        ).close()
+    )
+    print(f"dataset, streamed:      {elapsed:7.2f} s | peak {peak:8.1f} MiB")
+
+    minari.delete_dataset(dataset_id)
+    minari.delete_dataset("cartpole_agile-benchmark-v0")
+
+
+if __name__ == "__main__":
+    main()
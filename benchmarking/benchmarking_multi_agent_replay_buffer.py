@@ -0,0 +1,48 @@
+import timeit
+
+import numpy as np
+
+from agilerl.components.multi_agent_replay_buffer import MultiAgentReplayBuffer
+
+
+def main(
+    num_agents=8,
+    num_envs=32,
+    state_dim=18,
+    action_dim=5,
+    memory_size=100_000,
+    batch_size=256,
+    repeats=100,
+):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    agent_ids = [f"agent_{i}" for i in range(num_agents)]
+    transition = (
+        {agent_id: np.random.rand(num_envs, state_dim) for agent_id in agent_ids},
+        {agent_id: np.random.rand(num_envs, action_dim) for agent_id in agent_ids},
+        {agent_id: np.random.rand(num_envs) for agent_id in agent_ids},
+        {agent_id: np.random.rand(num_envs, state_dim) for agent_id in agent_ids},
+        {agent_id: np.random.rand(num_envs) < 0.01 for agent_id in agent_ids},
+    )
+
+    print(f"Agents: {num_agents}, envs: {num_envs}, batch size: {batch_size}")
+    for storage in ["deque", "array"]:
+        memory = MultiAgentReplayBuffer(
+            memory_size, field_names, agent_ids, storage=storage
+        )
+
+        def save():
+            memory.save2memory(*transition, is_vectorised=True)
+
+        def sample():
+            return memory.sample(batch_size)
+
+        save_time = timeit.timeit(save, number=repeats) / repeats
+        sample_time = timeit.timeit(sample, number=repeats) / repeats
+        print(
+            f"{storage:>6}: save {save_time * 1e3:8.3f} ms | "
+            f"sample {sample_time * 1e3:8.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from agilerl.components.replay_buffer import ReplayBuffer
+from agilerl.training.train_offline import _fill_memory
+
+
+def fill_per_transition(dataset, memory, swap_channels):
+    """Fills memory one transition at a time, as train_offline previously did."""
+    for i in range(dataset["rewards"].shape[0] - 1):
+        state = dataset["observations"][i]
+        next_state = dataset["observations"][i + 1]
+        if swap_channels:
+            state = np.moveaxis(state, [-1], [-3])
+            next_state = np.moveaxis(next_state, [-1], [-3])
+        action = dataset["actions"][i]
+        reward = dataset["rewards"][i]
+        done = bool(dataset["terminals"][i])
+        memory.save2memory(state, action, reward, next_state, done)
+
+
+def main(dataset_length=20_000, obs_shape=(42, 42, 4)):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "dataset.h5")
+        with h5py.File(path, "w") as f:
+            f.create_dataset(
+                "observations",
+                data=np.random.randint(
+                    0, 256, (dataset_length, *obs_shape), dtype=np.uint8
+                ),
+            )
+            f.create_dataset("actions", data=np.random.randint(0, 4, dataset_length))
+            f.create_dataset("rewards", data=np.random.rand(dataset_length))
+            f.create_dataset("terminals", data=np.random.rand(dataset_length) < 0.01)
+
+        print(f"{dataset_length} transitions of shape {obs_shape}")
+        for name, fill_fn, storage in [
+            ("per-transition, deque", fill_per_transition, "deque"),
+            ("per-transition, array", fill_per_transition, "array"),
+            ("chunked, deque", _fill_memory, "deque"),
+            ("chunked, array", _fill_memory, "array"),
+        ]:
+            memory = ReplayBuffer(4, dataset_length, field_names, storage=storage)
+            with h5py.File(path, "r") as dataset:
+                start = time.perf_counter()
+                fill_fn(dataset, memory, True)
+                elapsed = time.perf_counter() - start
+            print(
+                f"{name:>22}: {elapsed:7.2f} s | "
+                f"{(dataset_length - 1) / elapsed:10.0f} transitions/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
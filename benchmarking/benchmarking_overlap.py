@@ -0,0 +1,71 @@
+import time
+
+import torch
+
+from agilerl.components.replay_buffer import ReplayBuffer
+from agilerl.training.train import train
+from agilerl.utils.utils import initialPopulation, makeVectEnvs
+
+
+def main(env_name="Acrobot-v1", num_envs=16, n_episodes=4, max_steps=100):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    INIT_HP = {
+        "BATCH_SIZE": 256,
+        "LR": 1e-3,
+        "GAMMA": 0.99,
+        "LEARN_STEP": 1,
+        "TAU": 1e-3,
+        "DOUBLE": False,
+        "CHANNELS_LAST": False,
+    }
+    NET_CONFIG = {"arch": "mlp", "h_size": [256, 256]}
+
+    for envs_per_worker in [1, 4]:
+        for overlap in [False, True]:
+            env = makeVectEnvs(
+                env_name, num_envs=num_envs, envs_per_worker=envs_per_worker
+            )
+            state_dim = env.single_observation_space.shape
+            action_dim = env.single_action_space.n
+            memory = ReplayBuffer(
+                action_dim,
+                100_000,
+                field_names=["state", "action", "reward", "next_state", "done"],
+                device=device,
+                storage="array",
+            )
+            pop = initialPopulation(
+                algo="DQN",
+                state_dim=state_dim,
+                action_dim=action_dim,
+                one_hot=False,
+                net_config=NET_CONFIG,
+                INIT_HP=INIT_HP,
+                population_size=1,
+                device=device,
+            )
+            start = time.perf_counter()
+            train(
+                env,
+                env_name,
+                "DQN",
+                pop,
+                memory,
+                n_episodes=n_episodes,
+                max_steps=max_steps,
+                evo_epochs=n_episodes + 1,
+                target=None,
+                verbose=False,
+                overlap=overlap,
+            )
+            elapsed = time.perf_counter() - start
+            env.close()
+            print(
+                f"{envs_per_worker} env(s)/worker, overlap {str(overlap):>5}: "
+                f"{elapsed:6.2f} s | "
+                f"{n_episodes * max_steps * num_envs / elapsed:8.0f} env steps/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import time
+
+import gymnasium as gym
+import torch
+
+from agilerl.training.population_evaluator import PopulationEvaluator
+from agilerl.utils.utils import initialPopulation
+
+
+def main(env_name="CartPole-v1", pop_size=6, max_steps=500, loop=3, repeats=3):
+    INIT_HP = {
+        "BATCH_SIZE": 64,
+        "LR": 1e-3,
+        "GAMMA": 0.99,
+        "LEARN_STEP": 1,
+        "TAU": 1e-3,
+        "DOUBLE": False,
+        "CHANNELS_LAST": False,
+    }
+    NET_CONFIG = {"arch": "mlp", "h_size": [64, 64]}
+
+    def make_env():
+        return gym.vector.SyncVectorEnv([lambda: gym.make(env_name)] * 4)
+
+    env = make_env()
+    torch.manual_seed(42)
+    pop = initialPopulation(
+        algo="DQN",
+        state_dim=env.single_observation_space.shape,
+        action_dim=env.single_action_space.n,
+        one_hot=False,
+        net_config=NET_CONFIG,
+        INIT_HP=INIT_HP,
+        population_size=pop_size,
+        device="cpu",
+    )
+    test_kwargs = {"swap_channels": False, "max_steps": max_steps, "loop": loop}
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        [agent.test(env, **test_kwargs) for agent in pop]
+    print(f"{'serial':>12}: {(time.perf_counter() - start) / repeats:6.2f} s per evaluation")
+
+    for backend in ["thread", "process"]:
+        evaluator = PopulationEvaluator(make_env, backend=backend, seed=42)
+        evaluator.evaluate(pop, **test_kwargs)  # Builds environments and workers
+        start = time.perf_counter()
+        for _ in range(repeats):
+            evaluator.evaluate(pop, **test_kwargs)
+        elapsed = (time.perf_counter() - start) / repeats
+        eval_times = [round(eval_time, 2) for eval_time in evaluator.eval_times]
+        evaluator.close()
+        print(f"{backend:>12}: {elapsed:6.2f} s per evaluation | member times {eval_times}")
+    env.close()
+
+
+if __name__ == "__main__":
+    main()
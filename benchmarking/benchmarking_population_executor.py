@@ -0,0 +1,74 @@
+import time
+
+import gymnasium as gym
+import torch
+
+from agilerl.components.replay_buffer import ReplayBuffer
+from agilerl.training.population_executor import PopulationExecutor
+from agilerl.training.train import train
+from agilerl.utils.utils import initialPopulation
+
+
+def main(env_name="CartPole-v1", pop_size=6, n_episodes=10, max_steps=200, seed=42):
+    INIT_HP = {
+        "BATCH_SIZE": 64,
+        "LR": 1e-3,
+        "GAMMA": 0.99,
+        "LEARN_STEP": 1,
+        "TAU": 1e-3,
+        "DOUBLE": False,
+        "CHANNELS_LAST": False,
+    }
+    NET_CONFIG = {"arch": "mlp", "h_size": [64, 64]}
+
+    def make_env():
+        return gym.vector.SyncVectorEnv([lambda: gym.make(env_name)] * 4)
+
+    for parallel in [False, True, True]:
+        env = make_env()
+        torch.manual_seed(seed)
+        pop = initialPopulation(
+            algo="DQN",
+            state_dim=env.single_observation_space.shape,
+            action_dim=env.single_action_space.n,
+            one_hot=False,
+            net_config=NET_CONFIG,
+            INIT_HP=INIT_HP,
+            population_size=pop_size,
+            device="cpu",
+        )
+        memory = ReplayBuffer(
+            env.single_action_space.n,
+            50_000,
+            field_names=["state", "action", "reward", "next_state", "done"],
+            storage="array",
+        )
+        executor = None
+        if parallel:
+            executor = PopulationExecutor(make_env, seed=seed)
+        start = time.perf_counter()
+        pop, pop_fitnesses = train(
+            env,
+            env_name,
+            "DQN",
+            pop,
+            memory,
+            n_episodes=n_episodes,
+            max_steps=max_steps,
+            evo_epochs=n_episodes // 2,
+            target=500.0,
+            verbose=False,
+            executor=executor,
+        )
+        elapsed = time.perf_counter() - start
+        env.close()
+        name = "parallel" if parallel else "serial"
+        print(
+            f"{name:>12}: {elapsed:6.2f} s | "
+            f"{pop_size * n_episodes * max_steps * 4 / elapsed:8.0f} env steps/s | "
+            f"fitnesses {[round(float(f), 1) for f in pop_fitnesses[-1]]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import timeit
+
+import numpy as np
+
+from agilerl.components.replay_buffer import ReplayBuffer
+
+
+def main(memory_size=100_000, state_dim=64, batch_size=256, repeats=20):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    for storage in ["deque", "array"]:
+        memory = ReplayBuffer(
+            action_dim=1,
+            memory_size=memory_size,
+            field_names=field_names,
+            storage=storage,
+        )
+        states = np.random.rand(memory_size + 1, state_dim).astype(np.float32)
+        memory.save2memory(
+            states[:-1],
+            np.random.randint(0, 4, memory_size),
+            np.random.rand(memory_size),
+            states[1:],
+            np.random.rand(memory_size) < 0.01,
+            is_vectorised=True,
+        )
+
+        for pop_size in [4, 8, 16]:
+            # Mutated members can have different batch sizes
+            batch_sizes = [batch_size // 2 * (1 + i % 3) for i in range(pop_size)]
+
+            def sample_members():
+                return [memory.sample(size) for size in batch_sizes]
+
+            def sample_population():
+                return memory.sample_population(batch_sizes)
+
+            members_time = timeit.timeit(sample_members, number=repeats) / repeats
+            population_time = timeit.timeit(sample_population, number=repeats) / repeats
+            print(
+                f"{storage:>6} | pop {pop_size:3}: per member {members_time * 1e3:8.3f} ms | "
+                f"population {population_time * 1e3:8.3f} ms | "
+                f"speedup {members_time / population_time:5.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
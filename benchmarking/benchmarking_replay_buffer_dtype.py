@@ -0,0 +1,89 @@
+import timeit
+
+import numpy as np
+import torch
+
+from agilerl.components.replay_buffer import ReplayBuffer
+
+
+class FloatFirstReplayBuffer(ReplayBuffer):
+    """Baseline replay buffer that casts fields to float32 on the host before copying
+    them to the device."""
+
+    def _process_field(self, field, ts, np_array=False):
+        ts = super()._process_field(field, ts, np_array=True)
+        if np_array:
+            return ts
+        ts = torch.from_numpy(ts).float()
+        if self.device is not None:
+            ts = ts.to(self.device)
+        return ts
+
+
+def fill(memory, frames, num_envs):
+    for i in range(0, len(frames) - num_envs, num_envs):
+        memory.save2memory(
+            frames[i : i + num_envs],
+            np.random.randint(0, 4, num_envs),
+            np.random.rand(num_envs),
+            frames[i + 1 : i + num_envs + 1],
+            np.random.rand(num_envs) < 0.01,
+            is_vectorised=True,
+        )
+
+
+def copied_bytes(memory, batch_size):
+    """Returns bytes of the state and next state tensors copied to the device per batch,
+    measured from the host tensors of a sampled batch."""
+    idxs = np.random.randint(len(memory), size=batch_size)
+    if memory.storage == "deque":
+        batch = memory._process_transition([memory.memory[i] for i in idxs], True)
+    else:
+        batch = memory._process_indices(idxs, np_array=True)
+    total = 0
+    for field in ["state", "next_state"]:
+        ts = torch.from_numpy(batch[field])
+        if isinstance(memory, FloatFirstReplayBuffer):
+            ts = ts.float()
+        total += ts.numel() * ts.element_size()
+    return total
+
+
+def main(
+    memory_size=10_000, frame_shape=(4, 84, 84), num_envs=8, batch_size=32, repeats=50
+):
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    frames = np.random.randint(0, 256, (memory_size + 1, *frame_shape), dtype=np.uint8)
+
+    print(f"Device: {device}, frame shape: {frame_shape}, batch size: {batch_size}")
+    for storage in ["deque", "array"]:
+        for buffer_class, path in [
+            (FloatFirstReplayBuffer, "float first"),
+            (ReplayBuffer, "stored dtype"),
+        ]:
+            memory = buffer_class(
+                action_dim=1,
+                memory_size=memory_size,
+                field_names=field_names,
+                device=device,
+                storage=storage,
+            )
+            fill(memory, frames, num_envs)
+            batch_bytes = copied_bytes(memory, batch_size)
+
+            def sample():
+                return memory.sample(batch_size)
+
+            sample_time = timeit.timeit(sample, number=repeats) / repeats
+            print(
+                f"{storage:>6}, {path:>12}: "
+                f"frames copied {batch_bytes / 2**20:6.1f} MiB/batch | "
+                f"sample {sample_time * 1e3:8.3f} ms | "
+                f"{batch_size / sample_time:10.0f} samples/s"
+            )
+            del memory
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+from accelerate import Accelerator
+from torch.utils.data import DataLoader
+
+from agilerl.components.replay_buffer import ReplayBuffer
+from agilerl.components.replay_data import ReplayDataset
+from agilerl.components.sampler import Sampler
+
+# Run with 2+ processes using accelerate launch with a multi-process config, or on CPU with
+# ACCELERATE_USE_CPU=true torchrun --nproc_per_node 2 benchmarking/benchmarking_replay_dataset.py
+
+
+def main(memory_size=50_000, state_dim=64, batch_size=256, steps=200):
+    accelerator = Accelerator()
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    memory = ReplayBuffer(
+        action_dim=1, memory_size=memory_size, field_names=field_names, storage="array"
+    )
+    states = np.random.rand(memory_size + 1, state_dim).astype(np.float32)
+    memory.save2memory(
+        states[:-1],
+        np.random.randint(0, 4, memory_size),
+        np.random.rand(memory_size),
+        states[1:],
+        np.random.rand(memory_size) < 0.01,
+        is_vectorised=True,
+    )
+
+    for num_workers in [0, 2]:
+        for persistent in [False, True]:
+            replay_dataset = ReplayDataset(memory, batch_size)
+            replay_dataloader = accelerator.prepare(
+                DataLoader(
+                    replay_dataset,
+                    batch_size=None,
+                    num_workers=num_workers,
+                    persistent_workers=persistent and num_workers > 0,
+                )
+            )
+            sampler = Sampler(
+                distributed=True, dataset=replay_dataset, dataloader=replay_dataloader
+            )
+
+            accelerator.wait_for_everyone()
+            start = time.perf_counter()
+            for _ in range(steps):
+                if persistent:
+                    sampler.sample(batch_size)
+                else:
+                    # A new dataloader iterator on every call
+                    replay_dataset.batch_size = batch_size
+                    next(iter(replay_dataloader))
+            accelerator.wait_for_everyone()
+            elapsed = time.perf_counter() - start
+
+            if accelerator.is_main_process:
+                mode = "persistent iterator" if persistent else "new iterator per call"
+                print(
+                    f"{accelerator.num_processes} processes, {num_workers} workers, "
+                    f"{mode:>21}: {steps * batch_size / elapsed:10.0f} samples/s per process"
+                )
+
+
+if __name__ == "__main__":
+    main()
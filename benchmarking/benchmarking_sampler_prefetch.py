@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+import torch
+
+from agilerl.components.replay_buffer import ReplayBuffer
+from agilerl.components.sampler import Sampler
+
+
+def main(memory_size=20_000, batch_size=256, learn_steps=200, prefetch=4):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    memory = ReplayBuffer(
+        action_dim=1, memory_size=memory_size, field_names=field_names, storage="array"
+    )
+    states = np.random.randint(0, 256, (memory_size + 1, 4, 42, 42), dtype=np.uint8)
+    memory.save2memory(
+        states[:-1],
+        np.random.randint(0, 4, memory_size),
+        np.random.rand(memory_size),
+        states[1:],
+        np.random.rand(memory_size) < 0.01,
+        is_vectorised=True,
+    )
+
+    net = torch.nn.Sequential(
+        torch.nn.Flatten(), torch.nn.Linear(4 * 42 * 42, 256), torch.nn.ReLU()
+    )
+
+    def learn(experiences):
+        states = experiences[0]
+        with torch.no_grad():
+            net(states / 255.0)
+
+    for n_prefetch in [0, prefetch]:
+        sampler = Sampler(memory=memory, prefetch=n_prefetch)
+        start = time.perf_counter()
+        for _ in range(learn_steps):
+            learn(sampler.sample(batch_size))
+        elapsed = time.perf_counter() - start
+        sampler.close()
+        print(
+            f"prefetch {n_prefetch}: {learn_steps / elapsed:8.1f} learn steps/s | "
+            f"waits {sampler.waits}/{sampler.requests}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import random
+import timeit
+
+import numpy as np
+
+from agilerl.components.replay_buffer import PrioritizedReplayBuffer
+
+
+def main(memory_size=2**16, batch_size=256, beta=0.4, repeats=100):
+    memory = PrioritizedReplayBuffer(
+        action_dim=2,
+        memory_size=memory_size,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=1,
+        storage="array",
+    )
+    for i in range(memory_size):
+        memory.save2memory(np.array([i]), 0, 1.0, np.array([i + 1]), False)
+    memory.update_priorities(np.arange(memory_size), np.random.rand(memory_size))
+    sum_tree, min_tree = memory.sum_tree, memory.min_tree
+
+    idxs = np.random.randint(0, memory_size, size=batch_size)
+    priorities = np.random.rand(batch_size)
+    p_total = sum_tree.sum(0, len(memory) - 1)
+    upperbounds = np.array([random.uniform(0, p_total) for _ in range(batch_size)])
+
+    def retrieve_loop():
+        return [sum_tree.retrieve(ub) for ub in upperbounds]
+
+    def retrieve_batch():
+        return sum_tree.retrieve(upperbounds)
+
+    def update_loop():
+        for idx, priority in zip(idxs, priorities):
+            sum_tree[idx] = priority**memory.alpha
+            min_tree[idx] = priority**memory.alpha
+
+    def update_batch():
+        memory.update_priorities(idxs, priorities)
+
+    def weights_loop():
+        return np.array([memory._calculate_weight(i, beta) for i in idxs])
+
+    def weights_batch():
+        return memory._calculate_weights(idxs, beta)
+
+    assert retrieve_loop() == retrieve_batch().tolist()
+    assert np.array_equal(weights_loop(), weights_batch())
+
+    print(f"Memory size: {memory_size}, batch size: {batch_size}")
+    for name, loop_fn, batch_fn in [
+        ("retrieve", retrieve_loop, retrieve_batch),
+        ("update", update_loop, update_batch),
+        ("weights", weights_loop, weights_batch),
+    ]:
+        loop_time = timeit.timeit(loop_fn, number=repeats) / repeats
+        batch_time = timeit.timeit(batch_fn, number=repeats) / repeats
+        print(
+            f"{name:>10}: loop {loop_time * 1e3:8.3f} ms | batch {batch_time * 1e3:8.3f} ms | "
+            f"speedup {loop_time / batch_time:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
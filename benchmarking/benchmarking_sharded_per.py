@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+from accelerate import Accelerator
+
+from agilerl.components.replay_buffer import ShardedPrioritizedReplayBuffer
+
+# Run with several processes, e.g.
+#   ACCELERATE_USE_CPU=true torchrun --nproc_per_node 2 benchmarking/benchmarking_sharded_per.py
+
+
+def main(memory_size=100_000, batch_size=256, learn_steps=200):
+    accelerator = Accelerator(cpu=True)
+    rank, world_size = accelerator.process_index, accelerator.num_processes
+    memory = ShardedPrioritizedReplayBuffer(
+        action_dim=2,
+        memory_size=memory_size,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=memory_size,
+        accelerator=accelerator,
+        storage="array",
+    )
+    states = np.random.rand(memory_size + 1, 8).astype(np.float32)
+    memory.save2memory(
+        states[:-1],
+        np.random.randint(0, 2, memory_size),
+        np.random.rand(memory_size),
+        states[1:],
+        np.zeros(memory_size, dtype=bool),
+        is_vectorised=True,
+    )
+    # Later shards hold higher priority experiences
+    # Indices passed to update_priorities identify the owning shard, as returned by sample
+    memory.update_priorities(
+        rank * memory_size + np.arange(memory_size), np.full(memory_size, rank + 1.0)
+    )
+    shard_sums = np.array([(r + 1) ** memory.alpha for r in range(world_size)])
+
+    owners = np.zeros(world_size)
+    start = time.perf_counter()
+    for _ in range(learn_steps):
+        *_, idxs = memory.sample(batch_size, 0.4)
+        owners += np.bincount(idxs // memory_size, minlength=world_size)
+        memory.update_priorities(idxs, idxs // memory_size + 1.0)
+    elapsed = time.perf_counter() - start
+
+    if accelerator.is_main_process:
+        print(
+            f"{world_size} shards x {memory_size} experiences: "
+            f"{learn_steps / elapsed:8.1f} sample + update steps/s"
+        )
+        print(f"sampled share per shard:  {np.round(owners / owners.sum(), 3)}")
+        print(f"priority share per shard: {np.round(shard_sums / shard_sums.sum(), 3)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import time
+
+import numpy as np
+import torch
+
+from agilerl.components.stacked_population import StackedPopulation
+from agilerl.utils.utils import initialPopulation
+
+
+def main(
+    pop_sizes=(1, 2, 4, 8, 16), n_updates=200, batch_size=64, state_dim=8, seed=42
+):
+    INIT_HP = {
+        "BATCH_SIZE": batch_size,
+        "LR": 1e-3,
+        "GAMMA": 0.99,
+        "LEARN_STEP": 1,
+        "TAU": 1e-3,
+        "DOUBLE": False,
+        "CHANNELS_LAST": False,
+    }
+    NET_CONFIG = {"arch": "mlp", "h_size": [64, 64]}
+    action_dim = 4
+
+    for pop_size in pop_sizes:
+        torch.manual_seed(seed)
+        pop = initialPopulation(
+            algo="DQN",
+            state_dim=(state_dim,),
+            action_dim=action_dim,
+            one_hot=False,
+            net_config=NET_CONFIG,
+            INIT_HP=INIT_HP,
+            population_size=pop_size,
+            device="cpu",
+        )
+        experiences = [
+            [
+                torch.randn(batch_size, state_dim),
+                torch.randint(0, action_dim, (batch_size, 1)),
+                torch.randn(batch_size, 1),
+                torch.randn(batch_size, state_dim),
+                torch.randint(0, 2, (batch_size, 1)).float(),
+            ]
+            for _ in pop
+        ]
+        states = [np.random.rand(state_dim).astype(np.float32) for _ in pop]
+
+        start = time.perf_counter()
+        for _ in range(n_updates):
+            for agent, experience in zip(pop, experiences):
+                agent.learn(experience)
+        sequential_learn = pop_size * n_updates / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(n_updates):
+            for agent, state in zip(pop, states):
+                agent.getAction(state)
+        sequential_act = pop_size * n_updates / (time.perf_counter() - start)
+
+        stacked = StackedPopulation(pop)
+        start = time.perf_counter()
+        for _ in range(n_updates):
+            stacked.learn(experiences)
+        stacked_learn = pop_size * n_updates / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(n_updates):
+            stacked.getAction(states)
+        stacked_act = pop_size * n_updates / (time.perf_counter() - start)
+        stacked.release()
+
+        print(
+            f"POP_SIZE {pop_size:>3} | learn: sequential {sequential_learn:7.0f} "
+            f"updates/s, stacked {stacked_learn:7.0f} updates/s | getAction: "
+            f"sequential {sequential_act:7.0f} actions/s, stacked {stacked_act:7.0f} "
+            f"actions/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
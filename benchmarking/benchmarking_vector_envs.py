@@ -0,0 +1,41 @@
+import time
+
+import gymnasium as gym
+import numpy as np
+
+from agilerl.utils.utils import makeVectEnvs
+from agilerl.utils.vector_envs import measure_step_latency
+
+
+def main(num_envs=16, steps=500):
+    settings = {
+        "sync": {"mode": "sync"},
+        "async, 1 env/worker": {"mode": "async"},
+        "async, 4 envs/worker": {"mode": "async", "envs_per_worker": 4},
+        "async, 4 envs/worker, pinned": {
+            "mode": "async",
+            "envs_per_worker": 4,
+            "cpu_affinity": True,
+        },
+        "auto": {"mode": "auto"},
+    }
+    for env_name in ["CartPole-v1", "Acrobot-v1"]:
+        latency = measure_step_latency(lambda: gym.make(env_name))
+        print(f"{env_name}: {latency * 1e6:.1f} us per env.step, {num_envs} envs")
+        for name, kwargs in settings.items():
+            env = makeVectEnvs(env_name, num_envs=num_envs, **kwargs)
+            env.reset(seed=0)
+            actions = np.stack([env.action_space.sample() for _ in range(steps)])
+            start = time.perf_counter()
+            for action in actions:
+                env.step(action)
+            elapsed = time.perf_counter() - start
+            env.close()
+            print(
+                f"{name:>30}: {steps * num_envs / elapsed:10.0f} env steps/s "
+                f"({type(env).__name__})"
+            )
+
+
+if __name__ == "__main__":
+    main()
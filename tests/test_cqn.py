@@ -409,6 +409,33 @@ def test_algorithm_test_loop():
     assert isinstance(mean_score, float)
 
 
+# Runs algorithm test loop collecting episodes from every vectorised environment
+@pytest.mark.parametrize(
+    "loop, expected_score, expected_steps", [(3, 2, 3), (4, 1.75, 4)]
+)
+def test_algorithm_test_loop_uses_all_envs(loop, expected_score, expected_steps):
+    class CountingEnv(DummyEnv):
+        # Sub-environment i scores 1 per step and terminates after i + 1 steps
+        def reset(self):
+            self.t = 0
+            return super().reset()
+
+        def step(self, action):
+            self.t += 1
+            self.steps += 1
+            done = np.arange(self.num_envs) + 1 <= self.t
+            return np.random.rand(*self.state_size), np.ones(3), done, done, {}
+
+    env = CountingEnv(state_size=(4,), vect=True, num_envs=3)
+    env.steps = 0
+
+    agent = CQN(state_dim=(4,), action_dim=2, one_hot=False)
+    mean_score = agent.test(env, max_steps=10, loop=loop)
+    assert mean_score == pytest.approx(expected_score)
+    assert env.steps == expected_steps
+    assert agent.fitness[-1] == mean_score
+
+
 # Runs algorithm test loop with unvectorised env
 def test_algorithm_test_loop_unvectorized():
     state_dim = (4,)
@@ -1,5 +1,6 @@
 import copy
 
+import numpy as np
 import pytest
 import torch
 import torch.nn as nn
@@ -238,6 +239,19 @@ def test_forward_method_with_different_input_types(simple_mlp):
     assert isinstance(output2, torch.Tensor)
 
 
+# uint8 frames are cast and normalized on the device when normalize is set
+def test_forward_method_with_uint8_frames(simple_cnn):
+    input_tensor = torch.randn(1, 3, 64, 64)
+    frames = np.random.randint(0, 256, (1, 3, 64, 64), dtype=np.uint8)
+    evolvable_network = MakeEvolvable(simple_cnn, input_tensor, normalize=True)
+    assert evolvable_network.init_dict["normalize"]
+    with torch.no_grad():
+        output1 = evolvable_network.forward(frames)
+        evolvable_network.normalize = False
+        output2 = evolvable_network.forward(torch.FloatTensor(frames) / 255.0)
+    assert torch.allclose(output1, output2)
+
+
 # The forward() method can handle different types of normalization layers (e.g., BatchNorm2d, InstanceNorm3d).
 def test_forward_with_different_normalization_layers():
     network = nn.Sequential(
@@ -1,4 +1,8 @@
 import copy
+import os
+import threading
+import time
+from unittest.mock import patch
 
 import gymnasium as gym
 import minari
@@ -168,3 +172,189 @@ def test_load_remote_minari_dataset(dataset_id):
     assert isinstance(dataset, MinariDataset)
 
     check_delete_dataset(dataset_id)
+
+
+@pytest.mark.parametrize(
+    "dataset_id,env_id",
+    [("cartpole-test-v0", "CartPole-v1")],
+)
+def test_minari_to_agile_streaming_matches_per_transition(dataset_id, env_id):
+    """Test chunked conversion matches per-transition conversion."""
+
+    field_names = ["state", "action", "reward", "next_state", "done"]
+
+    create_dataset_return_timesteps(dataset_id, env_id)
+    minari_dataset = minari_utils.load_minari_dataset(dataset_id)
+
+    expected = ReplayBuffer(2, 10000, field_names=field_names, storage="array")
+    for episode in minari_dataset.iterate_episodes():
+        for step in range(len(episode.rewards)):
+            expected.save2memory(
+                episode.observations[step],
+                episode.actions[step],
+                episode.rewards[step],
+                episode.observations[step + 1],
+                episode.terminations[step],
+            )
+
+    memory = ReplayBuffer(2, 10000, field_names=field_names, storage="array")
+    minari_utils.MinariToAgileBuffer(dataset_id, memory, chunk_size=7)
+
+    assert len(memory) == len(expected)
+    assert memory.counter == expected.counter
+    for field in field_names:
+        assert np.array_equal(
+            memory.memory.fields[field][: len(memory)],
+            expected.memory.fields[field][: len(expected)],
+        )
+
+    dataset = minari_utils.MinariToAgileDataset(
+        dataset_id, chunk_size=7, compression="gzip"
+    )
+
+    for key, field in [
+        ("observations", "state"),
+        ("next_observations", "next_state"),
+        ("actions", "action"),
+        ("rewards", "reward"),
+        ("terminals", "done"),
+    ]:
+        assert dataset[key].maxshape[0] is None
+        assert dataset[key].chunks is not None
+        assert dataset[key].compression == "gzip"
+        assert np.array_equal(
+            np.asarray(dataset[key][:]).reshape(len(expected), -1),
+            expected.memory.fields[field][: len(expected)].reshape(len(expected), -1),
+        )
+    dataset.close()
+
+    check_delete_dataset(dataset_id)
+    check_delete_dataset("cartpole_agile-test-v0")
+
+
+@pytest.mark.parametrize(
+    "dataset_id,env_id",
+    [("cartpole-test-v0", "CartPole-v1")],
+)
+def test_minari_to_agile_buffer_cache(dataset_id, env_id, tmpdir):
+    """Test converted datasets are cached and reused."""
+
+    field_names = ["state", "action", "reward", "next_state", "done"]
+
+    create_dataset_return_timesteps(dataset_id, env_id)
+
+    expected = ReplayBuffer(2, 10000, field_names=field_names, storage="array")
+    minari_utils.MinariToAgileBuffer(dataset_id, expected)
+
+    cache_dir = str(tmpdir)
+    path = minari_utils.cached_buffer_path(cache_dir, dataset_id)
+    assert path != minari_utils.cached_buffer_path(
+        cache_dir, dataset_id, swap_channels=True
+    )
+
+    memory = ReplayBuffer(2, 10000, field_names=field_names, storage="array")
+    minari_utils.MinariToAgileBuffer(
+        dataset_id, memory, chunk_size=7, cache_dir=cache_dir
+    )
+    assert os.path.exists(os.path.join(path, "meta.json"))
+
+    # Later runs read the cache without converting episodes
+    cached = ReplayBuffer(2, 10000, field_names=field_names, storage="array")
+    with patch.object(minari_utils, "_iterate_chunks", side_effect=AssertionError):
+        minari_utils.MinariToAgileBuffer(
+            dataset_id, cached, chunk_size=7, cache_dir=cache_dir
+        )
+
+    for buffer in [memory, cached]:
+        assert len(buffer) == len(expected)
+        for field in field_names:
+            assert np.array_equal(
+                buffer.memory.fields[field][: len(buffer)],
+                expected.memory.fields[field][: len(expected)],
+            )
+
+    check_delete_dataset(dataset_id)
+
+
+def test_build_once_waits_for_builder(tmpdir):
+    """Test processes that do not build a cache wait until it exists."""
+
+    path = os.path.join(str(tmpdir), "cache")
+    calls = []
+
+    def build(path):
+        calls.append(path)
+        os.makedirs(path)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            f.write("{}")
+
+    waiter = threading.Thread(
+        target=minari_utils._build_once, args=(path, build), kwargs={"builder": False}
+    )
+    waiter.start()
+    minari_utils._build_once(path, build)
+    waiter.join(timeout=10)
+    minari_utils._build_once(path, build)
+
+    assert not waiter.is_alive()
+    assert calls == [path]
+
+
+def test_build_once_raises_when_builder_fails(tmpdir):
+    """Test processes waiting for a cache raise once its builder fails."""
+
+    path = os.path.join(str(tmpdir), "cache")
+    errors = []
+
+    def wait():
+        try:
+            minari_utils._build_once(path, None, builder=False, timeout=10)
+        except RuntimeError as e:
+            errors.append(e)
+
+    def build(path):
+        time.sleep(0.5)  # Lets the waiting thread start first
+        raise ValueError("conversion failed")
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    with pytest.raises(ValueError):
+        minari_utils._build_once(path, build)
+    waiter.join(timeout=10)
+
+    assert not waiter.is_alive()
+    assert len(errors) == 1 and "conversion failed" in str(errors[0])
+
+    # A later successful build removes the failure file
+    minari_utils._build_once(path, lambda path: os.makedirs(path))
+    assert not os.path.exists(f"{path}.failed")
+
+
+def test_build_once_times_out(tmpdir):
+    """Test processes waiting for a cache that is never built give up after a timeout."""
+
+    path = os.path.join(str(tmpdir), "cache")
+    with pytest.raises(TimeoutError):
+        minari_utils._build_once(path, None, builder=False, timeout=0.2)
+
+
+@pytest.mark.parametrize(
+    "dataset_id,env_id",
+    [("cartpole-test-v0", "CartPole-v1")],
+)
+def test_dataset_hash_tracks_data_file_versions(dataset_id, env_id):
+    """Test dataset hashes are keyed on data file versions without reading contents."""
+
+    create_dataset_return_timesteps(dataset_id, env_id)
+
+    data_path = os.path.join(
+        minari_utils.get_dataset_path(dataset_id), "data", "main_data.hdf5"
+    )
+    with patch("builtins.open", side_effect=AssertionError):
+        first = minari_utils.dataset_hash(dataset_id)
+    assert minari_utils.dataset_hash(dataset_id) == first
+
+    os.utime(data_path, ns=(0, 0))
+    assert minari_utils.dataset_hash(dataset_id) != first
+
+    check_delete_dataset(dataset_id)
@@ -1,4 +1,7 @@
+import os
+
 import numpy as np
+import pytest
 import torch
 
 from agilerl.components.multi_agent_replay_buffer import MultiAgentReplayBuffer
@@ -479,3 +482,83 @@ def test_returns_torch_transition_dictionary():
     assert torch.equal(
         transition["done"]["agent2"], torch.from_numpy(np.array([[0], [1]])).to(device)
     )
+
+
+# Array storage returns the same transitions as deque storage
+def test_array_storage_matches_deque_storage():
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    agent_ids = ["agent_0", "agent_1", "agent_2"]
+    buffers = [
+        MultiAgentReplayBuffer(50, field_names, agent_ids, storage=storage)
+        for storage in ["deque", "array"]
+    ]
+
+    rng = np.random.default_rng(0)
+    num_envs = 4
+    for _ in range(5):
+        transition = (
+            {agent_id: rng.random((num_envs, 3)) for agent_id in agent_ids},
+            {agent_id: rng.random((num_envs, 2)) for agent_id in agent_ids},
+            {agent_id: rng.random(num_envs) for agent_id in agent_ids},
+            {agent_id: rng.random((num_envs, 3)) for agent_id in agent_ids},
+            {agent_id: rng.random(num_envs) < 0.5 for agent_id in agent_ids},
+        )
+        for buffer in buffers:
+            buffer.save2memory(*transition, is_vectorised=True)
+    # Unvectorised save of the first env's last transition
+    single_transition = [
+        {agent_id: value[0] for agent_id, value in field.items()}
+        for field in transition
+    ]
+    for buffer in buffers:
+        buffer.save2memory(*single_transition)
+
+    deque_buffer, array_buffer = buffers
+    assert len(deque_buffer) == len(array_buffer) == 21
+    assert deque_buffer.counter == array_buffer.counter == 21
+
+    idxs = np.arange(len(deque_buffer))
+    expected = deque_buffer._process_transition(list(deque_buffer.memory))
+    result = array_buffer._process_indices(idxs)
+    for field in field_names:
+        for agent_id in agent_ids:
+            assert torch.equal(expected[field][agent_id], result[field][agent_id])
+
+    states, actions, rewards, next_states, dones = array_buffer.sample(8)
+    assert list(states.keys()) == agent_ids
+    assert states["agent_0"].shape == (8, 3)
+    assert rewards["agent_1"].shape == (8, 1)
+    assert dones["agent_2"].dtype == torch.float32
+
+
+# Saved multi-agent replay buffers are restored with the same experiences and counter
+@pytest.mark.parametrize("storage", ["deque", "array"])
+def test_save_and_load(tmpdir, storage):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    agent_ids = ["agent_0", "agent_1"]
+    buffer = MultiAgentReplayBuffer(20, field_names, agent_ids, storage=storage)
+
+    rng = np.random.default_rng(0)
+    for _ in range(3):
+        transition = [
+            {agent_id: rng.random((4, 3)) for agent_id in agent_ids}
+            for _ in field_names
+        ]
+        buffer.save2memory(*transition, is_vectorised=True)
+
+    path = os.path.join(tmpdir, "snapshot")
+    buffer.save(path)
+    restored = MultiAgentReplayBuffer(20, field_names, agent_ids, storage=storage)
+    restored.load(path)
+
+    assert len(restored) == len(buffer) == 12
+    assert restored.counter == buffer.counter
+    if storage == "deque":
+        expected = buffer._process_transition(list(buffer.memory))
+        result = restored._process_transition(list(restored.memory))
+    else:
+        expected = buffer._process_indices(np.arange(12))
+        result = restored._process_indices(np.arange(12))
+    for field in field_names:
+        for agent_id in agent_ids:
+            assert torch.equal(expected[field][agent_id], result[field][agent_id])
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from agilerl.utils.phase_timer import PhaseTimer
+
+
+# A disabled timer records nothing and reports an empty summary
+def test_disabled_timer_records_nothing():
+    timer = PhaseTimer()
+
+    with timer.phase("learn"):
+        time.sleep(0.01)
+    timer.count("updates", 5)
+
+    assert timer.enabled is False
+    assert timer.times["learn"] == 0.0
+    assert timer.counts["updates"] == 0
+    assert timer.summary() == {}
+    # The same no-op context manager is reused
+    assert timer.phase("learn") is timer.phase("env_step")
+
+
+# An enabled timer accumulates time spent in each phase
+def test_enabled_timer_accumulates_phase_times():
+    timer = PhaseTimer(enabled=True)
+
+    for _ in range(2):
+        with timer.phase("learn"):
+            time.sleep(0.01)
+    with timer.phase("env_step"):
+        time.sleep(0.01)
+
+    assert timer.times["learn"] >= 0.02
+    assert timer.times["env_step"] >= 0.01
+    assert timer.times["action"] == 0.0
+
+
+# Summary reports throughput and phase percentages since the last reset
+def test_summary_reports_throughput_and_percentages():
+    timer = PhaseTimer(enabled=True)
+
+    with timer.phase("learn"):
+        time.sleep(0.02)
+    timer.count("env_steps", 100)
+    timer.count("updates", 10)
+    summary = timer.summary()
+
+    assert summary["throughput/env_steps_per_sec"] > 0
+    assert summary["throughput/env_steps_per_sec"] == pytest.approx(
+        10 * summary["throughput/updates_per_sec"]
+    )
+    assert summary["throughput/learn_pct"] > 50
+    assert sum(
+        value for key, value in summary.items() if key.endswith("_pct")
+    ) == pytest.approx(100)
+    assert all(f"throughput/{name}_pct" in summary for name in PhaseTimer.PHASES)
+
+    text = PhaseTimer.format(summary)
+    assert "env_steps/s" in text and "learn:" in text and "other:" in text
+
+
+# Reset clears times and counts
+def test_reset_clears_times_and_counts():
+    timer = PhaseTimer(enabled=True)
+
+    with timer.phase("sample"):
+        time.sleep(0.01)
+    timer.count("updates")
+    timer.reset()
+
+    assert timer.times["sample"] == 0.0
+    assert timer.counts == {"env_steps": 0, "updates": 0}
@@ -1,14 +1,17 @@
+import os
 import random
 from collections import deque, namedtuple
 
 import numpy as np
 import pytest
 import torch
+from accelerate import Accelerator
 
 from agilerl.components.replay_buffer import (
     MultiStepReplayBuffer,
     PrioritizedReplayBuffer,
     ReplayBuffer,
+    ShardedPrioritizedReplayBuffer,
 )
 from agilerl.components.segment_tree import MinSegmentTree, SumSegmentTree
 
@@ -350,16 +353,15 @@ def test_save_multiple_env_transitions():
     )
 
     assert len(replay_buffer.memory) == 0
-    assert len(replay_buffer.n_step_buffers[0]) == 1
-    assert len(replay_buffer.n_step_buffers[1]) == 1
+    assert replay_buffer.n_step_count == 1
+    assert replay_buffer.n_step_window["state"].shape == (n_step, num_envs, 4)
 
     one_step_transition = replay_buffer.save2memoryVectEnvs(
         state, action, reward, next_state, done
     )
 
     assert len(replay_buffer.memory) == num_envs
-    assert len(replay_buffer.n_step_buffers[0]) == n_step
-    assert len(replay_buffer.n_step_buffers[1]) == n_step
+    assert replay_buffer.n_step_count == n_step
     assert len(one_step_transition) == len(field_names)
     assert one_step_transition[0].shape == (num_envs, 4)
     assert one_step_transition[1].shape == (num_envs, 4)
@@ -698,3 +700,631 @@ def test_calculate_weight_parameterized():
     weight = (0.5 ** (-0.4)) / (0.05 ** (-0.4))
 
     assert buffer._calculate_weight(0, beta) == pytest.approx(weight, abs=1e-6)
+
+
+##### Array storage tests #####
+# Array storage saves vectorised experiences and samples the same shapes as deque storage
+@pytest.mark.parametrize("storage", ["deque", "array"])
+def test_array_storage_matches_deque_shapes(storage):
+    buffer = ReplayBuffer(
+        action_dim=2,
+        memory_size=100,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        storage=storage,
+    )
+
+    states = np.random.randn(4, 3)
+    actions = np.array([0, 1, 1, 0])
+    rewards = np.array([0.5, 1.0, 0.0, -1.0])
+    next_states = np.random.randn(4, 3)
+    dones = np.array([False, True, False, False])
+
+    buffer.save2memory(states, actions, rewards, next_states, dones, is_vectorised=True)
+    buffer.save2memory(states[0], actions[0], rewards[0], next_states[0], dones[0])
+
+    assert len(buffer) == 5
+    assert buffer.counter == 5
+    state, action, reward, next_state, done = buffer.sample(5)
+    assert state.shape == (5, 3)
+    assert action.shape == (5, 1)
+    assert reward.shape == (5, 1)
+    assert next_state.shape == (5, 3)
+    assert done.shape == (5, 1)
+    assert done.sum() == 1
+
+
+# Array storage overwrites oldest experiences once full
+def test_array_storage_wraps_around():
+    buffer = ReplayBuffer(
+        action_dim=1,
+        memory_size=5,
+        field_names=["state", "reward"],
+        storage="array",
+    )
+
+    buffer.save2memoryVectEnvs(np.arange(4).reshape(4, 1), np.arange(4))
+    buffer.save2memoryVectEnvs(np.arange(4, 8).reshape(4, 1), np.arange(4, 8))
+
+    assert len(buffer) == 5
+    assert buffer.memory.ptr == 3
+    assert buffer.memory.fields["state"][:, 0].tolist() == [5, 6, 7, 3, 4]
+
+    state, reward = buffer.sample(5)
+    assert sorted(state[:, 0].tolist()) == [3, 4, 5, 6, 7]
+    assert torch.equal(state, reward)
+
+
+# Prioritized replay buffer indices point at the same experiences with array storage
+def test_per_array_storage_sample_indices():
+    buffer = PrioritizedReplayBuffer(
+        action_dim=1,
+        memory_size=4,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=1,
+        storage="array",
+    )
+
+    for i in range(6):
+        buffer.save2memory(np.array([i]), np.array([0]), i, np.array([i + 1]), False)
+
+    state, _, reward, _, _, _, idxs = buffer.sample(4)
+    for s, r, idx in zip(state[:, 0].tolist(), reward[:, 0].tolist(), idxs):
+        assert s == r
+        assert buffer.memory[idx].state[0] == s
+
+
+# Vectorized importance weights match per-index weights
+def test_calculate_weights_matches_calculate_weight():
+    buffer = PrioritizedReplayBuffer(
+        action_dim=1,
+        memory_size=8,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=1,
+    )
+    for i in range(6):
+        buffer.save2memory(np.array([i]), np.array([0]), i, np.array([i + 1]), False)
+    buffer.update_priorities([0, 2, 5, 2], np.array([0.5, 2.0, 0.1, 1.2]))
+
+    idxs = [0, 1, 2, 5]
+    weights = buffer._calculate_weights(idxs, 0.4)
+
+    assert np.allclose(weights, [buffer._calculate_weight(i, 0.4) for i in idxs])
+    assert buffer.max_priority == 2.0
+    assert np.isclose(buffer.sum_tree[2], 1.2**buffer.alpha)
+
+
+# Priorities are raised to alpha with np.power, matching scalar exponentiation
+def test_update_priorities_matches_scalar_power():
+    buffer = PrioritizedReplayBuffer(
+        action_dim=1,
+        memory_size=16,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=1,
+        alpha=0.6,
+    )
+    for i in range(16):
+        buffer.save2memory(np.array([i]), np.array([0]), i, np.array([i + 1]), False)
+    priorities = np.random.uniform(1e-3, 5.0, 16)
+    buffer.update_priorities(list(range(16)), priorities)
+
+    expected = [float(p) ** buffer.alpha for p in priorities]
+    assert np.allclose(buffer.sum_tree[np.arange(16)], expected)
+    assert np.isclose(buffer.sum_tree.sum(), sum(expected))
+    assert np.isclose(buffer.min_tree.min(), min(expected))
+
+    # Importance weights match the scalar formula for every sampled index
+    idxs = np.random.randint(0, 16, 32)
+    p_total = sum(expected)
+    max_weight = (min(expected) / p_total * 16) ** -0.4
+    expected_weights = [(expected[i] / p_total * 16) ** -0.4 / max_weight for i in idxs]
+    assert np.allclose(buffer._calculate_weights(idxs, 0.4), expected_weights)
+
+
+# Vectorized proportional sampling draws the same indices as sampling one at a time
+def test_sample_proportional_matches_sequential_retrieve():
+    buffer = PrioritizedReplayBuffer(
+        action_dim=1,
+        memory_size=16,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=1,
+    )
+    for i in range(16):
+        buffer.save2memory(np.array([i]), np.array([0]), i, np.array([i + 1]), False)
+    buffer.update_priorities(list(range(16)), np.linspace(0.1, 3.0, 16))
+
+    random.seed(42)
+    idxs = buffer._sample_proprtional(10)
+
+    random.seed(42)
+    p_total = buffer.sum_tree.sum(0, len(buffer) - 1)
+    segment = p_total / 10
+    expected = [
+        buffer.sum_tree.retrieve(random.uniform(segment * i, segment * (i + 1)))
+        for i in range(10)
+    ]
+
+    assert idxs == expected
+
+
+# Vectorised n-step window matches per-env n-step deques for every storage
+@pytest.mark.parametrize("storage", ["deque", "array"])
+@pytest.mark.parametrize("n_step", [1, 3])
+def test_n_step_window_matches_n_step_deques(n_step, storage):
+    num_envs = 4
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    buffer = MultiStepReplayBuffer(
+        1, 100, field_names, num_envs, n_step, gamma=0.9, storage=storage
+    )
+    # One single-environment buffer per environment, using the per-transition deques
+    env_buffers = [
+        MultiStepReplayBuffer(1, 100, field_names, 1, n_step, gamma=0.9)
+        for _ in range(num_envs)
+    ]
+
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        transition = (
+            rng.random((num_envs, 3)),
+            rng.integers(0, 2, num_envs),
+            rng.random(num_envs),
+            rng.random((num_envs, 3)),
+            rng.random(num_envs) < 0.3,
+        )
+        buffer.save2memoryVectEnvs(*transition)
+        for env, env_buffer in enumerate(env_buffers):
+            env_buffer.save2memorySingleEnv(*[field[env] for field in transition])
+
+    num_transitions = 10 - n_step + 1
+    assert len(buffer) == buffer.counter == num_envs * num_transitions
+    assert buffer.n_step_buffers[0] == deque(maxlen=n_step)
+
+    for env, env_buffer in enumerate(env_buffers):
+        idxs = list(range(num_transitions))
+        expected = env_buffer.sample_from_indices(idxs)
+        result = buffer.sample_from_indices([i * num_envs + env for i in idxs])
+        for e, r in zip(expected, result):
+            assert torch.allclose(e.float(), r.float())
+
+
+# Prioritized replay buffer assigns max priority to batches written from the n-step window
+def test_per_n_step_window_updates_trees():
+    buffer = PrioritizedReplayBuffer(
+        action_dim=1,
+        memory_size=4,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=3,
+        storage="array",
+    )
+    buffer.max_priority = 2.0
+
+    for _ in range(2):
+        buffer.save2memoryVectEnvs(
+            np.ones((3, 2)), np.zeros(3), np.ones(3), np.ones((3, 2)), np.zeros(3)
+        )
+
+    assert len(buffer) == 4
+    assert buffer.tree_ptr == buffer.memory.ptr == 2
+    assert buffer.sum_tree.sum() == pytest.approx(4 * 2.0**buffer.alpha)
+    assert buffer.min_tree.min() == pytest.approx(2.0**buffer.alpha)
+
+
+# Memory-mapped replay buffers can be sampled and reopened after a restart
+def test_memmap_storage_replay_buffer_reopen(tmpdir):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    buffer = ReplayBuffer(2, 10, field_names, storage="memmap", storage_dir=str(tmpdir))
+    buffer.save2memoryVectEnvs(
+        np.random.rand(6, 3),
+        np.zeros(6),
+        np.arange(6),
+        np.random.rand(6, 3),
+        np.zeros(6, dtype=bool),
+    )
+    state, _, reward, _, _ = buffer.sample(4)
+    assert state.shape == (4, 3)
+    assert reward.shape == (4, 1)
+
+    reopened = PrioritizedReplayBuffer(
+        2, 10, field_names, 1, storage="memmap", storage_dir=str(tmpdir)
+    )
+    assert len(reopened) == 6
+    assert reopened.tree_ptr == 6
+    assert reopened.sum_tree.sum() == pytest.approx(6.0)
+
+    *_, weights, idxs = reopened.sample(4)
+    assert torch.allclose(weights, torch.ones(4))
+    assert all(0 <= idx < 6 for idx in idxs)
+
+
+# Memory-mapped storage requires a storage directory
+def test_memmap_storage_requires_directory():
+    with pytest.raises(AssertionError):
+        ReplayBuffer(2, 10, ["state"], storage="memmap")
+
+
+# Deduplicated storage returns the same experiences as array storage for every buffer type
+@pytest.mark.parametrize(
+    "buffer_class, kwargs",
+    [
+        (ReplayBuffer, {}),
+        (MultiStepReplayBuffer, {"num_envs": 3, "n_step": 1}),
+        (PrioritizedReplayBuffer, {"num_envs": 3}),
+    ],
+)
+def test_dedup_storage_matches_array_storage(buffer_class, kwargs):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    buffers = [
+        buffer_class(
+            action_dim=2,
+            memory_size=20,
+            field_names=field_names,
+            storage=storage,
+            **kwargs,
+        )
+        for storage in ["array", "dedup"]
+    ]
+
+    rng = np.random.default_rng(1)
+    state = rng.random((3, 2))
+    for _ in range(15):
+        next_state = rng.random((3, 2))
+        done = rng.random(3) < 0.2
+        transition = (state, rng.integers(0, 2, 3), rng.random(3), next_state, done)
+        for buffer in buffers:
+            buffer.save2memory(*transition, is_vectorised=True)
+        state = next_state
+
+    array_buffer, dedup_buffer = buffers
+    assert len(array_buffer) == len(dedup_buffer)
+    idxs = np.arange(len(array_buffer))
+    expected = array_buffer._process_indices(idxs)
+    result = dedup_buffer._process_indices(idxs)
+    for field in field_names:
+        assert torch.equal(expected[field], result[field])
+
+
+# Deduplicated storage is rejected for n-step transitions, whose next states are n steps ahead
+@pytest.mark.parametrize(
+    "buffer_class, kwargs",
+    [
+        (MultiStepReplayBuffer, {"num_envs": 3, "n_step": 3}),
+        (PrioritizedReplayBuffer, {"num_envs": 3, "n_step": 3}),
+    ],
+)
+def test_dedup_storage_rejects_n_step(buffer_class, kwargs):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    with pytest.raises(AssertionError):
+        buffer_class(2, 20, field_names, storage="dedup", **kwargs)
+
+
+# Array storage keeps uint8 frames and still samples float tensors
+def test_array_storage_uint8_frames_sample_float_tensors():
+    buffer = ReplayBuffer(
+        action_dim=1,
+        memory_size=10,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        storage="array",
+    )
+    frames = np.random.randint(0, 256, (4, 3, 8, 8), dtype=np.uint8)
+    buffer.save2memory(
+        frames,
+        np.array([0, 1, 2, 3]),
+        np.ones(4),
+        frames,
+        np.array([False, False, True, False]),
+        is_vectorised=True,
+    )
+
+    assert buffer.memory.fields["state"].dtype == np.uint8
+    assert buffer.memory.fields["action"].dtype == np.int64
+    assert buffer.memory.fields["done"].dtype == np.bool_
+
+    states, actions, rewards, next_states, dones = buffer.sample(4)
+    assert states.dtype == torch.float32
+    assert actions.dtype == torch.float32
+    assert dones.dtype == torch.float32
+    assert states.shape == (4, 3, 8, 8)
+    assert sorted(states.flatten().tolist()) == sorted(frames.flatten().tolist())
+
+
+# Population sampling returns one batch per member, gathered in a single pass
+@pytest.mark.parametrize("storage", ["deque", "array"])
+def test_sample_population(storage):
+    buffer = ReplayBuffer(
+        action_dim=1,
+        memory_size=50,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        storage=storage,
+    )
+    for i in range(20):
+        buffer.save2memory(np.array([i, i]), i, i, np.array([i + 1, i + 1]), False)
+
+    batch_sizes = [4, 8, 2]
+    samples = buffer.sample_population(batch_sizes)
+    assert len(samples) == len(batch_sizes)
+    for member_samples, batch_size in zip(samples, batch_sizes):
+        states, actions, rewards, next_states, dones = member_samples
+        assert states.shape == (batch_size, 2)
+        assert actions.shape == (batch_size, 1)
+        assert torch.equal(next_states, states + 1)
+        # Sampling is without replacement within each member's batch
+        assert len(set(actions.flatten().tolist())) == batch_size
+
+
+# Prioritized population sampling matches per-member importance weights
+def test_per_sample_population():
+    buffer = PrioritizedReplayBuffer(
+        action_dim=1,
+        memory_size=50,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=1,
+        storage="array",
+    )
+    for i in range(20):
+        buffer.save2memory(np.array([i]), i, i, np.array([i + 1]), False)
+    buffer.update_priorities(np.arange(20), np.random.rand(20) + 0.1)
+
+    samples = buffer.sample_population([4, 6], beta=[0.4, 0.8])
+    for member_samples, batch_size, beta in zip(samples, [4, 6], [0.4, 0.8]):
+        states, actions, rewards, next_states, dones, weights, idxs = member_samples
+        assert states.shape == (batch_size, 1)
+        assert states.flatten().tolist() == list(idxs)
+        assert np.allclose(weights.numpy(), buffer._calculate_weights(idxs, beta))
+
+
+# Adding a batch by field name stores the same experiences as saving them one at a time
+@pytest.mark.parametrize("storage", ["deque", "array", "dedup"])
+def test_add_batch_matches_save2memory(storage):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    states = np.random.rand(11, 3)
+    actions = np.random.randint(0, 2, 10)
+    rewards = np.random.rand(10)
+    dones = np.random.rand(10) < 0.3
+
+    batched = ReplayBuffer(1, 20, field_names, storage=storage)
+    batched.add_batch(
+        next_state=states[1:],
+        state=states[:-1],
+        action=actions,
+        reward=rewards,
+        done=dones,
+    )
+    single = ReplayBuffer(1, 20, field_names, storage=storage)
+    for i in range(10):
+        single.save2memory(states[i], actions[i], rewards[i], states[i + 1], dones[i])
+
+    assert len(batched) == len(single) == 10
+    assert batched.counter == single.counter == 10
+    for expected, result in zip(
+        single._process_indices(range(10)).values(),
+        batched._process_indices(range(10)).values(),
+    ):
+        assert torch.equal(expected, result)
+
+    with pytest.raises(AssertionError):
+        batched.add_batch(state=states[:-1], action=actions)
+
+
+# Adding a batch to deduplicated storage shares states between consecutive rows, as saving
+# the same transitions one at a time does
+def test_add_batch_dedup_shares_states_like_save2memory():
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    states = np.random.rand(10, 3)
+    next_states = np.roll(states, -1, axis=0)
+    # The episode ends after row 4, and the next episode starts from a reset state
+    next_states[4] = np.random.rand(3)
+    next_states[-1] = np.random.rand(3)
+    actions = np.random.randint(0, 2, 10)
+    rewards = np.random.rand(10)
+    dones = np.arange(10) == 4
+
+    batched = ReplayBuffer(1, 20, field_names, storage="dedup")
+    batched.add_batch(
+        state=states,
+        action=actions,
+        reward=rewards,
+        next_state=next_states,
+        done=dones,
+    )
+    single = ReplayBuffer(1, 20, field_names, storage="dedup")
+    for i in range(10):
+        single.save2memory(states[i], actions[i], rewards[i], next_states[i], dones[i])
+
+    for name in ["next_slot", "next_overflow", "prev_slot"]:
+        assert np.array_equal(
+            getattr(batched.memory, name), getattr(single.memory, name)
+        )
+    # Only the next states at the episode end and of the last row are stored separately
+    linked = batched.memory.next_slot[:10] >= 0
+    assert np.array_equal(np.flatnonzero(~linked), [4, 9])
+    for expected, result in zip(
+        single._process_indices(range(10)).values(),
+        batched._process_indices(range(10)).values(),
+    ):
+        assert torch.equal(expected, result)
+
+
+def check_segments(segments):
+    """Checks that segments hold consecutive steps of one environment episode, with steps
+    encoded in states as (env, step), and zero padding after the end of the segment."""
+    states, _, _, _, dones, mask = segments
+    for state, done, valid in zip(states.numpy(), dones.numpy(), mask.numpy()):
+        n = int(valid.sum())
+        assert n > 0 and valid[:n].all()
+        assert (state[:n, 0] == state[0, 0]).all()
+        assert np.array_equal(state[:n, 1], state[0, 1] + np.arange(n))
+        assert not done[: n - 1].any()
+        assert (state[n:] == 0).all() and (done[n:] == 0).all()
+
+
+# Segments hold consecutive transitions of one environment, ending at episode boundaries
+@pytest.mark.parametrize("storage", ["array", "dedup"])
+def test_sample_segments_vectorised(tmpdir, storage):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    num_envs, length = 3, 5
+    memory = ReplayBuffer(1, 1000, field_names, storage=storage)
+    for t in range(40):
+        states = np.array([[env, t] for env in range(num_envs)], dtype=np.float32)
+        next_states = states + np.array([0, 1], dtype=np.float32)
+        dones = np.array([(t + 1) % (env + 4) == 0 for env in range(num_envs)])
+        memory.save2memory(
+            states,
+            np.zeros(num_envs),
+            np.ones(num_envs),
+            next_states,
+            dones,
+            is_vectorised=True,
+        )
+
+    segments = memory.sample_segments(64, length)
+    assert segments[0].shape == (64, length, 2)
+    assert segments[-1].shape == (64, length)
+    check_segments(segments)
+    # Env 0 ends an episode every 4 steps, so its segments never exceed 4 steps
+    states, mask = segments[0].numpy(), segments[-1].numpy()
+    assert mask[states[:, 0, 0] == 0].sum(axis=1).max() <= 4
+
+    memory.save(os.path.join(tmpdir, "buffer"))
+    loaded = ReplayBuffer(1, 1000, field_names, storage=storage)
+    loaded.load(os.path.join(tmpdir, "buffer"))
+    for name, array in memory.segments.items():
+        assert np.array_equal(loaded.segments[name], array)
+    check_segments(loaded.sample_segments(64, length))
+
+
+# Segments of a single stream respect episode ends and storage wraparound
+def test_sample_segments_stream_wraparound():
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    memory = ReplayBuffer(1, 16, field_names, storage="array")
+    steps = np.arange(50, dtype=np.float32)
+    states = np.stack([np.zeros(50, dtype=np.float32), steps], axis=1)
+    for start in range(0, 50, 10):
+        memory.add_batch(
+            state=states[start : start + 10],
+            action=np.zeros(10),
+            reward=np.ones(10),
+            next_state=states[start : start + 10] + np.array([0, 1]),
+            done=(steps[start : start + 10] + 1) % 7 == 0,
+        )
+
+    segments = memory.sample_segments(128, 6)
+    check_segments(segments)
+    states = segments[0].numpy()
+    # Only the 16 most recent transitions remain
+    assert states[:, 0, 1].min() >= 34
+    assert np.array_equal(memory.segments["env_episodes"], [7])
+    assert np.array_equal(memory.segments["env_positions"], [1])
+
+    with pytest.raises(AssertionError):
+        ReplayBuffer(1, 16, field_names).sample_segments(4, 2)
+
+
+# Sharded buffer samples proportionally to priorities and returns global indices
+def test_sharded_per_sample_and_update_priorities():
+    accelerator = Accelerator(cpu=True)
+    buffer = ShardedPrioritizedReplayBuffer(
+        action_dim=1,
+        memory_size=50,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=1,
+        accelerator=accelerator,
+        storage="array",
+    )
+    for i in range(20):
+        buffer.save2memory(np.array([i]), i, i, np.array([i + 1]), False)
+    buffer.update_priorities(np.arange(20), np.where(np.arange(20) < 10, 0.01, 5.0))
+
+    states, actions, rewards, next_states, dones, weights, idxs = buffer.sample(64, 0.4)
+    assert states.shape == (64, 1)
+    assert states.flatten().tolist() == list(idxs)
+    assert np.mean(idxs >= 10) > 0.9
+    # With a single process the global weights are the shard's own weights
+    assert np.allclose(weights.numpy(), buffer._calculate_weights(idxs, 0.4))
+
+    buffer.update_priorities(idxs[:1], [10.0])
+    assert buffer.max_priority == 10.0
+    assert np.isclose(buffer.sum_tree[int(idxs[0])], 10.0**buffer.alpha)
+
+    samples = buffer.sample_population([4, 6], beta=[0.4, 0.8])
+    assert [len(member_samples[0]) for member_samples in samples] == [4, 6]
+
+
+# Saved replay buffers are restored with the same experiences, counters and sampling state
+@pytest.mark.parametrize("storage", ["deque", "array", "dedup", "memmap"])
+@pytest.mark.parametrize(
+    "buffer_class, kwargs",
+    [
+        (ReplayBuffer, {}),
+        (MultiStepReplayBuffer, {"num_envs": 3, "n_step": 3}),
+        (PrioritizedReplayBuffer, {"num_envs": 3}),
+    ],
+)
+def test_save_and_load(tmpdir, buffer_class, kwargs, storage):
+    if storage == "dedup" and kwargs.get("n_step", 1) > 1:
+        pytest.skip("Deduplicated storage requires n_step=1.")
+    field_names = ["state", "action", "reward", "next_state", "done"]
+
+    def make_buffer(name):
+        return buffer_class(
+            action_dim=2,
+            memory_size=20,
+            field_names=field_names,
+            storage=storage,
+            storage_dir=os.path.join(tmpdir, name) if storage == "memmap" else None,
+            **kwargs,
+        )
+
+    def save_transition(buffers, rng, state):
+        next_state = rng.random((3, 2))
+        done = rng.random(3) < 0.2
+        transition = (state, rng.integers(0, 2, 3), rng.random(3), next_state, done)
+        for buffer in buffers:
+            if isinstance(buffer, MultiStepReplayBuffer) and not isinstance(
+                buffer, PrioritizedReplayBuffer
+            ):
+                buffer.save2memoryVectEnvs(*transition)
+            else:
+                buffer.save2memory(*transition, is_vectorised=True)
+        return next_state
+
+    buffer = make_buffer("original")
+    rng = np.random.default_rng(0)
+    state = rng.random((3, 2))
+    for _ in range(5):
+        state = save_transition([buffer], rng, state)
+    if isinstance(buffer, PrioritizedReplayBuffer):
+        buffer.update_priorities(np.arange(len(buffer)), rng.random(len(buffer)))
+
+    buffer.save(os.path.join(tmpdir, "snapshot"))
+    restored = make_buffer("restored")
+    restored.load(os.path.join(tmpdir, "snapshot"))
+
+    # Both buffers keep behaving the same after the restore
+    for _ in range(5):
+        state = save_transition([buffer, restored], rng, state)
+
+    assert len(restored) == len(buffer)
+    assert restored.counter == buffer.counter
+    idxs = np.arange(len(buffer))
+    expected = buffer._process_indices(idxs)
+    result = restored._process_indices(idxs)
+    for field in field_names:
+        assert torch.equal(expected[field], result[field])
+    if isinstance(buffer, PrioritizedReplayBuffer):
+        assert np.array_equal(restored.sum_tree.tree, buffer.sum_tree.tree)
+        assert restored.max_priority == buffer.max_priority
+        assert restored.tree_ptr == buffer.tree_ptr
+
+
+# Loading a buffer saved with different settings raises an error
+def test_load_mismatched_buffer(tmpdir):
+    field_names = ["state", "action", "reward"]
+    buffer = ReplayBuffer(1, 10, field_names, storage="array")
+    buffer.save2memory(1, 2, 3)
+    buffer.save(os.path.join(tmpdir, "snapshot"))
+
+    with pytest.raises(AssertionError):
+        ReplayBuffer(1, 20, field_names, storage="array").load(
+            os.path.join(tmpdir, "snapshot")
+        )
+    with pytest.raises(AssertionError):
+        ReplayBuffer(1, 10, field_names).load(os.path.join(tmpdir, "snapshot"))
@@ -1,5 +1,6 @@
 import numpy as np
 import torch
+from torch.utils.data import DataLoader
 
 from agilerl.components.replay_buffer import ReplayBuffer
 from agilerl.components.replay_data import ReplayDataset
@@ -53,3 +54,45 @@ def test_sampling_batch_from_buffer():
     assert torch.equal(batch[3][1], torch.from_numpy(next_state1).float())
     assert torch.equal(batch[4][0], torch.from_numpy(done1).float())
     assert torch.equal(batch[4][1], torch.from_numpy(done1).float())
+
+
+# The dataset streams batches endlessly and follows batch size changes
+def test_endless_stream_follows_batch_size():
+    buffer = ReplayBuffer(
+        action_dim=1,
+        memory_size=100,
+        field_names=["state", "action", "reward"],
+    )
+    for i in range(10):
+        buffer.save2memory(i, i, i)
+
+    dataset = ReplayDataset(buffer, batch_size=2)
+    iterator = iter(dataset)
+    for _ in range(5):
+        assert len(next(iterator)[0]) == 2
+
+    dataset.batch_size = 4
+    assert dataset.batch_size == 4
+    assert len(next(iterator)[0]) == 4
+
+
+# Dataloader workers see batch size changes made in the main process
+def test_batch_size_shared_with_workers():
+    buffer = ReplayBuffer(
+        action_dim=1,
+        memory_size=100,
+        field_names=["state", "action", "reward"],
+    )
+    for i in range(10):
+        buffer.save2memory(i, i, i)
+
+    dataset = ReplayDataset(buffer, batch_size=2)
+    dataloader = DataLoader(dataset, batch_size=None, num_workers=1, prefetch_factor=1)
+    iterator = iter(dataloader)
+    assert len(next(iterator)[0]) == 2
+
+    dataset.batch_size = 3
+    # Batches already prefetched keep their original size
+    batch_sizes = [len(next(iterator)[0]) for _ in range(4)]
+    assert batch_sizes[-1] == 3
+    del iterator
@@ -1,3 +1,6 @@
+import time
+
+import numpy as np
 import pytest
 from accelerate import Accelerator
 from torch.utils.data import DataLoader
@@ -6,6 +9,7 @@ from agilerl.components.replay_buffer import (
     MultiStepReplayBuffer,
     PrioritizedReplayBuffer,
     ReplayBuffer,
+    ShardedPrioritizedReplayBuffer,
 )
 from agilerl.components.replay_data import ReplayDataset
 from agilerl.components.sampler import Sampler
@@ -189,3 +193,119 @@ def test_warnings_in_constructor(distributed, per, n_step, memory, dataset, data
             dataset,
             dataloader,
         )
+
+
+# Prefetching sampler returns batches assembled in the background thread
+def test_sample_prefetched_standard():
+    field_names = ["state", "action", "reward"]
+    buffer = ReplayBuffer(1, 100, field_names, storage="array")
+    for i in range(20):
+        buffer.save2memorySingleEnv(i, i, i)
+
+    sampler = Sampler(memory=buffer, prefetch=2)
+    assert sampler.sample == sampler.sample_prefetched
+
+    samples = sampler.sample(4)
+    assert len(samples) == len(field_names)
+    assert len(samples[0]) == 4
+    assert sampler.requests == 1
+    assert sampler.waits == 1  # Nothing is prefetched before the first request
+
+    # Wait for the background thread to fill the queue
+    for _ in range(1000):
+        if sampler._queue.full():
+            break
+        time.sleep(0.001)
+    samples = sampler.sample(4)
+    assert len(samples[0]) == 4
+    assert sampler.waits == 1
+
+    # Batches prefetched for another batch size are discarded
+    samples = sampler.sample(6)
+    assert len(samples[0]) == 6
+    assert sampler.discarded >= 1
+    sampler.close()
+    assert sampler._thread is None
+
+
+# Prefetched PER batches are dropped when priorities change and reweighted with the current beta
+def test_sample_prefetched_per():
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    buffer = PrioritizedReplayBuffer(1, 100, field_names, num_envs=1, storage="array")
+    for i in range(20):
+        buffer.save2memorySingleEnv(i, i, i, i + 1, False)
+
+    sampler = Sampler(per=True, memory=buffer, prefetch=2)
+    sampler.sample(4, 0.4)
+    for _ in range(1000):
+        if sampler._queue.full():
+            break
+        time.sleep(0.001)
+
+    samples = sampler.sample(4, 0.5)
+    weights, idxs = samples[-2], samples[-1]
+    assert np.allclose(weights.numpy(), buffer._calculate_weights(idxs, 0.5))
+
+    sampler.update_priorities(idxs, np.full(len(idxs), 10.0))
+    assert sampler._queue.empty()
+    assert sampler.discarded >= 1
+    assert np.allclose(buffer.sum_tree[idxs], 10.0**buffer.alpha)
+    sampler.close()
+
+
+# Prefetching is disabled for distributed and n-step sampling
+def test_prefetch_disabled_for_n_step():
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    buffer = MultiStepReplayBuffer(1, 100, field_names, num_envs=1)
+    with pytest.warns(UserWarning):
+        sampler = Sampler(n_step=True, memory=buffer, prefetch=2)
+    assert sampler.prefetch == 0
+    assert sampler.sample == sampler.sample_n_step
+
+
+# Prefetching is disabled for sharded replay buffers
+def test_prefetch_disabled_for_sharded_buffer():
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    buffer = ShardedPrioritizedReplayBuffer(
+        1, 100, field_names, num_envs=1, accelerator=Accelerator(cpu=True)
+    )
+    with pytest.warns(UserWarning):
+        sampler = Sampler(per=True, memory=buffer, prefetch=2)
+    assert sampler.prefetch == 0
+    assert sampler.sample == sampler.sample_per
+
+
+# Call sample_population() method with different batch sizes per member
+def test_sample_population_with_valid_batch_sizes():
+    field_names = ["state", "action", "reward"]
+    buffer = ReplayBuffer(1, 100, field_names)
+    for i in range(10):
+        buffer.save2memorySingleEnv(i, i, i)
+
+    sampler = Sampler(memory=buffer)
+    samples = sampler.sample_population([3, 5])
+
+    assert len(samples) == 2
+    assert len(samples[0]) == len(field_names)
+    assert len(samples[0][0]) == 3
+    assert len(samples[1][0]) == 5
+
+
+# Distributed sampling keeps one iterator over the replay stream
+def test_sample_distributed_keeps_iterator():
+    accelerator = Accelerator()
+    buffer = ReplayBuffer(1, 100, ["state", "action", "reward"])
+    for i in range(10):
+        buffer.save2memorySingleEnv(i, i, i)
+    replay_dataset = ReplayDataset(buffer, batch_size=3)
+    replay_dataloader = accelerator.prepare(DataLoader(replay_dataset, batch_size=None))
+    sampler = Sampler(
+        distributed=True, dataset=replay_dataset, dataloader=replay_dataloader
+    )
+
+    sampler.sample(3)
+    iterator = sampler._iterator
+    for _ in range(3):
+        samples = sampler.sample(5)
+    assert sampler._iterator is iterator
+    assert len(samples[0]) == 5
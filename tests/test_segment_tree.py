@@ -14,7 +14,7 @@ def test_valid_segment_tree_creation():
     segment_tree = SegmentTree(capacity, operation, init_value)
 
     assert segment_tree.capacity == capacity
-    assert segment_tree.tree == [init_value] * (2 * capacity)
+    assert segment_tree.tree.tolist() == [init_value] * (2 * capacity)
     assert segment_tree.operation == operation
 
 
@@ -124,3 +124,43 @@ def test_max_interval_tree():
     assert np.isclose(tree.min(2, 3), 4.0)
     assert np.isclose(tree.min(2, -1), 4.0)
     assert np.isclose(tree.min(3, 4), 3.0)
+
+
+def test_batch_retrieve_matches_single_retrieve():
+    tree = SumSegmentTree(16)
+    rng = np.random.default_rng(0)
+    for i, value in enumerate(rng.random(13)):
+        tree[i] = value
+
+    upperbounds = rng.uniform(0, tree.sum(), size=100)
+    idxs = tree.retrieve(upperbounds)
+
+    assert isinstance(tree.retrieve(0.5), int)
+    assert idxs.tolist() == [tree.retrieve(ub) for ub in upperbounds]
+
+
+def test_batch_update_matches_sequential_update():
+    sum_tree, batch_sum_tree = SumSegmentTree(8), SumSegmentTree(8)
+    min_tree, batch_min_tree = MinSegmentTree(8), MinSegmentTree(8)
+
+    idxs = np.array([0, 3, 5, 3, 7, 1])
+    values = np.array([0.2, 1.5, 0.7, 0.4, 2.0, 0.9])
+    for idx, value in zip(idxs, values):
+        sum_tree[idx] = value
+        min_tree[idx] = value
+    batch_sum_tree.update(idxs, values)
+    batch_min_tree.update(idxs, values)
+
+    assert batch_sum_tree.tree.tolist() == sum_tree.tree.tolist()
+    assert batch_min_tree.tree.tolist() == min_tree.tree.tolist()
+    assert batch_sum_tree[3] == 0.4
+    assert batch_sum_tree[np.array([0, 3])].tolist() == [0.2, 0.4]
+
+
+def test_batch_update_custom_operation():
+    tree = SegmentTree(4, max, float("-inf"))
+
+    tree.update([0, 2], [1.0, 3.0])
+
+    assert tree.operate() == 3.0
+    assert tree.operate(0, 2) == 1.0
@@ -0,0 +1,121 @@
+import copy
+
+import numpy as np
+import pytest
+import torch
+
+from agilerl.algorithms.dqn import DQN
+from agilerl.hpo.mutation import Mutations
+from agilerl.components.stacked_population import StackedPopulation
+
+
+def make_pop(hidden_sizes, double=False):
+    return [
+        DQN(
+            state_dim=[4],
+            action_dim=2,
+            one_hot=False,
+            net_config={"arch": "mlp", "h_size": h_size},
+            lr=1e-3 * (i + 1),
+            double=double,
+        )
+        for i, h_size in enumerate(hidden_sizes)
+    ]
+
+
+def make_experiences(pop, batch_size=64):
+    return [
+        [
+            torch.randn(batch_size, 4),
+            torch.randint(0, 2, (batch_size, 1)),
+            torch.randn(batch_size, 1),
+            torch.randn(batch_size, 4),
+            torch.randint(0, 2, (batch_size, 1)).float(),
+        ]
+        for _ in pop
+    ]
+
+
+# stacked learning matches learning with each member on its own
+@pytest.mark.parametrize("double", [False, True])
+def test_stacked_learn_matches_members(double):
+    torch.manual_seed(0)
+    pop = make_pop([[32, 32], [32, 32], [32, 32], [16]], double=double)
+    reference = [copy.deepcopy(agent) for agent in pop]
+    stacked = StackedPopulation(pop)
+    assert sorted(indices for indices, _ in stacked.groups) == [[0, 1, 2], [3]]
+
+    for _ in range(5):
+        experiences = make_experiences(pop)
+        losses = stacked.learn(experiences)
+        expected = [
+            agent.learn(experience) for agent, experience in zip(reference, experiences)
+        ]
+        assert np.allclose(losses, expected, atol=1e-4)
+
+    for agent, reference_agent in zip(pop, reference):
+        for network in ["actor", "actor_target"]:
+            for param, expected in zip(
+                getattr(agent, network).parameters(),
+                getattr(reference_agent, network).parameters(),
+            ):
+                assert torch.allclose(param, expected, atol=1e-4)
+
+
+# stacked action selection matches action selection of each member
+def test_stacked_get_action():
+    pop = make_pop([[32], [32], [64]])
+    stacked = StackedPopulation(pop)
+    states = [np.random.rand(3, 4).astype(np.float32) for _ in pop]
+
+    actions = stacked.getAction(states)
+    for agent, state, action in zip(pop, states, actions):
+        assert np.array_equal(action, agent.getAction(state))
+
+    actions = stacked.getAction([state[0] for state in states], epsilon=1)
+    assert all(action.shape == (1,) for action in actions)
+
+    for epsilon, action_mask in [(0, np.array([[0, 1]] * 3)), (1, np.array([0, 1]))]:
+        actions = stacked.getAction(states, epsilon, [action_mask] * len(pop))
+        assert all((action == 1).all() for action in actions)
+
+
+# groups are rebuilt once a member's network is mutated
+def test_stacked_regroups_after_mutation():
+    pop = make_pop([[32], [32], [32]])
+    stacked = StackedPopulation(pop)
+    assert len(stacked.groups) == 1
+
+    mutations = Mutations(
+        algo="DQN",
+        no_mutation=0,
+        architecture=1,
+        new_layer_prob=0.5,
+        parameters=0,
+        activation=0,
+        rl_hp=0,
+        rl_hp_selection=["lr"],
+        mutation_sd=0.1,
+        rand_seed=1,
+    )
+    pop[1:2] = mutations.mutation(pop[1:2])
+    losses = stacked.learn(make_experiences(pop))
+
+    assert all(np.isfinite(losses))
+    assert sorted(indices for indices, _ in stacked.groups) == [[0, 2], [1]]
+
+
+# released members no longer share storage with the stacked tensors
+def test_stacked_release():
+    pop = make_pop([[32], [32]])
+    stacked = StackedPopulation(pop)
+    stacked.learn(make_experiences(pop))
+    stacked.release()
+
+    assert stacked.groups == []
+    for agent in pop:
+        param = next(agent.actor.parameters())
+        assert param.untyped_storage().nbytes() == param.numel() * 4
+        exp_avg = agent.optimizer.state[param]["exp_avg"]
+        assert exp_avg.untyped_storage().nbytes() == exp_avg.numel() * 4
+        agent.learn(make_experiences([agent])[0])
@@ -0,0 +1,382 @@
+import multiprocessing
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from agilerl.components.storage import (
+    ArrayStorage,
+    DedupStorage,
+    HDF5Storage,
+    MemmapStorage,
+    MultiAgentArrayStorage,
+    SharedArrayStorage,
+    load_arrays,
+    save_arrays,
+)
+
+
+# Allocates field arrays from the first transition written
+def test_allocates_on_first_append():
+    storage = ArrayStorage(10, ["state", "action", "reward"])
+    assert storage.fields is None
+
+    storage.append(np.array([1.0, 2.0, 3.0]), 1, 0.5)
+
+    assert len(storage) == 1
+    assert storage.fields["state"].shape == (10, 3)
+    assert storage.fields["action"].shape == (10, 1)
+    assert storage.fields["reward"].shape == (10, 1)
+
+
+# Writes batches of transitions with wraparound
+def test_extend_wraps_around():
+    storage = ArrayStorage(5, ["state", "reward"])
+
+    idxs = storage.extend(np.arange(3).reshape(3, 1), np.arange(3))
+    assert idxs.tolist() == [0, 1, 2]
+
+    idxs = storage.extend(np.arange(3, 7).reshape(4, 1), np.arange(3, 7))
+    assert idxs.tolist() == [3, 4, 0, 1]
+    assert len(storage) == 5
+    assert storage.ptr == 2
+    assert storage.fields["state"][:, 0].tolist() == [5, 6, 2, 3, 4]
+
+
+# Keeps only the most recent transitions when a batch exceeds storage size
+def test_extend_larger_than_storage():
+    storage = ArrayStorage(3, ["state"])
+
+    storage.extend(np.arange(7).reshape(7, 1))
+
+    assert len(storage) == 3
+    assert storage.ptr == 1
+    assert sorted(storage.fields["state"][:, 0].tolist()) == [4, 5, 6]
+    assert storage[storage.ptr - 1].state[0] == 6
+
+
+# Gathers rows at indices and returns experiences by slot
+def test_gather_and_getitem():
+    storage = ArrayStorage(4, ["state", "done"])
+    storage.extend(np.array([[1, 1], [2, 2], [3, 3]]), np.array([False, True, False]))
+
+    batch = storage.gather([1, 0])
+    assert batch["state"].tolist() == [[2, 2], [1, 1]]
+    assert batch["done"].tolist() == [[1], [0]]
+
+    assert storage[1].state.tolist() == [2, 2]
+    assert storage[-1].state.tolist() == [3, 3]
+    with pytest.raises(IndexError):
+        storage[3]
+
+
+# Memory-mapped storage writes fields to .npy files in the storage directory
+def test_memmap_storage_creates_files(tmpdir):
+    storage = MemmapStorage(8, ["state", "reward"], str(tmpdir))
+    storage.extend(np.arange(6).reshape(3, 2), np.array([1.0, 2.0, 3.0]))
+
+    assert os.path.exists(os.path.join(tmpdir, "state.npy"))
+    assert os.path.exists(os.path.join(tmpdir, "reward.npy"))
+    assert isinstance(storage.fields["state"], np.memmap)
+
+    batch = storage.gather([2, 0, 1])
+    assert not isinstance(batch["state"], np.memmap)
+    assert batch["state"].tolist() == [[4, 5], [0, 1], [2, 3]]
+    assert batch["reward"].tolist() == [[3], [1], [2]]
+
+
+# Memory-mapped storage reopens an existing buffer directory
+def test_memmap_storage_reopens_directory(tmpdir):
+    storage = MemmapStorage(4, ["state", "reward"], str(tmpdir))
+    storage.extend(np.arange(10).reshape(5, 2), np.arange(5))
+    storage.flush()
+    del storage
+
+    reopened = MemmapStorage(4, ["state", "reward"], str(tmpdir))
+    assert len(reopened) == 4
+    assert reopened.ptr == 1
+    assert reopened[0].state.tolist() == [8, 9]
+
+    reopened.append(np.array([10, 11]), 5)
+    assert reopened.ptr == 2
+    assert reopened[1].reward.tolist() == [5]
+
+    with pytest.raises(AssertionError):
+        MemmapStorage(8, ["state", "reward"], str(tmpdir))
+
+
+def _frame_stack_streams(num_envs, steps, frame_stack, seed=0):
+    """Generates vectorised transitions from frame-stacked streams with random resets."""
+    rng = np.random.default_rng(seed)
+    states = rng.integers(0, 255, (num_envs, frame_stack, 2))
+    for _ in range(steps):
+        frames = rng.integers(0, 255, (num_envs, 1, 2))
+        next_states = np.concatenate([states[:, 1:], frames], axis=1)
+        dones = rng.random(num_envs) < 0.2
+        yield states, rng.integers(0, 4, num_envs), next_states, dones
+        states = next_states.copy()
+        # Environments are reset with a fresh frame stack after episode ends
+        states[dones] = rng.integers(0, 255, (dones.sum(), frame_stack, 2))
+
+
+# Deduplicated storage returns the same transitions as array storage
+@pytest.mark.parametrize("frame_stack", [None, 3])
+@pytest.mark.parametrize("max_size", [7, 100])
+def test_dedup_storage_matches_array_storage(frame_stack, max_size):
+    field_names = ["state", "action", "next_state", "done"]
+    array_storage = ArrayStorage(max_size, field_names)
+    dedup_storage = DedupStorage(max_size, field_names, frame_stack=frame_stack)
+
+    for transition in _frame_stack_streams(4, 30, 3):
+        array_storage.extend(*transition)
+        dedup_storage.extend(*transition)
+
+        idxs = np.arange(len(array_storage))
+        expected = array_storage.gather(idxs)
+        result = dedup_storage.gather(idxs)
+        for field in field_names:
+            assert np.array_equal(expected[field], result[field]), field
+
+    assert dedup_storage.ptr == array_storage.ptr
+    assert len(dedup_storage) == len(array_storage)
+
+
+# Deduplicated storage only keeps next states that differ from the following state
+def test_dedup_storage_overflow_usage():
+    storage = DedupStorage(100, ["state", "next_state"])
+    states = np.zeros((2, 3))
+    for i in range(10):
+        next_states = states + 1
+        storage.extend(states, next_states)
+        states = next_states
+
+    # Only the pending next states of the latest transitions are stored separately
+    assert len(storage.overflow) - storage.n_free == 2
+    assert storage[0].next_state.tolist() == [1, 1, 1]
+
+    # A reset breaks the stream so the previous next state is kept
+    storage.extend(np.full((2, 3), -1.0), np.zeros((2, 3)))
+    assert len(storage.overflow) - storage.n_free == 4
+    assert storage[19].next_state.tolist() == [10, 10, 10]
+    assert storage[21].state.tolist() == [-1, -1, -1]
+
+
+# Array storage keeps the dtype of integer and boolean fields
+def test_array_storage_preserves_dtypes():
+    storage = ArrayStorage(10, ["state", "action", "reward", "done"])
+    storage.extend(
+        np.zeros((2, 4, 4), dtype=np.uint8),
+        np.array([1, 2], dtype=np.int64),
+        np.array([1, 2], dtype=np.int64),
+        np.array([True, False]),
+    )
+    storage.append(np.ones((4, 4), dtype=np.float64), 3, 1.5, False)
+
+    assert storage.fields["state"].dtype == np.uint8
+    assert storage.fields["action"].dtype == np.int64
+    assert storage.fields["reward"].dtype == np.float32
+    assert storage.fields["done"].dtype == np.bool_
+    assert storage[2].state.tolist() == np.ones((4, 4)).tolist()
+
+
+def _write_shared(storage, value):
+    storage.extend(np.full((3, 2), value), np.full(3, value))
+
+
+# Shared storage receives writes from forked processes without slots being claimed twice
+def test_shared_storage_forked_writers():
+    storage = SharedArrayStorage(10, ["state", "action"])
+    storage.append(np.zeros(2), 0)
+
+    ctx = multiprocessing.get_context("fork")
+    writers = [
+        ctx.Process(target=_write_shared, args=(storage, value)) for value in (1, 2)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert len(storage) == 7
+    assert storage.ptr == 7
+    actions = storage.fields["action"][:7, 0]
+    assert sorted(actions.tolist()) == [0, 1, 1, 1, 2, 2, 2]
+    assert np.array_equal(storage.fields["state"][:7, 0], actions)
+
+
+# Shared storage must be allocated before forking
+def test_shared_storage_allocation_after_fork():
+    storage = SharedArrayStorage(10, ["state", "action"])
+    storage._owner = -1
+    with pytest.raises(AssertionError):
+        storage.append(np.zeros(2), 0)
+
+
+# HDF5 storage reads the same transitions as array storage filled from the dataset
+@pytest.mark.parametrize("chunked", [True, False])
+@pytest.mark.parametrize("next_observations", [True, False])
+@pytest.mark.parametrize("swap_channels", [True, False])
+def test_hdf5_storage_matches_array_storage(
+    tmpdir, chunked, next_observations, swap_channels
+):
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    observations = np.random.rand(51, 4, 4, 3).astype(np.float32)
+    data = {
+        "observations": observations[:-1] if next_observations else observations,
+        "actions": np.random.randint(0, 2, 50),
+        "rewards": np.random.rand(50).astype(np.float32),
+        "terminals": np.random.rand(50) < 0.3,
+    }
+    if next_observations:
+        data["next_observations"] = observations[1:]
+    path = os.path.join(tmpdir, "dataset.hdf5")
+    with h5py.File(path, "w") as f:
+        for key, value in data.items():
+            chunks = (8, *value.shape[1:]) if chunked else None
+            f.create_dataset(key, data=value, chunks=chunks)
+
+    states, next_states = observations[:-1], observations[1:]
+    if swap_channels:
+        states = np.moveaxis(states, [-1], [-3])
+        next_states = np.moveaxis(next_states, [-1], [-3])
+    expected = ArrayStorage(50, field_names)
+    expected.extend(
+        states,
+        data["actions"][:50],
+        data["rewards"][:50],
+        next_states,
+        data["terminals"][:50],
+    )
+
+    storage = HDF5Storage(100, field_names, path, swap_channels=swap_channels)
+    assert len(storage) == 50 if next_observations else 49
+
+    idxs = np.random.randint(0, len(storage), 32)
+    batch = storage.gather(idxs)
+    expected_batch = expected.gather(idxs)
+    for field in field_names:
+        assert batch[field].shape == expected_batch[field].shape
+        assert np.array_equal(batch[field], expected_batch[field])
+
+
+# HDF5 storage reads each chunk once and serves repeated reads from its cache
+def test_hdf5_storage_chunk_cache(tmpdir):
+    path = os.path.join(tmpdir, "dataset.hdf5")
+    with h5py.File(path, "w") as f:
+        f.create_dataset("observations", data=np.random.rand(64, 3), chunks=(16, 3))
+        f.create_dataset(
+            "next_observations", data=np.random.rand(64, 3), chunks=(16, 3)
+        )
+        f.create_dataset("actions", data=np.zeros(64), chunks=(16,))
+        f.create_dataset("rewards", data=np.zeros(64), chunks=(16,))
+        f.create_dataset("terminals", data=np.zeros(64, dtype=bool), chunks=(16,))
+
+    storage = HDF5Storage(
+        64,
+        ["state", "action", "reward", "next_state", "done"],
+        path,
+        cache_bytes=2080,  # Two chunks of each dataset
+    )
+    storage.gather([0, 1, 15, 16, 17])
+    assert storage.misses == 10  # Two chunks of each of five datasets
+    assert storage.hits == 0
+
+    storage.gather([2, 20])
+    assert storage.misses == 10
+    assert storage.hits == 10
+
+    storage.gather([40])  # Evicts least recently used chunks
+    assert storage.misses == 15
+    assert storage._cached_bytes <= 2080
+    assert ("observations", 0) not in storage._cache
+    assert ("terminals", 2) in storage._cache
+
+    with pytest.raises(TypeError):
+        storage.append(np.zeros(3), 0, 0.0, np.zeros(3), False)
+
+
+# Multi-agent array storage keeps one array per field and agent, wrapping around once full
+def test_multi_agent_array_storage_extend_and_gather():
+    agent_ids = ["agent_0", "agent_1"]
+    storage = MultiAgentArrayStorage(5, ["state", "reward"], agent_ids)
+    for i in range(2):
+        states = {
+            agent_id: np.arange(3 * j, 3 * j + 3)[:, None] + 10 * i
+            for j, agent_id in enumerate(agent_ids)
+        }
+        rewards = {agent_id: np.ones(3) * i for agent_id in agent_ids}
+        storage.extend(states, rewards)
+
+    assert len(storage) == 5
+    assert storage.ptr == 1
+    assert storage.fields["state"]["agent_1"].shape == (5, 1)
+    assert storage.fields["reward"]["agent_0"].dtype == np.float32
+
+    batch = storage.gather([0, 1, 4])
+    assert batch["state"]["agent_0"].tolist() == [[12], [1], [11]]
+    assert batch["state"]["agent_1"].tolist() == [[15], [4], [14]]
+    assert batch["reward"]["agent_0"].tolist() == [[1], [0], [1]]
+
+    storage.append({"agent_0": 7, "agent_1": 8}, {"agent_0": 2.0, "agent_1": 3.0})
+    assert storage[1].state == {"agent_0": 7, "agent_1": 8}
+    assert storage.ptr == 2
+
+
+# Arrays saved to a directory are loaded back memory-mapped copy-on-write
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_and_load_arrays(tmpdir, mmap):
+    path = os.path.join(tmpdir, "arrays")
+    arrays = {
+        "fields.state": np.arange(12, dtype=np.uint8).reshape(4, 3),
+        "empty": np.zeros((0, 2)),
+    }
+    save_arrays(path, arrays, {"ptr": 2}, chunk_size=3)
+    # Saving again replaces the previous directory
+    save_arrays(path, arrays, {"ptr": 3}, chunk_size=3)
+
+    loaded, meta = load_arrays(path, mmap=mmap)
+    assert meta == {"ptr": 3}
+    assert isinstance(loaded["fields.state"], np.memmap) == mmap
+    assert np.array_equal(loaded["fields.state"], arrays["fields.state"])
+    assert loaded["fields.state"].dtype == np.uint8
+    assert loaded["empty"].shape == (0, 2)
+
+    # Writes to loaded arrays are not saved to disk
+    loaded["fields.state"][0] = 255
+    reloaded, _ = load_arrays(path)
+    assert reloaded["fields.state"][0].tolist() == [0, 1, 2]
+    assert not os.path.exists(f"{path}.tmp")
+
+
+# Storage state can be restored into a new storage of each type
+@pytest.mark.parametrize("storage_type", ["array", "memmap", "dedup", "shared"])
+def test_storage_get_and_set_state(tmpdir, storage_type):
+    field_names = ["state", "action", "next_state", "done"]
+
+    def make_storage(name):
+        if storage_type == "memmap":
+            return MemmapStorage(7, field_names, os.path.join(tmpdir, name))
+        if storage_type == "dedup":
+            return DedupStorage(7, field_names, frame_stack=3)
+        if storage_type == "shared":
+            return SharedArrayStorage(7, field_names)
+        return ArrayStorage(7, field_names)
+
+    storage = make_storage("a")
+    transitions = list(_frame_stack_streams(2, 10, 3))
+    for transition in transitions[:6]:
+        storage.extend(*transition)
+
+    save_arrays(os.path.join(tmpdir, "saved"), *storage.get_state())
+    restored = make_storage("b")
+    restored.set_state(*load_arrays(os.path.join(tmpdir, "saved")))
+    for transition in transitions[6:]:
+        storage.extend(*transition)
+        restored.extend(*transition)
+
+    idxs = np.arange(len(storage))
+    expected, result = storage.gather(idxs), restored.gather(idxs)
+    for field in field_names:
+        assert np.array_equal(expected[field], result[field])
+    assert restored.ptr == storage.ptr
@@ -1,7 +1,11 @@
+import multiprocessing
 import os
+import queue
+import threading
 from unittest.mock import ANY, MagicMock, patch
 
 import dill
+import h5py
 import numpy as np
 import pytest
 import torch
@@ -19,9 +23,16 @@ from agilerl.algorithms.maddpg import MADDPG
 from agilerl.algorithms.matd3 import MATD3
 from agilerl.algorithms.ppo import PPO
 from agilerl.algorithms.td3 import TD3
+from agilerl.components.replay_buffer import (
+    ReplayBuffer,
+    ShardedPrioritizedReplayBuffer,
+)
+from agilerl.training.population_evaluator import PopulationEvaluator
+from agilerl.training.population_executor import PopulationExecutor
 from agilerl.training.train import train
+from agilerl.training.train_actor_learner import _actor_loop, train_actor_learner
 from agilerl.training.train_multi_agent import train_multi_agent
-from agilerl.training.train_offline import train_offline
+from agilerl.training.train_offline import _fill_memory, train_offline
 from agilerl.training.train_on_policy import train_on_policy
 
 
@@ -37,7 +48,7 @@ class DummyEnv:
         else:
             self.n_envs = 1
 
-    def reset(self):
+    def reset(self, seed=None):
         return np.random.rand(*self.state_size), "info_string"
 
     def step(self, action):
@@ -49,6 +60,24 @@ class DummyEnv:
             "info_string",
         )
 
+    def close(self):
+        return
+
+
+class DummyAsyncEnv(DummyEnv):
+    def __init__(self, state_size, action_size, vect=True, num_envs=2):
+        super().__init__(state_size, action_size, vect, num_envs)
+        self.events = []
+        self.action = None
+
+    def step_async(self, action):
+        self.events.append("step_async")
+        self.action = action
+
+    def step_wait(self):
+        self.events.append("step_wait")
+        return self.step(self.action)
+
 
 class DummyAgentOffPolicy:
     def __init__(self, batch_size, env, beta=None):
@@ -121,7 +150,7 @@ class DummyMultiEnv:
         self.action_size = action_size
         self.agents = ["agent_0", "agent_1"]
 
-    def reset(self):
+    def reset(self, seed=None):
         return {agent: np.random.rand(*self.state_size) for agent in self.agents}, {
             "info_string": None,
             "agent_mask": True,
@@ -137,6 +166,9 @@ class DummyMultiEnv:
             {"info_string": None},
         )
 
+    def close(self):
+        return
+
 
 class DummyMultiAgent(DummyAgentOffPolicy):
     def __init__(self, batch_size, env, *args):
@@ -185,6 +217,7 @@ class DummyMutations:
 
 class DummyMemory:
     def __init__(self):
+        self.field_names = ["state", "action", "reward", "next_state", "done"]
         self.counter = 0
         self.state_size = None
         self.action_size = None
@@ -216,6 +249,12 @@ class DummyMemory:
             self.next_state_size = next_state.shape
             self.counter += 1
 
+    def add_batch(self, **arrays):
+        self.state_size = arrays["state"].shape[1:]
+        self.action_size = arrays["action"].shape[1:]
+        self.next_state_size = arrays["next_state"].shape[1:]
+        self.counter += len(arrays["state"])
+
     def __len__(self):
         return 1000
 
@@ -473,6 +512,7 @@ def mocked_multi_agent(multi_env, algo):
 @pytest.fixture
 def mocked_memory():
     mock_memory = MagicMock()
+    mock_memory.field_names = ["state", "action", "reward", "next_state", "done"]
     mock_memory.counter = 0
     mock_memory.state_size = None
     mock_memory.action_size = None
@@ -511,6 +551,14 @@ def mocked_memory():
     # Assigning the save2memory function to the MagicMock
     mock_memory.save2memory.side_effect = save2memory
 
+    def add_batch(**arrays):
+        mock_memory.state_size = arrays["state"].shape[1:]
+        mock_memory.action_size = arrays["action"].shape[1:]
+        mock_memory.next_state_size = arrays["next_state"].shape[1:]
+        mock_memory.counter += len(arrays["state"])
+
+    mock_memory.add_batch.side_effect = add_batch
+
     def sample(batch_size, beta=None, *args):
         # Account for sample_from_indices
         if isinstance(batch_size, list):
@@ -836,6 +884,182 @@ def test_train(env, population_off_policy, tournament, mutations, memory):
     assert len(pop) == len(population_off_policy)
 
 
+# Prefetching samplers move batches to the agents' device
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_prefetch(env, population_off_policy, tournament, mutations, memory):
+    for agent in population_off_policy:
+        agent.device = "cpu"
+    with patch.object(
+        agilerl.training.train, "Sampler", wraps=agilerl.training.train.Sampler
+    ) as sampler_class:
+        pop, pop_fitnesses = train(
+            env,
+            "env_name",
+            "algo",
+            population_off_policy,
+            memory,
+            INIT_HP=None,
+            MUT_P=None,
+            swap_channels=False,
+            n_episodes=10,
+            max_steps=5,
+            evo_epochs=5,
+            evo_loop=1,
+            n_step=False,
+            per=False,
+            noisy=True,
+            n_step_memory=None,
+            tournament=tournament,
+            mutation=mutations,
+            wb=False,
+            prefetch=2,
+        )
+
+    assert len(pop) == len(population_off_policy)
+    assert sampler_class.call_args.kwargs["device"] == "cpu"
+
+
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_overlap(state_size, action_size, vect, tournament, mutations, memory):
+    learn_calls = {}
+    for overlap in [False, True]:
+        env = DummyAsyncEnv(state_size, action_size, vect)
+        population = [DummyAgentOffPolicy(5, env, 0.4) for _ in range(6)]
+        for agent in population:
+            agent.learn = lambda experiences, env=env: env.events.append("learn")
+
+        pop, pop_fitnesses = train(
+            env,
+            "env_name",
+            "algo",
+            population,
+            memory,
+            n_episodes=10,
+            max_steps=5,
+            evo_epochs=5,
+            evo_loop=1,
+            noisy=True,
+            tournament=tournament,
+            mutation=mutations,
+            wb=False,
+            overlap=overlap,
+        )
+
+        assert len(pop) == len(population)
+        learn_calls[overlap] = env.events.count("learn")
+        if overlap:
+            # Each update runs between step_async and step_wait, except the last of each
+            # episode, which runs after the final step
+            assert env.events.count("step_async") == 10 * 6 * 5
+            for previous, event in zip(env.events, env.events[1:]):
+                if event == "learn":
+                    assert previous in ["step_async", "step_wait"]
+                if previous == "learn":
+                    assert event in ["step_wait", "step_async"]
+        else:
+            assert env.events.count("step_async") == 0
+    assert learn_calls[True] == learn_calls[False] > 0
+
+
+@pytest.mark.parametrize(
+    "state_size, action_size, vect", [((6,), 2, True), ((6,), 2, False)]
+)
+def test_train_executor(state_size, action_size, vect, tournament, mutations, memory):
+    results = []
+    for seed in [42, 42, 0]:
+        env = DummyEnv(state_size, action_size, vect)
+        population = [DummyAgentOffPolicy(5, env, 0.4) for _ in range(6)]
+        executor = PopulationExecutor(
+            lambda: DummyEnv(state_size, action_size, vect), seed=seed
+        )
+        pop, pop_fitnesses = train(
+            env,
+            "env_name",
+            "algo",
+            population,
+            memory,
+            n_episodes=10,
+            max_steps=5,
+            evo_epochs=5,
+            evo_loop=1,
+            noisy=True,
+            tournament=tournament,
+            mutation=mutations,
+            wb=False,
+            executor=executor,
+        )
+
+        assert len(pop) == len(population)
+        assert executor.processes == []
+        assert all(len(agent.scores) == 10 for agent in pop)
+        assert all(agent.steps[-1] == 10 * 5 for agent in pop)
+        results.append((pop_fitnesses, [agent.scores for agent in pop]))
+
+    # Results are reproducible given the seed
+    assert np.array_equal(results[0][0], results[1][0])
+    assert np.array_equal(results[0][1], results[1][1])
+    assert not np.array_equal(results[0][1], results[2][1])
+
+
+@pytest.mark.parametrize(
+    "state_size, action_size, vect", [((6,), 2, True), ((6,), 2, False)]
+)
+@pytest.mark.parametrize("backend", ["thread", "process"])
+def test_train_evaluator(
+    state_size, action_size, vect, backend, tournament, mutations, memory
+):
+    results = []
+    for seed in [42, 42]:
+        env = DummyEnv(state_size, action_size, vect)
+        population = [DummyAgentOffPolicy(5, env, 0.4) for _ in range(6)]
+        evaluator = PopulationEvaluator(
+            lambda: DummyEnv(state_size, action_size, vect),
+            num_workers=4,
+            backend=backend,
+            seed=seed,
+        )
+        pop, pop_fitnesses = train(
+            env,
+            "env_name",
+            "algo",
+            population,
+            memory,
+            n_episodes=10,
+            max_steps=5,
+            evo_epochs=5,
+            evo_loop=1,
+            tournament=tournament,
+            mutation=mutations,
+            wb=False,
+            evaluator=evaluator,
+        )
+
+        assert len(pop_fitnesses) == 2
+        assert all(len(agent.fitness) == 2 for agent in pop)
+        assert [agent.fitness[-1] for agent in pop] == pop_fitnesses[-1]
+        assert len(evaluator.eval_times) == len(pop)
+        assert evaluator.processes == [] and evaluator.pool is None
+        results.append(pop_fitnesses)
+
+    if backend == "process":
+        # Results are reproducible given the seed
+        assert np.array_equal(results[0], results[1])
+
+
+def test_train_evaluator_with_executor(tournament, mutations, memory):
+    env = DummyEnv((6,), 2)
+    with pytest.raises(AssertionError):
+        train(
+            env,
+            "env_name",
+            "algo",
+            [DummyAgentOffPolicy(5, env)],
+            memory,
+            executor=PopulationExecutor(lambda: env),
+            evaluator=PopulationEvaluator(lambda: env),
+        )
+
+
 @pytest.mark.parametrize(
     "state_size, action_size, vect, per, n_step, algo",
     [
@@ -1158,6 +1382,48 @@ def test_train_distributed(env, population_off_policy, tournament, mutations, me
     assert len(pop) == len(population_off_policy)
 
 
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_distributed_sharded_per(env, tournament, mutations):
+    accelerator = Accelerator(cpu=True)
+    pop = [DummyAgentOffPolicy(4, env, 0.4) for _ in range(2)]
+    for agent in pop:
+        agent.learn = lambda experiences, n_step=False, per=False: (
+            experiences[-1],
+            np.random.rand(len(experiences[-1])) + 0.1,
+        )
+    memory = ShardedPrioritizedReplayBuffer(
+        action_dim=2,
+        memory_size=100,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        num_envs=2,
+        accelerator=accelerator,
+        storage="array",
+    )
+    memory.sample = MagicMock(wraps=memory.sample)
+    memory.update_priorities = MagicMock(wraps=memory.update_priorities)
+    pop, pop_fitnesses = train(
+        env,
+        "env_name",
+        "algo",
+        pop,
+        memory,
+        n_episodes=2,
+        max_steps=5,
+        evo_epochs=1,
+        evo_loop=1,
+        per=True,
+        noisy=True,
+        tournament=tournament,
+        mutation=mutations,
+        wb=False,
+        accelerator=accelerator,
+    )
+
+    assert len(pop) == 2
+    memory.sample.assert_called()
+    memory.update_priorities.assert_called()
+
+
 @pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
 def test_wandb_init_log(env, population_off_policy, tournament, mutations, memory):
     INIT_HP = {
@@ -1227,6 +1493,40 @@ def test_wandb_init_log(env, population_off_policy, tournament, mutations, memor
         mock_wandb_finish.assert_called()
 
 
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_profile(
+    env, population_off_policy, tournament, mutations, memory, capsys
+):
+    with patch("agilerl.training.train.wandb.login") as _, patch(
+        "agilerl.training.train.wandb.init"
+    ) as _, patch("agilerl.training.train.wandb.log") as mock_wandb_log, patch(
+        "agilerl.training.train.wandb.finish"
+    ) as _:
+        train(
+            env,
+            "env_name",
+            "algo",
+            population_off_policy,
+            memory,
+            n_episodes=10,
+            max_steps=5,
+            evo_epochs=5,
+            evo_loop=1,
+            tournament=tournament,
+            mutation=mutations,
+            wb=True,
+            wandb_api_key="testing",
+            profile=True,
+        )
+
+        logged = mock_wandb_log.call_args[0][0]
+        assert logged["throughput/env_steps_per_sec"] > 0
+        assert logged["throughput/updates_per_sec"] > 0
+        for phase in ["action", "env_step", "buffer", "sample", "learn", "eval"]:
+            assert f"throughput/{phase}_pct" in logged
+    assert "Throughput:" in capsys.readouterr().out
+
+
 @pytest.mark.parametrize(
     "state_size, action_size, vect, accelerator",
     [
@@ -1432,6 +1732,166 @@ def test_train_save_checkpoint(
         os.remove(f"{checkpoint_path}_{i}_{10}.pt")
 
 
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_save_checkpoint_memory(
+    env, population_off_policy, tournament, mutations, tmpdir
+):
+    memory = ReplayBuffer(
+        action_dim=2,
+        memory_size=100,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        storage="array",
+    )
+    checkpoint_path = os.path.join(tmpdir, "checkpoint")
+    pop, pop_fitnesses = train(
+        env,
+        "env_name",
+        "algo",
+        population_off_policy,
+        memory,
+        INIT_HP=None,
+        MUT_P=None,
+        swap_channels=False,
+        n_episodes=10,
+        max_steps=5,
+        evo_epochs=5,
+        evo_loop=1,
+        n_step=False,
+        per=False,
+        noisy=True,
+        n_step_memory=None,
+        tournament=tournament,
+        mutation=mutations,
+        wb=False,
+        checkpoint=10,
+        checkpoint_path=checkpoint_path,
+        save_memory=True,
+    )
+
+    restored = ReplayBuffer(
+        action_dim=2,
+        memory_size=100,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        storage="array",
+    )
+    restored.load(f"{checkpoint_path}_memory")
+    assert len(restored) == len(memory)
+    assert restored.counter == memory.counter
+
+
+@pytest.mark.parametrize(
+    "state_size, action_size, vect", [((6,), 2, True), ((6,), 2, False)]
+)
+def test_train_actor_learner(state_size, action_size, vect, tournament, mutations):
+    pop = [
+        DQN(state_dim=state_size, action_dim=action_size, one_hot=False, index=i)
+        for i in range(2)
+    ]
+    memory = ReplayBuffer(
+        action_dim=action_size,
+        memory_size=1000,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        storage="shared",
+    )
+    pop, pop_fitnesses = train_actor_learner(
+        lambda: DummyEnv(state_size, action_size, vect),
+        "env_name",
+        "algo",
+        pop,
+        memory,
+        n_episodes=4,
+        max_steps=5,
+        evo_epochs=2,
+        evo_loop=1,
+        tournament=tournament,
+        mutation=mutations,
+        wb=False,
+        num_actors=2,
+        sync_freq=3,
+        seed=0,
+    )
+
+    assert len(pop) == 2
+    assert len(pop_fitnesses) == 2
+    assert len(memory) > pop[0].batch_size
+
+
+def run_actor_loop(actor_id, seed):
+    """Runs an actor for three steps in this process, sending it a new population after
+    its first step. Returns random numbers drawn at each environment reset and the names
+    of the members that acted."""
+    inbox = queue.Queue()
+    stop = threading.Event()
+    resets, acted = [], []
+
+    def make_agent(name):
+        agent = MagicMock(index=name)
+        agent.getAction.side_effect = lambda *args: acted.append(name) or np.zeros(1)
+        return agent
+
+    new_pop = [make_agent("new_0"), make_agent("new_1")]
+    env = DummyEnv((6,), 2, vect=False)
+    reset, step = env.reset, env.step
+
+    def recording_reset(seed=None):
+        resets.append(np.random.rand())
+        return reset(seed)
+
+    def recording_step(action):
+        if len(acted) == 1:
+            inbox.put(("pop", new_pop))
+        elif len(acted) == 3:
+            stop.set()
+        return step(action)
+
+    env.reset, env.step = recording_reset, recording_step
+    num_threads = torch.get_num_threads()
+    _actor_loop(
+        actor_id,
+        lambda: env,
+        [make_agent("old_0"), make_agent("old_1")],
+        MagicMock(),
+        inbox,
+        MagicMock(),
+        multiprocessing.Value("q", 0),
+        stop,
+        False,
+        10,
+        False,
+        1.0,
+        0.1,
+        0.995,
+        seed,
+    )
+    torch.set_num_threads(num_threads)
+    return resets, acted
+
+
+# Actors are seeded from the base seed and their id, and act with members received in a
+# population update from the next step on
+def test_actor_loop_seeding_and_population_update():
+    resets, acted = run_actor_loop(0, seed=42)
+    assert acted == ["old_0", "new_0", "new_0"]
+
+    assert run_actor_loop(0, seed=42)[0] == resets
+    assert run_actor_loop(1, seed=42)[0] != resets
+    assert run_actor_loop(0, seed=43)[0] != resets
+
+
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_actor_learner_requires_shared_memory(env, population_off_policy):
+    memory = ReplayBuffer(
+        action_dim=2,
+        memory_size=100,
+        field_names=["state", "action", "reward", "next_state", "done"],
+        storage="array",
+    )
+    with pytest.raises(AssertionError):
+        train_actor_learner(
+            lambda: env, "env_name", "algo", population_off_policy, memory
+        )
+
+
 @pytest.mark.parametrize("state_size, action_size, vect, algo", [((6,), 2, True, PPO)])
 def test_train_on_policy_agent_calls_made(
     env, algo, mocked_agent_on_policy, tournament, mutations
@@ -1550,6 +2010,50 @@ def test_train_on_policy(env, population_on_policy, tournament, mutations):
     assert len(pop) == len(population_on_policy)
 
 
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_on_policy_executor(env, population_on_policy, tournament, mutations):
+    pop, pop_fitnesses = train_on_policy(
+        env,
+        "env_name",
+        "algo",
+        population_on_policy,
+        n_episodes=10,
+        max_steps=5,
+        evo_epochs=5,
+        evo_loop=1,
+        tournament=tournament,
+        mutation=mutations,
+        wb=False,
+        executor=PopulationExecutor(lambda: env, seed=0),
+    )
+
+    assert len(pop) == len(population_on_policy)
+    assert len(pop_fitnesses) == 2
+    assert all(len(agent.scores) == 10 for agent in pop)
+
+
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_on_policy_evaluator(env, population_on_policy, tournament, mutations):
+    evaluator = PopulationEvaluator(lambda: env, seed=0)
+    pop, pop_fitnesses = train_on_policy(
+        env,
+        "env_name",
+        "algo",
+        population_on_policy,
+        n_episodes=10,
+        max_steps=5,
+        evo_epochs=5,
+        evo_loop=1,
+        tournament=tournament,
+        mutation=mutations,
+        wb=False,
+        evaluator=evaluator,
+    )
+
+    assert len(pop_fitnesses) == 2
+    assert len(evaluator.eval_times) == len(population_on_policy)
+
+
 @pytest.mark.parametrize("state_size, action_size, vect", [((250, 160, 3), 2, False)])
 def test_train_on_policy_rgb_input(env, population_on_policy, tournament, mutations):
     pop, pop_fitnesses = train_on_policy(
@@ -1814,6 +2318,93 @@ def test_train_multi_agent(
     assert len(pop) == len(population_multi_agent)
 
 
+@pytest.mark.parametrize("state_size, action_size", [((6,), 2)])
+def test_train_multi_agent_overlap(multi_env, multi_memory, tournament, mutations):
+    def step(action):
+        next_state, reward, done, truncation, info = DummyMultiEnv.step(
+            multi_env, action
+        )
+        done = {agent_id: 0 for agent_id in done}
+        truncation = {agent_id: 0 for agent_id in truncation}
+        return next_state, reward, done, truncation, info
+
+    multi_env.step = step
+    learn_calls = {}
+    for overlap in [False, True]:
+        population = [DummyMultiAgent(5, multi_env) for _ in range(6)]
+        learns = []
+        for agent in population:
+            agent.learn = lambda experiences: learns.append(experiences)
+
+        pop, pop_fitnesses = train_multi_agent(
+            multi_env,
+            "env_name",
+            "algo",
+            pop=population,
+            memory=multi_memory,
+            n_episodes=10,
+            max_steps=5,
+            evo_epochs=5,
+            evo_loop=1,
+            tournament=tournament,
+            mutation=mutations,
+            overlap=overlap,
+        )
+
+        assert len(pop) == len(population)
+        learn_calls[overlap] = len(learns)
+    assert learn_calls[True] == learn_calls[False] == 10 * 6 * 5
+
+
+@pytest.mark.parametrize("state_size, action_size", [((6,), 2)])
+def test_train_multi_agent_executor(
+    multi_env, population_multi_agent, multi_memory, tournament, mutations
+):
+    pop, pop_fitnesses = train_multi_agent(
+        multi_env,
+        "env_name",
+        "algo",
+        pop=population_multi_agent,
+        memory=multi_memory,
+        n_episodes=10,
+        max_steps=5,
+        evo_epochs=5,
+        evo_loop=1,
+        tournament=tournament,
+        mutation=mutations,
+        executor=PopulationExecutor(lambda: multi_env, seed=0),
+    )
+
+    assert len(pop) == len(population_multi_agent)
+    assert len(pop_fitnesses) == 2
+    assert all(len(agent.scores) == 10 for agent in pop)
+
+
+@pytest.mark.parametrize("state_size, action_size", [((6,), 2)])
+def test_train_multi_agent_evaluator(
+    multi_env, population_multi_agent, multi_memory, tournament, mutations
+):
+    evaluator = PopulationEvaluator(lambda: multi_env, backend="process", seed=0)
+    pop, pop_fitnesses = train_multi_agent(
+        multi_env,
+        "env_name",
+        "algo",
+        pop=population_multi_agent,
+        memory=multi_memory,
+        n_episodes=10,
+        max_steps=5,
+        evo_epochs=5,
+        evo_loop=1,
+        tournament=tournament,
+        mutation=mutations,
+        evaluator=evaluator,
+    )
+
+    assert len(pop_fitnesses) == 2
+    assert len(evaluator.eval_times) == len(population_multi_agent)
+    assert all(len(agent.fitness) == 2 for agent in pop)
+
+
 @pytest.mark.parametrize("state_size, action_size", [((6,), 2)])
 def test_train_multi_agent_distributed(
     multi_env, population_multi_agent, multi_memory, tournament, mutations
@@ -2262,6 +2853,72 @@ def test_train_offline(
         assert len(pop) == len(population_off_policy)
 
 
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_offline_executor(
+    env,
+    population_off_policy,
+    memory,
+    tournament,
+    mutations,
+    offline_init_hp,
+    dummy_h5py_data,
+):
+    pop, pop_fitnesses = train_offline(
+        env,
+        "env_name",
+        dummy_h5py_data,
+        "algo",
+        population_off_policy,
+        memory,
+        INIT_HP=offline_init_hp,
+        n_episodes=10,
+        max_steps=5,
+        evo_epochs=5,
+        evo_loop=1,
+        tournament=tournament,
+        mutation=mutations,
+        wb=False,
+        executor=PopulationExecutor(lambda: env, seed=0),
+    )
+
+    assert len(pop) == len(population_off_policy)
+    assert len(pop_fitnesses) == 2
+    assert all(agent.steps[-1] == 10 * 5 for agent in pop)
+
+
+@pytest.mark.parametrize("state_size, action_size, vect", [((6,), 2, True)])
+def test_train_offline_evaluator(
+    env,
+    population_off_policy,
+    memory,
+    tournament,
+    mutations,
+    offline_init_hp,
+    dummy_h5py_data,
+):
+    evaluator = PopulationEvaluator(lambda: env, num_workers=2, seed=0)
+    pop, pop_fitnesses = train_offline(
+        env,
+        "env_name",
+        dummy_h5py_data,
+        "algo",
+        population_off_policy,
+        memory,
+        INIT_HP=offline_init_hp,
+        n_episodes=10,
+        max_steps=5,
+        evo_epochs=5,
+        evo_loop=1,
+        tournament=tournament,
+        mutation=mutations,
+        wb=False,
+        evaluator=evaluator,
+    )
+
+    assert len(pop_fitnesses) == 2
+    assert len(evaluator.eval_times) == len(population_off_policy)
+
+
 @pytest.mark.parametrize(
     "state_size, action_size, vect",
     [
@@ -2484,10 +3141,124 @@ def test_offline_memory_calls(
             wb=False,
             accelerator=accelerator,
         )
-        mocked_memory.save2memory.assert_called()
+        mocked_memory.add_batch.assert_called()
         mocked_memory.sample.assert_called()
 
 
+def test_fill_memory_matches_per_transition_loop():
+    dataset = {
+        "observations": np.random.rand(10, 4, 4, 3),
+        "actions": np.random.randint(0, 2, 10),
+        "rewards": np.random.rand(10),
+        "terminals": np.random.rand(10) < 0.3,
+    }
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    memory = ReplayBuffer(1, 100, field_names, storage="array")
+    _fill_memory(dataset, memory, swap_channels=True, chunk_size=4)
+
+    expected = ReplayBuffer(1, 100, field_names, storage="array")
+    for i in range(9):
+        expected.save2memory(
+            np.moveaxis(dataset["observations"][i], [-1], [-3]),
+            dataset["actions"][i],
+            dataset["rewards"][i],
+            np.moveaxis(dataset["observations"][i + 1], [-1], [-3]),
+            bool(dataset["terminals"][i]),
+        )
+
+    assert len(memory) == 9
+    for field in field_names:
+        assert np.array_equal(
+            memory.memory.fields[field][:9], expected.memory.fields[field][:9]
+        )
+
+
+@pytest.mark.parametrize(
+    "state_size, action_size, vect",
+    [
+        ((6,), 2, True),
+    ],
+)
+def test_train_offline_hdf5_storage(
+    env,
+    population_off_policy,
+    tournament,
+    mutations,
+    offline_init_hp,
+    dummy_h5py_data,
+    tmpdir,
+):
+    path = os.path.join(tmpdir, "dataset.hdf5")
+    with h5py.File(path, "w") as f:
+        for key, value in dummy_h5py_data.items():
+            f.create_dataset(key, data=value)
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    memory = ReplayBuffer(2, 100, field_names, storage="hdf5")
+
+    with h5py.File(path, "r") as dataset:
+        pop, pop_fitnesses = train_offline(
+            env,
+            "env_name",
+            dataset,
+            "algo",
+            population_off_policy,
+            memory,
+            INIT_HP=offline_init_hp,
+            n_episodes=10,
+            max_steps=5,
+            evo_epochs=5,
+            evo_loop=1,
+            tournament=tournament,
+            mutation=mutations,
+            wb=False,
+            prefetch=2,
+        )
+
+    assert len(pop) == len(population_off_policy)
+    assert len(memory) == 9
+    states, actions, rewards, next_states, dones = memory.sample(4)
+    assert states.shape == next_states.shape == (4, 6)
+
+
+# HDF5 storage opened by the replay buffer keeps its swap_channels setting
+@pytest.mark.parametrize(
+    "state_size, action_size, vect",
+    [
+        ((6,), 2, True),
+    ],
+)
+def test_train_offline_hdf5_storage_swap_channels(
+    env, population_off_policy, offline_init_hp, tmpdir
+):
+    path = os.path.join(tmpdir, "dataset.hdf5")
+    with h5py.File(path, "w") as f:
+        f.create_dataset("observations", data=np.random.rand(11, 4, 4, 3))
+        f.create_dataset("actions", data=np.random.randint(0, 2, 10))
+        f.create_dataset("rewards", data=np.random.rand(10))
+        f.create_dataset("terminals", data=np.zeros(10, dtype=bool))
+    field_names = ["state", "action", "reward", "next_state", "done"]
+    memory = ReplayBuffer(
+        2, 100, field_names, storage="hdf5", dataset=path, swap_channels=True
+    )
+
+    states, actions, rewards, next_states, dones = memory.sample(4)
+    assert states.shape == next_states.shape == (4, 3, 4, 4)
+
+    # A different setting passed to train_offline is rejected
+    with pytest.raises(AssertionError):
+        train_offline(
+            env,
+            "env_name",
+            path,
+            "algo",
+            population_off_policy,
+            memory,
+            INIT_HP=offline_init_hp,
+            swap_channels=False,
+            wb=False,
+        )
+
+
 @pytest.mark.parametrize(
     "state_size, action_size, vect",
     [
@@ -3,6 +3,7 @@ from unittest.mock import patch
 
 import gymnasium as gym
 import numpy as np
+import pytest
 
 from agilerl.algorithms.cqn import CQN
 from agilerl.algorithms.ddpg import DDPG
@@ -19,6 +20,7 @@ from agilerl.utils.utils import (
     plotPopulationScore,
     printHyperparams,
 )
+from agilerl.utils.vector_envs import BatchedAsyncVectorEnv, worker_layout
 
 # Shared HP dict that can be used by any algorithm
 SHARED_INIT_HP = {
@@ -66,6 +68,83 @@ def test_returns_asyncvectorenv_object():
     assert env.num_envs == num_envs
 
 
+# Returns vectorized environments of each type for each mode
+@pytest.mark.parametrize(
+    "kwargs, env_type",
+    [
+        ({"mode": "sync"}, gym.vector.SyncVectorEnv),
+        ({"mode": "async", "shared_memory": False}, gym.vector.AsyncVectorEnv),
+        ({"mode": "async", "envs_per_worker": 2}, BatchedAsyncVectorEnv),
+        ({"mode": "async", "cpu_affinity": True}, BatchedAsyncVectorEnv),
+        ({"mode": "auto"}, gym.vector.VectorEnv),
+    ],
+)
+def test_make_vect_envs_modes(kwargs, env_type):
+    env = makeVectEnvs("CartPole-v1", num_envs=3, **kwargs)
+    assert isinstance(env, env_type)
+    assert env.num_envs == 3
+    state, info = env.reset(seed=0)
+    assert state.shape == (3, 4)
+    env.close()
+
+
+# Batched workers step environments exactly as synchronous vectorized environments do
+@pytest.mark.parametrize("shared_memory", [True, False])
+@pytest.mark.parametrize("cpu_affinity", [None, True])
+def test_batched_async_vector_env_matches_sync(shared_memory, cpu_affinity):
+    num_envs = 5
+    env_fns = [lambda: gym.make("CartPole-v1") for _ in range(num_envs)]
+    sync_env = gym.vector.SyncVectorEnv(env_fns)
+    batched_env = BatchedAsyncVectorEnv(
+        env_fns,
+        envs_per_worker=2,
+        shared_memory=shared_memory,
+        cpu_affinity=cpu_affinity,
+    )
+    assert len(batched_env.processes) == 3
+
+    sync_state, _ = sync_env.reset(seed=42)
+    batched_state, _ = batched_env.reset(seed=42)
+    assert np.array_equal(sync_state, batched_state)
+
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        action = rng.integers(0, 2, num_envs)
+        sync_result = sync_env.step(action)
+        batched_result = batched_env.step(action)
+        for sync_value, batched_value in zip(sync_result[:4], batched_result[:4]):
+            assert np.array_equal(sync_value, batched_value)
+        assert sync_result[4].keys() == batched_result[4].keys()
+        for key, value in sync_result[4].items():
+            if key.startswith("_"):
+                assert np.array_equal(value, batched_result[4][key])
+
+    batched_env.set_attr("test_attr", list(range(num_envs)))
+    assert batched_env.get_attr("test_attr") == list(range(num_envs))
+    sync_env.close()
+    batched_env.close()
+    assert batched_env.closed
+
+
+# Errors in batched workers are raised in the main process
+def test_batched_async_vector_env_raises_worker_errors():
+    env = BatchedAsyncVectorEnv(
+        [lambda: gym.make("CartPole-v1") for _ in range(4)], envs_per_worker=2
+    )
+    env.reset()
+    with pytest.raises(AttributeError):
+        env.call("missing_method")
+    assert env.closed
+
+
+# Auto mode steps cheap environments synchronously and batches expensive ones per core
+def test_worker_layout():
+    assert worker_layout(16, 1e-6, ipc_latency=1e-4, num_cpus=4) == ("sync", 16)
+    assert worker_layout(16, 1e-3, ipc_latency=1e-4, num_cpus=4) == ("async", 4)
+    assert worker_layout(16, 4e-5, ipc_latency=1e-4, num_cpus=8) == ("async", 3)
+    assert worker_layout(16, 1e-3, ipc_latency=1e-4, num_cpus=1) == ("sync", 16)
+
+
 # Can create a population of agent for each single agent algorithm
 def test_create_initial_population_single_agent():
     state_dim = [4]